@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures how long it takes to find the books matching a query through the
+# sorted index of book name suffixes, compared with the linear scan of every
+# book name which it replaced; run from the project root via:
+# python -m benchmarks.book_matching
+
+from __future__ import print_function, unicode_literals
+
+import timeit
+from operator import itemgetter
+
+import yvs.core as core
+import yvs.filter_refs as filter_refs
+
+# The number of times each query is matched
+NUM_ITERATIONS = 2000
+# The queries to match, from very broad to matching nothing at all
+QUERY_BOOKS = ('j', 'john', '1 cor', 'xyz')
+
+
+# Retrieves list of books matching the given query by checking every word
+# suffix of every book name (the matching used before book names were indexed)
+def get_matching_books_linear(bible, book_metadata, query):
+
+    matching_books = []
+    for b, book in enumerate(bible['books']):
+        book_name_words = filter_refs.split_book_name_into_parts(book['name'])
+        for w, book_word in enumerate(book_name_words):
+            if book_word.startswith(query['book']):
+                matching_books.append({
+                    'id': book['id'],
+                    'name': book['name'],
+                    'priority': ((w + 1) * 100) + b,
+                    'metadata': book_metadata[book['id']]
+                })
+                break
+
+    matching_books.sort(key=itemgetter('priority'))
+    return matching_books
+
+
+# Returns the mean time (in microseconds) taken by a single call to the given
+# function
+def time_call(func):
+
+    total_time = min(timeit.repeat(func, number=NUM_ITERATIONS, repeat=3))
+    return total_time / NUM_ITERATIONS * 1e6
+
+
+def main():
+
+    bible = core.get_bible('eng')
+    book_metadata = core.get_book_metadata()
+    for query_book in QUERY_BOOKS:
+        query = {'book': query_book}
+        # Both approaches must match the very same books
+        assert (get_matching_books_linear(bible, book_metadata, query) ==
+                filter_refs.get_matching_books(bible, book_metadata, query))
+        linear_time = time_call(lambda: get_matching_books_linear(
+            bible, book_metadata, query))
+        index_time = time_call(lambda: filter_refs.get_matching_books(
+            bible, book_metadata, query))
+        print('{:<8} linear {:>4.0f}us -> index {:>3.0f}us'.format(
+            "'{}'".format(query_book), linear_time, index_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures the latency of adding and reading cache entries (including reads of
+# entries which do not exist) once the cache is full, for caches of several
+# capacities; run from the project root via:
+# python -m benchmarks.cache_backend [--cache-module PATH] [CAPACITY ...]
+#
+# By default, the workflow's own cache module is measured; to measure the
+# file-based cache it replaced, extract that module first and pass its path:
+# git show aa19995:yvs/cache.py > /tmp/files_cache.py
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import imp
+import shutil
+import tempfile
+import time
+
+import yvs.cache as cache
+import yvs.core as core
+
+# The capacities (in entries) measured if none are given
+DEFAULT_CAPACITIES = (100, 10000, 100000)
+# The content of every entry (4 KB, roughly the size of a search result page)
+ENTRY_CONTENT = 'x' * 4096
+# The number of adds, reads and misses timed once the cache is full
+NUM_TIMED_OPERATIONS = 500
+# The maximum number of seconds spent filling the cache; slow backends may
+# therefore be measured with fewer entries than their capacity
+MAX_FILL_TIME = 120
+
+
+# Sets the capacity of the given cache module to the given number of entries
+def set_cache_capacity(cache_module, capacity):
+
+    if hasattr(cache_module, 'MAX_NUM_CACHE_ENTRIES'):
+        # The file-based cache is bounded by its number of entries
+        cache_module.MAX_NUM_CACHE_ENTRIES = capacity
+    else:
+        cache_module.get_max_cache_size = lambda: capacity * len(ENTRY_CONTENT)
+
+
+# Fills the cache until it holds the given number of entries (or the time
+# allowed for filling it runs out), returning the number of entries added
+def fill_cache(cache_module, capacity):
+
+    fill_start_time = time.time()
+    for entry_num in xrange(capacity):
+        cache_module.add_cache_entry(
+            'entry-{}'.format(entry_num), ENTRY_CONTENT)
+        if time.time() - fill_start_time > MAX_FILL_TIME:
+            return entry_num + 1
+    return capacity
+
+
+# Returns the mean time (in milliseconds) of calling the given function with
+# each of the given entry keys
+def time_operations(func, entry_keys):
+
+    start_time = time.time()
+    for entry_key in entry_keys:
+        func(entry_key)
+    return (time.time() - start_time) / len(entry_keys) * 1000
+
+
+# Measures the latency of adds, reads and misses for a cache of the given
+# capacity
+def measure_cache(cache_module, capacity):
+
+    temp_dir_path = tempfile.mkdtemp()
+    cache_module.LOCAL_CACHE_DIR_PATH = temp_dir_path
+    core.LOCAL_DATA_DIR_PATH = temp_dir_path
+    try:
+        set_cache_capacity(cache_module, capacity)
+        num_entries = fill_cache(cache_module, capacity)
+        add_time = time_operations(
+            lambda entry_key: cache_module.add_cache_entry(
+                entry_key, ENTRY_CONTENT),
+            ['new-entry-{}'.format(entry_num)
+             for entry_num in xrange(NUM_TIMED_OPERATIONS)])
+        # Read the most recently added entries, which are never evicted
+        get_time = time_operations(
+            cache_module.get_cache_entry_content,
+            ['new-entry-{}'.format(entry_num)
+             for entry_num in xrange(NUM_TIMED_OPERATIONS)])
+        miss_time = time_operations(
+            cache_module.get_cache_entry_content,
+            ['missing-entry-{}'.format(entry_num)
+             for entry_num in xrange(NUM_TIMED_OPERATIONS)])
+        return num_entries, add_time, get_time, miss_time
+    finally:
+        shutil.rmtree(temp_dir_path)
+
+
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(
+        description='Measure cache latency once the cache is full')
+    parser.add_argument(
+        'capacities', metavar='CAPACITY', type=int, nargs='*',
+        default=DEFAULT_CAPACITIES,
+        help='the number of entries the cache may hold')
+    parser.add_argument(
+        '--cache-module', metavar='PATH',
+        help='the path of another cache module to measure')
+    return parser.parse_args()
+
+
+def main():
+
+    cli_args = parse_cli_args()
+    if cli_args.cache_module:
+        cache_module = imp.load_source('other_cache', cli_args.cache_module)
+    else:
+        cache_module = cache
+    for capacity in cli_args.capacities:
+        num_entries, add_time, get_time, miss_time = measure_cache(
+            cache_module, capacity)
+        print('{:>7}  add {:.2f} ms  get {:.2f} ms  miss {:.2f} ms{}'.format(
+            capacity, add_time, get_time, miss_time,
+            '' if num_entries == capacity else
+            '  (only {} entries added within {} s)'.format(
+                num_entries, MAX_FILL_TIME)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Simulates the hit ratio of several cache eviction policies for requests to
+# chapters whose popularity follows a Zipf distribution; run from the project
+# root via: python -m benchmarks.cache_hit_ratio
+#
+# The caches are simulated in memory (every entry counting as the same size),
+# so the eviction policies can be compared over many requests; the workflow's
+# own policy is simulated using the same rule as yvs.cache
+
+from __future__ import print_function, unicode_literals
+
+import bisect
+import heapq
+import random
+from collections import OrderedDict
+
+import yvs.cache as cache
+
+# The number of chapters which may be requested (every chapter of the Bible)
+NUM_CHAPTERS = 1189
+# The number of requests simulated for each combination of parameters
+NUM_REQUESTS = 200000
+# The skews of the Zipf distributions from which requests are drawn
+ZIPF_SKEWS = (0.8, 1.0, 1.2)
+# The capacities (in entries) of the simulated caches
+CAPACITIES = (100, 500)
+
+
+# A cache which evicts the oldest entry, regardless of how it is used
+class FIFOCache(object):
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        return key in self.entries
+
+    def add(self, key):
+        self.entries[key] = True
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+
+# A cache which evicts the least recently used entry
+class LRUCache(FIFOCache):
+
+    def get(self, key):
+        if key not in self.entries:
+            return False
+        del self.entries[key]
+        self.entries[key] = True
+        return True
+
+
+# A cache which evicts the least recently used entry, except that reading an
+# entry which is already among the most recently used entries does not mark it
+# as used (as done by yvs.cache, so that most reads need no write)
+class ApproximateLRUCache(object):
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.num_accesses = 0
+        self.num_hits_written = 0
+        self.last_accesses = {}
+        # Entries ordered by last access; entries which have since been used
+        # again are only removed once they reach the front of the heap
+        self.access_heap = []
+
+    def touch(self, key):
+        self.num_accesses += 1
+        self.last_accesses[key] = self.num_accesses
+        heapq.heappush(self.access_heap, (self.num_accesses, key))
+
+    def get(self, key):
+        if key not in self.last_accesses:
+            return False
+        if (self.num_accesses - self.last_accesses[key] >=
+                len(self.last_accesses) * cache.RECENT_CACHE_ENTRY_FRACTION):
+            self.touch(key)
+            self.num_hits_written += 1
+        return True
+
+    def add(self, key):
+        self.touch(key)
+        while len(self.last_accesses) > self.capacity:
+            last_access, old_key = heapq.heappop(self.access_heap)
+            if self.last_accesses.get(old_key) == last_access:
+                del self.last_accesses[old_key]
+
+
+# Generates the given number of chapter requests drawn from a Zipf
+# distribution with the given skew
+def get_requests(skew, num_requests, rng):
+
+    cumulative_weights = []
+    total_weight = 0
+    for rank in range(1, NUM_CHAPTERS + 1):
+        total_weight += 1.0 / rank ** skew
+        cumulative_weights.append(total_weight)
+    return [bisect.bisect(cumulative_weights, rng.random() * total_weight)
+            for i in xrange(num_requests)]
+
+
+# Returns the fraction of the given requests which the given cache serves
+def get_hit_ratio(cache_sim, requests):
+
+    num_hits = 0
+    for key in requests:
+        if cache_sim.get(key):
+            num_hits += 1
+        else:
+            cache_sim.add(key)
+    return float(num_hits) / len(requests)
+
+
+def main():
+
+    print('skew  capacity  FIFO    LRU     workflow  (hits written)')
+    for skew in ZIPF_SKEWS:
+        requests = get_requests(skew, NUM_REQUESTS, random.Random(531))
+        for capacity in CAPACITIES:
+            workflow_cache_sim = ApproximateLRUCache(capacity)
+            workflow_hit_ratio = get_hit_ratio(workflow_cache_sim, requests)
+            print('{:<4}  {:<8}  {:.1%}   {:.1%}   {:.1%}     ({:.1%})'.format(
+                skew, capacity,
+                get_hit_ratio(FIFOCache(capacity), requests),
+                get_hit_ratio(LRUCache(capacity), requests),
+                workflow_hit_ratio,
+                float(workflow_cache_sim.num_hits_written) /
+                (workflow_hit_ratio * len(requests))))
+
+
+if __name__ == '__main__':
+    main()
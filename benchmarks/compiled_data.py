@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures how long a cold load of a Bible data file takes when parsing its
+# JSON versus loading its compiled snapshot; run from the project root via:
+# python -m benchmarks.compiled_data
+
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+import os.path
+import shutil
+import tempfile
+import timeit
+
+import yvs.compile_data as compile_data
+import yvs.core as core
+
+# The number of loads to time for each data file
+NUM_LOADS = 2000
+# The approximate size (in bytes) of the synthetic Bible data file, which
+# stands in for the largest language files
+SYNTHETIC_BIBLE_SIZE = 44 * 1024
+
+
+# Writes a Bible data file of roughly the given size (by repeating the
+# versions of the English Bible) to the given directory
+def write_synthetic_bible(dir_path, size):
+
+    with open(core.get_bible_data_path('bible-eng.json'), 'r') as bible_file:
+        bible = json.load(bible_file)
+    versions = bible['versions']
+    while len(json.dumps(bible)) < size:
+        bible['versions'] = bible['versions'] + versions
+    bible_path = os.path.join(dir_path, 'bible-synthetic.json')
+    with open(bible_path, 'w') as bible_file:
+        json.dump(bible, bible_file)
+    return bible_path
+
+
+# Returns the mean time (in microseconds) taken by a single call to the given
+# function
+def time_call(func):
+
+    total_time = min(timeit.repeat(func, number=NUM_LOADS, repeat=3))
+    return total_time / NUM_LOADS * 1e6
+
+
+# Loads the given data file by parsing its JSON
+def load_json(data_path):
+
+    with open(data_path, 'r') as data_file:
+        return json.load(data_file)
+
+
+def main():
+
+    temp_dir_path = tempfile.mkdtemp()
+    core.COMPILED_DATA_DIR_PATH = os.path.join(temp_dir_path, 'compiled')
+    try:
+        data_paths = [core.get_bible_data_path('bible-eng.json'),
+                      write_synthetic_bible(
+                          temp_dir_path, SYNTHETIC_BIBLE_SIZE)]
+        os.mkdir(core.COMPILED_DATA_DIR_PATH)
+        for data_path in data_paths:
+            compile_data.compile_data_file(data_path)
+            json_time = time_call(lambda: load_json(data_path))
+            snapshot_time = time_call(
+                lambda: core.load_compiled_data(data_path))
+            print('{:<22} {:>3} KB  json.load {:>6.0f}us -> snapshot'
+                  ' {:>5.0f}us  ({:.1f}x)'.format(
+                      os.path.basename(data_path),
+                      os.path.getsize(data_path) // 1024,
+                      json_time, snapshot_time, json_time / snapshot_time))
+    finally:
+        shutil.rmtree(temp_dir_path)
+
+
+if __name__ == '__main__':
+    main()
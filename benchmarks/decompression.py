@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures the peak memory needed to download and decompress a large chapter
+# page served gzipped or deflated by a local HTTP server, comparing consuming
+# web.get_url_content_chunks with the old approach of reading the whole body
+# before decompressing and decoding it; each approach runs in a forked process
+# so that its peak memory is measured independently; run from the project root
+# via: python -m benchmarks.decompression [--size MB]
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import BaseHTTPServer
+import os
+import resource
+import sys
+import threading
+import traceback
+import zlib
+
+import yvs.cache as cache
+import yvs.web as web
+
+# The chapter page repeated to form the body served by the local server
+PAGE_PATH = 'tests/html/psa.23.html'
+# The decompressed size (in megabytes) of the served body if no size is given
+DEFAULT_BODY_SIZE = 16
+# The zlib window bits value used to compress a body with each content encoding
+CONTENT_ENCODING_WBITS = {
+    'gzip': cache.GZIP_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+
+# Serves the compressed bodies held by the server, keyed by content encoding
+# (e.g. /gzip)
+class CompressedBodyHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        content_encoding = self.path.lstrip('/')
+        body = self.server.bodies[content_encoding]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Encoding', content_encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Compresses the chapter page repeatedly until its decompressed size reaches
+# the given number of bytes; the decompressed body is never held in memory
+def compress_body(content_encoding, body_size):
+
+    with open(PAGE_PATH, 'rb') as page_file:
+        page = page_file.read()
+    compressor = zlib.compressobj(
+        9, zlib.DEFLATED, CONTENT_ENCODING_WBITS[content_encoding])
+    body_chunks = []
+    for page_num in xrange(body_size // len(page) + 1):
+        body_chunks.append(compressor.compress(page))
+    body_chunks.append(compressor.flush())
+    return b''.join(body_chunks)
+
+
+# Starts a local HTTP server in a background thread which serves the given
+# compressed bodies, returning the base URL of the server
+def start_server(bodies):
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), CompressedBodyHandler)
+    server.bodies = bodies
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    return 'http://127.0.0.1:{}'.format(server.server_port)
+
+
+# Downloads the given URL by consuming its content chunks as they arrive
+def stream_url_content(url):
+
+    for url_content_chunk in web.get_url_content_chunks(url):
+        pass
+
+
+# Downloads the given URL the way the workflow did before content was
+# streamed: the whole raw body is read, then decompressed and decoded at once
+def buffer_url_content(url):
+
+    url_body, content_encoding = web.get_url_body(url)
+    zlib.decompress(
+        url_body, CONTENT_ENCODING_WBITS[content_encoding]).decode('utf-8')
+
+
+# Retrieves the peak memory (in megabytes) used by this process so far
+def get_max_rss():
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # The peak is reported in bytes on macOS, but in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return max_rss / 1024.0 / 1024.0
+    else:
+        return max_rss / 1024.0
+
+
+# Returns how much (in megabytes) calling the given function with the given URL
+# raises the peak memory of a freshly forked process
+def measure_peak_memory(func, url):
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        exit_status = 1
+        try:
+            os.close(read_fd)
+            start_max_rss = get_max_rss()
+            func(url)
+            os.write(write_fd, repr(get_max_rss() - start_max_rss))
+            exit_status = 0
+        except Exception:
+            traceback.print_exc()
+        finally:
+            os._exit(exit_status)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'r') as read_file:
+        peak_memory = read_file.read()
+    os.waitpid(pid, 0)
+    if not peak_memory:
+        raise RuntimeError('Failed to download {}'.format(url))
+    return float(peak_memory)
+
+
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(
+        description='Measure the peak memory needed to download a large'
+                    ' compressed page')
+    parser.add_argument(
+        '--size', type=int, default=DEFAULT_BODY_SIZE,
+        help='the decompressed size (in megabytes) of the served page')
+    return parser.parse_args()
+
+
+def main():
+
+    cli_args = parse_cli_args()
+    body_size = cli_args.size * 1024 * 1024
+    bodies = {content_encoding: compress_body(content_encoding, body_size)
+              for content_encoding in CONTENT_ENCODING_WBITS}
+    base_url = start_server(bodies)
+    # Requests to the local server must never be sent through a proxy
+    web.proxies = {}
+    for content_encoding in sorted(bodies):
+        url = '{}/{}'.format(base_url, content_encoding)
+        print('{} ({:.0f} KB compressed, {} MB decompressed):'.format(
+            content_encoding, len(bodies[content_encoding]) / 1024.0,
+            cli_args.size))
+        print('  {:<28} +{:.1f} MB'.format(
+            'buffered (read, decompress)',
+            measure_peak_memory(buffer_url_content, url)))
+        print('  {:<28} +{:.1f} MB'.format(
+            'get_url_content_chunks',
+            measure_peak_memory(stream_url_content, url)))
+
+
+if __name__ == '__main__':
+    main()
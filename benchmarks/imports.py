@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures how long each of the workflow's entry points takes to start (i.e.
+# to launch a fresh interpreter and import the entry point's module), compared
+# with launching an interpreter which imports nothing; run from the project
+# root via: python -m benchmarks.imports [--runs N]
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import subprocess
+import sys
+import time
+
+# The entry points whose start-up times are measured
+ENTRY_POINTS = ('filter_refs', 'filter_prefs', 'search_refs', 'copy_ref',
+                'set_pref', 'clear_cache', 'client')
+# The number of times each command is run if no number is given (the fastest
+# run is reported, since slower runs only measure noise)
+DEFAULT_NUM_RUNS = 20
+
+
+# Returns the fastest time (in milliseconds) taken to run the given Python
+# code within a fresh interpreter
+def time_python_code(code, num_runs):
+
+    run_times = []
+    for run_num in xrange(num_runs):
+        start_time = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        run_times.append(time.time() - start_time)
+    return min(run_times) * 1000
+
+
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(
+        description='Measure the start-up time of every entry point')
+    parser.add_argument(
+        '--runs', type=int, default=DEFAULT_NUM_RUNS,
+        help='the number of times to run each command')
+    return parser.parse_args()
+
+
+def main():
+
+    cli_args = parse_cli_args()
+    baseline_time = time_python_code('pass', cli_args.runs)
+    print('{:<16} {:>6.1f} ms'.format('python -c pass', baseline_time))
+    for entry_point in ENTRY_POINTS:
+        import_time = time_python_code(
+            'import yvs.{}'.format(entry_point), cli_args.runs)
+        print('{:<16} {:>6.1f} ms  (+{:.1f} ms)'.format(
+            entry_point, import_time, import_time - baseline_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures how long it takes to look up a book or version by its ID through the
+# indexes built when a bible is loaded, compared with the linear scans they
+# replaced; run from the project root via: python -m benchmarks.lookups
+
+from __future__ import print_function, unicode_literals
+
+import glob
+import os.path
+import re
+import timeit
+
+import yvs.core as core
+
+# The number of times every book and version of a language is looked up
+NUM_ITERATIONS = 2000
+# Pattern matching the file name of a bundled bible (e.g. bible-eng.json)
+BIBLE_FILE_PATT = re.compile(r'^bible-(\w+)\.json$')
+
+
+# Retrieves name of first book whose id matches the given id by scanning every
+# book (the lookup used before bibles were indexed)
+def get_book_linear(books, book_id):
+
+    for book in books:
+        if book['id'] == book_id:
+            return book['name']
+
+
+# Retrieves first version object whose id matches the given id by scanning
+# every version (the lookup used before bibles were indexed)
+def get_version_linear(versions, version_id):
+
+    for version in versions:
+        if version['id'] == version_id:
+            return version
+
+
+# Looks up every book and version of the given bible by scanning
+def look_up_all_linear(bible):
+
+    for book in bible['books']:
+        get_book_linear(bible['books'], book['id'])
+    for version in bible['versions']:
+        get_version_linear(bible['versions'], version['id'])
+
+
+# Looks up every book and version of the given bible through its indexes
+def look_up_all_indexed(bible):
+
+    for book in bible['books']:
+        core.get_book(bible, book['id'])
+    for version in bible['versions']:
+        core.get_version(bible, version['id'])
+
+
+# Returns the mean time (in microseconds) of each lookup made by the given
+# function
+def time_lookups(func, bible):
+
+    num_lookups = len(bible['books']) + len(bible['versions'])
+    total_time = min(timeit.repeat(
+        lambda: func(bible), number=NUM_ITERATIONS, repeat=3))
+    return total_time / NUM_ITERATIONS / num_lookups * 1e6
+
+
+def main():
+
+    for bible_path in sorted(glob.glob(core.get_bible_data_path('*.json'))):
+        bible_match = BIBLE_FILE_PATT.search(os.path.basename(bible_path))
+        if not bible_match:
+            continue
+        language_id = bible_match.group(1)
+        bible = core.get_bible(language_id)
+        print('{:<7} {:>2} books, {:>2} versions:  linear {:.2f}us,'
+              ' indexed {:.2f}us'.format(
+                  language_id, len(bible['books']),
+                  len(bible['versions']),
+                  time_lookups(look_up_all_linear, bible),
+                  time_lookups(look_up_all_indexed, bible)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures the throughput of the reference tokenizer compared with the
+# regular expression which it replaced, over the normalized queries exercised
+# by the filter_refs tests; run from the project root via:
+# python -m benchmarks.ref_match
+
+from __future__ import print_function, unicode_literals
+
+import imp
+import timeit
+
+import yvs.filter_refs as filter_refs
+
+# The filter_refs tests are not a package, so the module holding the test
+# queries and the original regular expression is loaded by its path
+test_ref_match = imp.load_source(
+    'test_ref_match', 'tests/test_filter_refs/test_ref_match.py')
+
+# The number of times every query is matched
+NUM_ITERATIONS = 2000
+
+
+# Matches every given query with the given function
+def match_all(get_ref_match, query_strs):
+
+    for query_str in query_strs:
+        get_ref_match(query_str)
+
+
+# Returns the number of queries the given function matches per second
+def get_queries_per_sec(get_ref_match, query_strs):
+
+    total_time = min(timeit.repeat(
+        lambda: match_all(get_ref_match, query_strs),
+        number=NUM_ITERATIONS, repeat=7))
+    return len(query_strs) * NUM_ITERATIONS / total_time
+
+
+def main():
+
+    query_strs = [filter_refs.normalize_query_str(query_str)
+                  for query_str in test_ref_match.TEST_QUERY_STRS]
+    print('regex {:.0f}k queries/s, tokenizer {:.0f}k queries/s'.format(
+        get_queries_per_sec(
+            test_ref_match.get_ref_match_regex, query_strs) / 1000,
+        get_queries_per_sec(filter_refs.get_ref_match, query_strs) / 1000))
+
+
+if __name__ == '__main__':
+    main()
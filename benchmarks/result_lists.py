@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures the throughput of resolving a batch of generated queries with
+# get_result_lists compared with calling get_result_list for each query; run
+# from the project root via: python -m benchmarks.result_lists [NUM_QUERIES]
+
+from __future__ import print_function, unicode_literals
+
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import yvs.core as core
+import yvs.filter_refs as filter_refs
+
+# The number of queries to generate if no number is given
+DEFAULT_NUM_QUERIES = 100000
+# The version names which may be appended to generated queries
+QUERY_VERSIONS = ('', '', ' esv', ' nlt', ' n', ' xyz')
+
+
+# Generates the given number of queries for books of the given bible, such as
+# "jo 3:16 esv" or "1 cor 13"
+def get_generated_queries(bible, num_queries):
+
+    query_random = random.Random(531)
+    book_names = [book['name'].lower() for book in bible['books']]
+    query_strs = []
+    for i in xrange(num_queries):
+        book_name = query_random.choice(book_names)
+        query_str = book_name[:query_random.randint(1, len(book_name))]
+        if query_random.random() < 0.8:
+            query_str += ' {}'.format(query_random.randint(1, 30))
+            if query_random.random() < 0.6:
+                query_str += ':{}'.format(query_random.randint(1, 30))
+        query_str += query_random.choice(QUERY_VERSIONS)
+        query_strs.append(query_str)
+    return query_strs
+
+
+# Returns the time (in seconds) taken by a single call to the given function
+def time_call(func):
+
+    start_time = time.time()
+    func()
+    return time.time() - start_time
+
+
+def main(num_queries=DEFAULT_NUM_QUERIES):
+
+    # The user preferences created by filter_refs must not touch the real
+    # workflow data
+    temp_dir_path = tempfile.mkdtemp()
+    core.LOCAL_DATA_DIR_PATH = temp_dir_path
+    try:
+        query_strs = get_generated_queries(core.get_bible('eng'), num_queries)
+        batch_time = time_call(
+            lambda: filter_refs.get_result_lists(query_strs))
+        single_time = time_call(lambda: [
+            filter_refs.get_result_list(query_str)
+            for query_str in query_strs])
+        print('get_result_lists           {:.2f}s  ({:.1f}k queries/s)'.format(
+            batch_time, num_queries / batch_time / 1000))
+        print('get_result_list per query  {:.2f}s  ({:.1f}k queries/s)'.format(
+            single_time, num_queries / single_time / 1000))
+    finally:
+        shutil.rmtree(temp_dir_path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Measures how long a script filter takes to produce its results when run
+# directly, compared with running it through yvs.client both while the
+# resident server is running and while it is not (in which case the client
+# runs the script filter itself); every command runs with a temporary home
+# directory, so that the user's own data is left untouched; run from the
+# project root via: python -m benchmarks.server [--runs N] [query]
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yvs.client as client
+import yvs.server as server
+
+# The query passed to the script filter if no query is given
+DEFAULT_QUERY = 'john 3.16'
+# The number of times each command is run if no number is given (the fastest
+# run is reported, since slower runs only measure noise)
+DEFAULT_NUM_RUNS = 20
+# The number of seconds to wait for the resident server to start listening
+SERVER_START_TIMEOUT = 10
+
+
+# Returns the fastest time (in milliseconds) taken to run the given command
+def time_command(command, env, num_runs):
+
+    run_times = []
+    with open(os.devnull, 'w') as devnull:
+        for run_num in xrange(num_runs):
+            start_time = time.time()
+            subprocess.check_call(command, env=env, stdout=devnull)
+            run_times.append(time.time() - start_time)
+    return min(run_times) * 1000
+
+
+# Starts the resident server in the background, waiting until it listens on
+# its socket
+def start_server(env):
+
+    server_process = subprocess.Popen(
+        [sys.executable, '-m', 'yvs.server'], env=env)
+    start_time = time.time()
+    while not server.is_server_running():
+        if time.time() - start_time > SERVER_START_TIMEOUT:
+            stop_server(server_process)
+            raise RuntimeError('The resident server failed to start')
+        time.sleep(0.05)
+    return server_process
+
+
+# Stops the given resident server process, removing the socket it leaves
+# behind (since a terminated server cannot remove the socket itself)
+def stop_server(server_process):
+
+    server_process.terminate()
+    server_process.wait()
+    try:
+        os.remove(client.SERVER_SOCKET_PATH)
+    except OSError:
+        pass
+
+
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(
+        description='Compare script filter run times with and without the'
+                    ' resident server')
+    parser.add_argument(
+        'query', nargs='?', default=DEFAULT_QUERY,
+        help='the query passed to filter_refs')
+    parser.add_argument(
+        '--runs', type=int, default=DEFAULT_NUM_RUNS,
+        help='the number of times to run each command')
+    return parser.parse_args()
+
+
+def main():
+
+    cli_args = parse_cli_args()
+    if server.is_server_running():
+        sys.exit('Stop the running resident server before benchmarking')
+
+    home_dir_path = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home_dir_path)
+    direct_command = [sys.executable, '-m', 'yvs.filter_refs', cli_args.query]
+    client_command = [sys.executable, '-m', 'yvs.client', 'filter_refs',
+                      cli_args.query]
+    try:
+        # Compile the workflow's data once, so that no run is charged for it
+        time_command(direct_command, env, num_runs=1)
+        print('{:<28} {:>6.1f} ms'.format(
+            'filter_refs', time_command(direct_command, env, cli_args.runs)))
+        print('{:<28} {:>6.1f} ms'.format(
+            'client (server not running)',
+            time_command(client_command, env, cli_args.runs)))
+        server_process = start_server(env)
+        try:
+            print('{:<28} {:>6.1f} ms'.format(
+                'client (server running)',
+                time_command(client_command, env, cli_args.runs)))
+        finally:
+            stop_server(server_process)
+    finally:
+        shutil.rmtree(home_dir_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,9 +18,13 @@
 local_cache_dir_patcher = patch(
     'yvs.cache.LOCAL_CACHE_DIR_PATH',
     os.path.join(temp_dir, 'yvs-cache'))
+compiled_data_dir_patcher = patch(
+    'yvs.core.COMPILED_DATA_DIR_PATH',
+    os.path.join(temp_dir, 'yvs-compiled'))
 
 
 def set_up():
+    core.loaded_data_files.clear()
     local_data_dir_patcher.start()
     try:
         os.mkdir(core.LOCAL_DATA_DIR_PATH)
@@ -31,13 +35,21 @@ def set_up():
         os.mkdir(cache.LOCAL_CACHE_DIR_PATH)
     except OSError:
         pass
+    compiled_data_dir_patcher.start()
 
 
 def tear_down():
+    try:
+        shutil.rmtree(core.COMPILED_DATA_DIR_PATH)
+    except OSError:
+        pass
+    compiled_data_dir_patcher.stop()
     try:
         shutil.rmtree(cache.LOCAL_CACHE_DIR_PATH)
     except OSError:
         pass
+    for tombstone_path in cache.get_cache_tombstone_paths():
+        shutil.rmtree(tombstone_path, ignore_errors=True)
     local_cache_dir_patcher.stop()
     try:
         shutil.rmtree(core.LOCAL_DATA_DIR_PATH)
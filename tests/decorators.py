@@ -7,6 +7,8 @@
 
 from mock import patch
 
+import yvs.core as core
+
 
 def redirect_stdout(func):
     """temporarily redirect stdout to new output stream"""
@@ -27,7 +29,11 @@ def use_user_prefs(user_prefs):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            with patch('yvs.core.get_user_prefs', return_value=user_prefs):
+            # Any preferences not given assume their default values, just as
+            # they would for a real user preferences file
+            with patch('yvs.core.get_user_prefs',
+                       return_value=core.extend_user_prefs(
+                           dict(user_prefs), core.get_default_user_prefs())):
                 return func(*args, **kwargs)
         return wrapper
     return decorator
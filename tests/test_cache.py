@@ -3,39 +3,501 @@
 
 from __future__ import unicode_literals
 
-import hashlib
+import multiprocessing
 import os
 import os.path
+import random
+import sqlite3
+import struct
+import traceback
+import zlib
 
 import nose.tools as nose
+from mock import Mock, call, patch
 
 import yvs.cache as cache
+import yvs.core as core
 from tests import set_up, tear_down
-from tests.decorators import redirect_stdout
+
+
+# Performs random cache operations (including clearing the cache) as quickly
+# as possible, returning the last line of any exception raised; run by many
+# processes at once, which must be forked while start_background_process is
+# patched, so that clearing the cache never starts a real reaper process
+def hammer_cache(seed):
+    rng = random.Random(seed)
+    try:
+        for i in range(100):
+            entry_key = 'key{}'.format(rng.randrange(30))
+            op = rng.random()
+            if op < 0.5:
+                cache.add_cache_entry(
+                    entry_key, 'x' * rng.randrange(1, 200),
+                    ttl=rng.choice([None, 0]))
+            elif op < 0.9:
+                cache.get_cache_entry(entry_key)
+            elif op < 0.98:
+                cache.claim_expired_cache_entry(entry_key, 0)
+            else:
+                cache.clear_cache()
+    except Exception:
+        return traceback.format_exc().splitlines()[-1]
+
+
+# Misses the cache repeatedly while regularly adding entries (which flushes the
+# pending counters), so that misses are recorded while others are flushed
+def miss_cache(seed):
+    for i in range(100):
+        cache.get_cache_entry('missing')
+        if i % 10 == 0:
+            cache.add_cache_entry('key{}'.format(seed), 'blah blah')
+
+
+def clear_cache_when_set(event):
+    event.wait(5)
+    cache.clear_cache()
+
+
+def get_entry_keys():
+    connection = cache.get_cache_connection()
+    try:
+        return [row[0] for row in connection.execute(
+            'SELECT key FROM entries ORDER BY last_access')]
+    finally:
+        connection.close()
+
+
+def get_total_size():
+    connection = cache.get_cache_connection()
+    try:
+        return connection.execute(
+            'SELECT total_size FROM totals').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def get_num_accesses():
+    connection = cache.get_cache_connection()
+    try:
+        return connection.execute(
+            'SELECT num_accesses FROM totals').fetchone()[0]
+    finally:
+        connection.close()
+
+
+# Retrieves the database's file change counter, which is incremented by every
+# write transaction
+def get_db_change_counter():
+    with open(cache.get_cache_db_path(), 'rb') as db_file:
+        db_file.seek(24)
+        return struct.unpack('>I', db_file.read(4))[0]
+
+
+def get_totals_counters():
+    connection = cache.get_cache_connection()
+    try:
+        return connection.execute(
+            'SELECT num_hits, num_misses, num_bytes_served FROM totals'
+        ).fetchone()
+    finally:
+        connection.close()
+
+
+def get_num_entries():
+    connection = cache.get_cache_connection()
+    try:
+        return connection.execute(
+            'SELECT num_entries FROM totals').fetchone()[0]
+    finally:
+        connection.close()
 
 
 @nose.with_setup(set_up, tear_down)
-@redirect_stdout
-def test_cache_housekeeping(out):
+@patch('yvs.cache.get_max_cache_size', return_value=100)
+def test_cache_housekeeping(get_max_cache_size):
     """should purge oldest entry when cache grows too large"""
     entry_key = 'a'
-    num_entries = cache.MAX_NUM_CACHE_ENTRIES + 2
-    purged_entry_checksum = hashlib.sha1(('a' * 1).encode('utf-8')).hexdigest()
-    last_entry_checksum = hashlib.sha1(
-        ('a' * num_entries).encode('utf-8')).hexdigest()
     nose.assert_false(
-        os.path.exists(cache.get_cache_entry_dir_path()),
-        'local cache entry directory exists')
-    for i in range(num_entries):
-        cache.add_cache_entry(entry_key, 'blah blah')
+        os.path.exists(cache.get_cache_db_path()),
+        'cache database exists')
+    for i in range(12):
+        cache.add_cache_entry(entry_key, 'x' * 10)
         entry_key += 'a'
-    entry_checksums = os.listdir(cache.get_cache_entry_dir_path())
-    nose.assert_equal(len(entry_checksums), cache.MAX_NUM_CACHE_ENTRIES)
-    nose.assert_not_in(purged_entry_checksum, entry_checksums)
-    nose.assert_in(last_entry_checksum, entry_checksums)
-    with open(cache.get_cache_manifest_path(), 'r') as manifest_file:
-        entry_checksums = manifest_file.read().splitlines()
+    entry_keys = get_entry_keys()
+    nose.assert_equal(len(entry_keys), 10)
+    nose.assert_equal(get_num_entries(), 10)
+    nose.assert_equal(get_total_size(), 100)
+    nose.assert_not_in('a', entry_keys)
+    nose.assert_not_in('aa', entry_keys)
+    nose.assert_in('a' * 12, entry_keys)
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.cache.get_max_cache_size', return_value=100)
+def test_cache_housekeeping_lru(get_max_cache_size):
+    """should purge least recently used entry rather than oldest entry"""
+    for i in range(10):
+        cache.add_cache_entry('key{}'.format(i), 'x' * 10)
+    cache.get_cache_entry_content('key0')
+    cache.add_cache_entry('new', 'x' * 10)
+    entry_keys = get_entry_keys()
+    nose.assert_equal(len(entry_keys), 10)
+    nose.assert_not_in('key1', entry_keys)
+    nose.assert_equal(entry_keys[-2:], ['key0', 'new'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_cache_housekeeping_recent_entry():
+    """should not mark entry as used if it was recently used already"""
+    for i in range(10):
+        cache.add_cache_entry('key{}'.format(i), 'x' * 10)
+    cache.get_cache_entry_content('key6')
+    nose.assert_equal(get_num_accesses(), 10)
+    cache.get_cache_entry_content('key2')
+    nose.assert_equal(get_num_accesses(), 11)
+    nose.assert_equal(get_entry_keys()[-2:], ['key9', 'key2'])
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.cache.get_max_cache_size', return_value=100)
+def test_cache_housekeeping_approximate_lru(get_max_cache_size):
+    """should evict recently read entry in order it was last marked used"""
+    for i in range(10):
+        cache.add_cache_entry('key{}'.format(i), 'x' * 10)
+    cache.get_cache_entry_content('key6')
+    cache.get_cache_entry_content('key2')
+    for i in range(10, 16):
+        cache.add_cache_entry('key{}'.format(i), 'x' * 10)
+    # Strict LRU would have evicted key7 rather than key6, since key6 was read
+    # after key7 was added
+    nose.assert_equal(get_entry_keys(), [
+        'key7', 'key8', 'key9', 'key2',
+        'key10', 'key11', 'key12', 'key13', 'key14', 'key15'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_cache_entry_read_only():
+    """should not write to database when reading recent or missing entry"""
+    cache.add_cache_entry('foo', 'blah blah')
+    db_change_counter = get_db_change_counter()
+    cache.get_cache_entry_content('foo')
+    cache.get_cache_entry_content('bar')
+    nose.assert_equal(get_db_change_counter(), db_change_counter)
+    stats = cache.get_cache_stats()
+    nose.assert_equal(
+        (stats['num_hits'], stats['num_misses'], stats['num_bytes_served']),
+        (1, 1, 9))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_flush_pending_cache_counters():
+    """should add pending hits and misses to totals when adding entry"""
+    cache.add_cache_entry('foo', 'blah blah')
+    cache.get_cache_entry_content('foo')
+    cache.get_cache_entry_content('bar')
+    nose.assert_equal(get_totals_counters(), (0, 0, 0))
+    cache.add_cache_entry('baz', 'blah')
+    nose.assert_equal(get_totals_counters(), (1, 1, 9))
+    nose.assert_equal(
+        os.path.getsize(cache.get_pending_cache_counters_path()), 0)
+    stats = cache.get_cache_stats()
+    nose.assert_equal(
+        (stats['num_hits'], stats['num_misses'], stats['num_bytes_served']),
+        (1, 1, 9))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_read_pending_cache_counters_incomplete_line():
+    """should ignore incomplete lines in pending counters file"""
+    cache.create_local_cache_dirs()
+    with open(cache.get_pending_cache_counters_path(), 'w') as counters_file:
+        counters_file.write('1 0 9\n0 1 0\n1 0')
+    with open(cache.get_pending_cache_counters_path(), 'r') as counters_file:
+        nose.assert_equal(
+            cache.read_pending_cache_counters(counters_file),
+            {'num_hits': 1, 'num_misses': 1, 'num_bytes_served': 9})
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.cache.get_max_cache_size', return_value=2000)
+def test_concurrent_pending_cache_counters(get_max_cache_size):
+    """should not lose counter increments recorded while flushing"""
+    pool = multiprocessing.Pool(8)
+    try:
+        pool.map(miss_cache, range(16))
+    finally:
+        pool.terminate()
+    nose.assert_equal(cache.get_cache_stats()['num_misses'], 1600)
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.cache.get_max_cache_size', return_value=100)
+def test_cache_housekeeping_large_entry(get_max_cache_size):
+    """should purge as many entries as needed to fit a large entry"""
+    for i in range(10):
+        cache.add_cache_entry('key{}'.format(i), 'x' * 10)
+    cache.add_cache_entry('large', 'x' * 35)
+    nose.assert_equal(
+        get_entry_keys(), ['key{}'.format(i) for i in range(4, 10)] +
+        ['large'])
+    nose.assert_equal(get_total_size(), 95)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_cache_size_bytes():
+    """should measure size of cache entries in bytes"""
+    cache.add_cache_entry('foo', '✓✓')
+    cache.add_cache_entry('bar', 'abc')
+    cache.add_cache_entry('foo', '✓')
+    nose.assert_equal(get_total_size(), 6)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_max_cache_size_pref():
+    """should limit size of cache to size in user preferences"""
+    user_prefs = core.get_user_prefs()
+    user_prefs['cachesize'] = 20
+    core.set_user_prefs(user_prefs)
+    nose.assert_equal(cache.get_max_cache_size(), 20)
+    cache.add_cache_entry('foo', 'x' * 15)
+    cache.add_cache_entry('bar', 'x' * 15)
+    nose.assert_equal(get_entry_keys(), ['bar'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_max_cache_size_read_before_lock():
+    """should read maximum cache size before locking cache"""
+    manager = Mock()
+    with patch('yvs.cache.get_max_cache_size', return_value=20) as \
+            get_max_cache_size, \
+            patch('yvs.cache.get_cache_connection',
+                  wraps=cache.get_cache_connection) as get_cache_connection:
+        manager.attach_mock(get_max_cache_size, 'get_max_cache_size')
+        manager.attach_mock(get_cache_connection, 'get_cache_connection')
+        cache.add_cache_entry('foo', 'x' * 15)
+    nose.assert_equal(manager.mock_calls, [
+        call.get_max_cache_size(), call.get_cache_connection()])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_nonexistent_cache_entry_recency():
+    """should not change recency of entries when reading nonexistent entry"""
+    cache.add_cache_entry('foo', 'blah blah')
+    cache.add_cache_entry('bar', 'blah blah')
+    cache.get_cache_entry_content('baz')
+    nose.assert_equal(get_entry_keys(), ['foo', 'bar'])
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.start_background_process')
+@patch('yvs.cache.get_max_cache_size', return_value=2000)
+def test_concurrent_cache_access(get_max_cache_size,
+                                 start_background_process):
+    """should withstand many processes using the cache at once"""
+    pool = multiprocessing.Pool(8)
+    try:
+        errors = pool.map(hammer_cache, range(16))
+    finally:
+        pool.terminate()
+    nose.assert_equal(errors, [None] * 16)
+    connection = cache.get_cache_connection()
+    try:
         nose.assert_equal(
-            len(entry_checksums), cache.MAX_NUM_CACHE_ENTRIES)
-        nose.assert_not_in(purged_entry_checksum, entry_checksums)
-        nose.assert_in(last_entry_checksum, entry_checksums)
+            connection.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+        nose.assert_equal(
+            connection.execute(
+                'SELECT num_entries, total_size FROM totals').fetchone(),
+            connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries')
+            .fetchone())
+    finally:
+        connection.close()
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.start_background_process')
+def test_clear_cache_while_in_use(start_background_process):
+    """should wait for cache to no longer be in use before clearing it"""
+    # The process must be started before the connection is opened, since
+    # forked processes share the locks held by their parent (the process also
+    # inherits the patched start_background_process, so no reaper is started)
+    is_cache_in_use = multiprocessing.Event()
+    clear_process = multiprocessing.Process(
+        target=clear_cache_when_set, args=(is_cache_in_use,))
+    clear_process.start()
+    connection = cache.get_cache_connection()
+    is_cache_in_use.set()
+    clear_process.join(0.2)
+    nose.assert_true(clear_process.is_alive(), 'cache cleared while in use')
+    connection.close()
+    clear_process.join(5)
+    nose.assert_false(
+        os.path.exists(cache.LOCAL_CACHE_DIR_PATH),
+        'local cache directory exists')
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.start_background_process')
+def test_clear_cache_tombstone(start_background_process):
+    """should move cleared cache aside for a background process to delete"""
+    cache.add_cache_entry('foo', 'blah blah')
+    cache.clear_cache()
+    nose.assert_false(
+        os.path.exists(cache.LOCAL_CACHE_DIR_PATH),
+        'local cache directory exists')
+    tombstone_paths = cache.get_cache_tombstone_paths()
+    nose.assert_equal(len(tombstone_paths), 1)
+    nose.assert_true(os.path.exists(
+        os.path.join(tombstone_paths[0], 'cache.sqlite')))
+    start_background_process.assert_called_once_with(
+        'yvs.cache', tombstone_paths)
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.start_background_process')
+def test_clear_cache_leftover_tombstones(start_background_process):
+    """should delete tombstones left behind by previous clears"""
+    cache.add_cache_entry('foo', 'blah blah')
+    cache.clear_cache()
+    cache.add_cache_entry('bar', 'blah blah')
+    cache.clear_cache()
+    tombstone_paths = cache.get_cache_tombstone_paths()
+    nose.assert_equal(len(tombstone_paths), 2)
+    nose.assert_equal(
+        sorted(start_background_process.call_args[0][1]),
+        sorted(tombstone_paths))
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.start_background_process')
+def test_add_cache_entry_after_clear(start_background_process):
+    """should write new entries to a new cache while old one is deleted"""
+    cache.add_cache_entry('foo', 'blah blah')
+    cache.clear_cache()
+    cache.add_cache_entry('bar', 'blah blah')
+    nose.assert_equal(get_entry_keys(), ['bar'])
+    tombstone_path = cache.get_cache_tombstone_paths()[0]
+    connection = sqlite3.connect(os.path.join(tombstone_path, 'cache.sqlite'))
+    try:
+        nose.assert_equal(connection.execute(
+            'SELECT key FROM entries').fetchall(), [('foo',)])
+    finally:
+        connection.close()
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.start_background_process')
+def test_clear_nonexistent_cache(start_background_process):
+    """should not leave tombstone if cache does not exist"""
+    os.rmdir(cache.LOCAL_CACHE_DIR_PATH)
+    cache.clear_cache()
+    nose.assert_equal(cache.get_cache_tombstone_paths(), [])
+    start_background_process.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.start_background_process')
+def test_reap_cache_tombstones(start_background_process):
+    """should delete cache tombstones when run as a background process"""
+    cache.add_cache_entry('foo', 'blah blah')
+    cache.clear_cache()
+    cache.main(*cache.get_cache_tombstone_paths())
+    nose.assert_equal(cache.get_cache_tombstone_paths(), [])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_add_cache_entry():
+    """should retrieve content of cache entry that was added"""
+    cache.add_cache_entry('foo', 'blah blah ✓')
+    nose.assert_equal(cache.get_cache_entry_content('foo'), 'blah blah ✓')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_nonexistent_cache_entry():
+    """should return None for nonexistent cache entry"""
+    nose.assert_is_none(cache.get_cache_entry_content('foo'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_replace_cache_entry():
+    """should replace content of existing cache entry and make it newest"""
+    cache.add_cache_entry('foo', 'blah blah')
+    cache.add_cache_entry('bar', 'blah blah')
+    cache.add_cache_entry('foo', 'blah blah blah')
+    nose.assert_equal(cache.get_cache_entry_content('foo'), 'blah blah blah')
+    nose.assert_equal(get_entry_keys(), ['bar', 'foo'])
+    nose.assert_equal(get_num_entries(), 2)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_add_cache_entry_atomic():
+    """should not add entry if purging old entries fails"""
+    cache.add_cache_entry('foo', 'blah blah')
+    with patch('yvs.cache.purge_expired_cache_entries',
+               side_effect=RuntimeError):
+        with nose.assert_raises(RuntimeError):
+            cache.add_cache_entry('bar', 'blah blah')
+    nose.assert_equal(get_entry_keys(), ['foo'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_cache_entry_expiry():
+    """should report whether cache entry has outlived its TTL"""
+    cache.add_cache_entry('foo', 'blah blah')
+    cache.add_cache_entry('bar', 'blah blah', ttl=60)
+    cache.add_cache_entry('baz', 'blah blah', ttl=0)
+    nose.assert_false(cache.get_cache_entry('foo')['is_expired'])
+    nose.assert_false(cache.get_cache_entry('bar')['is_expired'])
+    nose.assert_true(cache.get_cache_entry('baz')['is_expired'])
+    nose.assert_equal(cache.get_cache_entry_content('baz'), 'blah blah')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_claim_expired_cache_entry():
+    """should only allow expired cache entry to be claimed once"""
+    cache.add_cache_entry('foo', 'blah blah', ttl=0)
+    cache.add_cache_entry('bar', 'blah blah', ttl=60)
+    nose.assert_true(cache.claim_expired_cache_entry('foo', 60))
+    nose.assert_false(cache.claim_expired_cache_entry('foo', 60))
+    nose.assert_false(cache.get_cache_entry('foo')['is_expired'])
+    nose.assert_false(cache.claim_expired_cache_entry('bar', 60))
+    nose.assert_false(cache.claim_expired_cache_entry('baz', 60))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_add_compressed_cache_entry():
+    """should store compressed cache entry as-is and decompress it on read"""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, cache.GZIP_WBITS)
+    entry_content = ('blah blah ✓ ' * 100).encode('utf-8')
+    gzipped_content = compressor.compress(entry_content) + compressor.flush()
+    cache.add_cache_entry('foo', gzipped_content, 'gzip')
+    nose.assert_equal(
+        cache.get_cache_entry_content('foo'), 'blah blah ✓ ' * 100)
+    nose.assert_equal(get_total_size(), len(gzipped_content))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_schema_version_mismatch():
+    """should rebuild cache created for another version of the schema"""
+    cache.add_cache_entry('foo', 'blah blah')
+    with patch('yvs.cache.CACHE_SCHEMA_VERSION',
+               cache.CACHE_SCHEMA_VERSION + 1):
+        nose.assert_is_none(cache.get_cache_entry_content('foo'))
+        cache.add_cache_entry('bar', 'blah blah')
+        nose.assert_equal(get_num_entries(), 1)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_remove_legacy_cache_files():
+    """should remove cache files created by previous workflow versions"""
+    legacy_entry_dir_path = os.path.join(cache.LOCAL_CACHE_DIR_PATH, 'entries')
+    legacy_manifest_path = os.path.join(
+        cache.LOCAL_CACHE_DIR_PATH, 'manifest.txt')
+    os.mkdir(legacy_entry_dir_path)
+    with open(legacy_manifest_path, 'w') as manifest_file:
+        manifest_file.write('abc\n')
+    cache.get_cache_entry_content('foo')
+    nose.assert_false(
+        os.path.exists(legacy_entry_dir_path), 'legacy entries exist')
+    nose.assert_false(
+        os.path.exists(legacy_manifest_path), 'legacy manifest exists')
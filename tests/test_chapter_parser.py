@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import random
+
+import nose.tools as nose
+from mock import patch
+
+import yvs.copy_ref as yvs
+import yvs.core as core
+from tests.test_copy_ref import set_up, tear_down
+from yvs.yv_parser import YVParser
+
+# The class names of the random elements which chapters below are built from
+RANDOM_ELEM_CLASSES = [
+    'p', 'b', 'm', 'q1', 'q2', 'li1', 'qc', 'content', 'content', 'content',
+    'label', 'note', 'note f', 'body', 'heading', None]
+
+
+# The parser which copied references were originally constructed with (i.e.
+# parsing the entire chapter HTML for every reference); chapter parts must
+# always render the same content as this parser
+class LegacyReferenceParser(YVParser):
+
+    # Elements that should be surrounded by blank lines
+    block_elems = {'b', 'p', 'm'}
+    # Elements that should trigger a line break
+    break_elems = {'li1', 'q1', 'q2', 'qc', 'qm1', 'qm2'}
+
+    # Associates the given reference object with this parser instance
+    def __init__(self, ref, include_verse_numbers=False):
+        YVParser.__init__(self)
+        if 'verse' in ref:
+            # If reference is a verse or verse range, set the correct range of
+            # verses to copy
+            self.verse_start = ref['verse']
+            self.verse_end = ref.get('endverse', self.verse_start)
+        else:
+            # Otherwise, assume reference is a chapter
+            self.verse_start = 1
+            self.verse_end = None
+        self.include_verse_numbers = include_verse_numbers
+
+    # Resets parser variables (implicitly called when parser is instantiated)
+    def reset(self):
+        YVParser.reset(self)
+        self.depth = 0
+        self.in_block = False
+        self.in_verse = False
+        self.in_verse_label = False
+        self.in_verse_content = False
+        self.in_verse_note = False
+        self.block_depth = 0
+        self.verse_depth = 0
+        self.label_depth = 0
+        self.content_depth = 0
+        self.verse_nums = []
+        self.content_parts = []
+
+    # Returns True if parser is currently within the a verse to include
+    # (otherwise, returns False)
+    def is_in_verse(self):
+        return any(self.in_verse and
+                   (verse_num >= self.verse_start and
+                    (not self.verse_end or verse_num <= self.verse_end))
+                   for verse_num in self.verse_nums)
+
+    # Returns True if parser is currently within the content of a verse to
+    # include
+    def is_in_verse_content(self):
+        return (self.is_in_verse() and self.in_verse_content
+                and not self.in_verse_note)
+
+    # Returns True if parser is currently within the label of a verse to
+    # include (otherwise, returns False)
+    def is_in_verse_label(self):
+        return (self.is_in_verse() and self.include_verse_numbers and
+                self.in_verse_label and not self.in_verse_note)
+
+    # Detects the start of blocks, breaks, verses, and verse content
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        # Keep track of element depth throughout entire document
+        self.depth += 1
+        # We can't just use the Python 'in' operator to check if the key
+        # exists, because it's perfectly valid for an HTML element to have a
+        # attribute name present, but without any value (e.g. <div class>); in
+        # this case, the attrs dictionary would have a 'class' attribute with a
+        # value of None
+        elem_class = attrs.get('class')
+        if not elem_class:
+            return
+        elem_class_names = elem_class.split(' ')
+        # Detect paragraph breaks between verses
+        if elem_class in self.block_elems:
+            self.in_block = True
+            self.block_depth = self.depth
+            self.content_parts.append('\n\n')
+        # Detect line breaks within a single verse
+        if elem_class in self.break_elems:
+            self.content_parts.append('\n')
+        # Detect beginning of a single verse (may include footnotes)
+        if 'verse' in elem_class_names:
+            self.in_verse = True
+            self.verse_depth = self.depth
+            self.verse_nums = [int(class_name[1:])
+                               for class_name in elem_class_names[1:]]
+        # Detect label containing the associated verse number(s)
+        if 'label' in elem_class:
+            self.in_verse_label = True
+            self.label_depth = self.depth
+        # Detect beginning of verse content (excludes footnotes)
+        if 'content' in elem_class:
+            self.in_verse_content = True
+            self.content_depth = self.depth
+        # Detect footnotes and cross-references
+        if 'note' in elem_class:
+            self.in_verse_note = True
+            self.note_depth = self.depth
+
+    # Detects the end of blocks, breaks, verses, and verse content
+    def handle_endtag(self, tag):
+        if self.in_block and self.depth == self.block_depth:
+            self.in_block = False
+            self.content_parts.append('\n')
+        elif self.in_verse and self.depth == self.verse_depth:
+            self.in_verse = False
+        elif self.in_verse_label and self.depth == self.label_depth:
+            self.in_verse_label = False
+        elif self.in_verse_content and self.depth == self.content_depth:
+            self.in_verse_content = False
+        elif self.in_verse_note and self.depth == self.note_depth:
+            self.in_verse_note = False
+        self.depth -= 1
+
+    # Handles verse labels and content
+    def handle_data(self, data):
+        if self.is_in_verse_label():
+            self.content_parts.append(' {} '.format(data.strip()))
+        if self.is_in_verse_content():
+            self.content_parts.append(data)
+
+
+def get_legacy_ref_content(chapter_html, ref, include_verse_numbers):
+    parser = LegacyReferenceParser(ref, include_verse_numbers)
+    parser.feed(chapter_html)
+    return core.normalize_ref_content(''.join(parser.content_parts))
+
+
+def get_chapter_parts(chapter_html):
+    parser = yvs.ChapterParser()
+    parser.feed(chapter_html)
+    return parser.chapter_parts
+
+
+# Parses the given chapter HTML in chunks of the given size (as it would be
+# parsed while being downloaded) until every verse in the given reference has
+# been parsed
+def get_streamed_chapter_parts(chapter_html, ref, chunk_size):
+    return yvs.parse_chapter_html_chunks(
+        (chapter_html[i:i + chunk_size]
+         for i in range(0, len(chapter_html), chunk_size)),
+        ref.get('endverse', ref['verse']))[0]
+
+
+def get_ref_content(chapter_parts, ref, include_verse_numbers):
+    return core.normalize_ref_content(yvs.render_chapter_parts(
+        chapter_parts, ref, include_verse_numbers))
+
+
+# Yields every verse and verse range (and the entire chapter) for a chapter
+# with the given number of verses
+def get_refs(num_verses):
+    yield {}
+    for verse_start in range(1, num_verses + 2):
+        yield {'verse': verse_start}
+        for verse_end in range(verse_start + 1, num_verses + 2):
+            yield {'verse': verse_start, 'endverse': verse_end}
+
+
+def get_random_elem_html(rng, num_verses, depth=0):
+    if depth >= 3 or rng.random() < 0.3:
+        return rng.choice(['Lorem', ' ipsum ', 'dolor&amp;', '&#8220;sit',
+                           ' ', '  amet  ', '3', '\n'])
+    if rng.random() < 0.25:
+        verse_nums = sorted(rng.sample(
+            range(1, num_verses + 1), rng.choice([1, 1, 1, 2])))
+        elem_class = 'verse {}'.format(
+            ' '.join('v{}'.format(verse_num) for verse_num in verse_nums))
+    else:
+        elem_class = rng.choice(RANDOM_ELEM_CLASSES)
+    return '<span{}>{}</span>'.format(
+        ' class="{}"'.format(elem_class) if elem_class else '',
+        ''.join(get_random_elem_html(rng, num_verses, depth + 1)
+                for i in range(rng.randint(0, 4))))
+
+
+# Generates the HTML of a random chapter which exercises every element and
+# combination of elements recognized by the parser
+def get_random_chapter_html(rng, num_verses):
+    return '<div class="chapter">{}</div>'.format(''.join(
+        get_random_elem_html(rng, num_verses) for i in range(8)))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_chapter_parts_fixture():
+    """should render same content as HTML parser for every verse range"""
+    with open('tests/html/psa.23.html') as html_file:
+        chapter_html = html_file.read().decode('utf-8')
+    chapter_parts = get_chapter_parts(chapter_html)
+    for ref in get_refs(10):
+        for include_verse_numbers in (False, True):
+            nose.assert_equal(
+                get_ref_content(chapter_parts, ref, include_verse_numbers),
+                get_legacy_ref_content(
+                    chapter_html, ref, include_verse_numbers))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_chapter_parts_random():
+    """should render same content as HTML parser for random chapters"""
+    rng = random.Random(0)
+    for i in range(30):
+        chapter_html = get_random_chapter_html(rng, 3)
+        chapter_parts = get_chapter_parts(chapter_html)
+        for ref in get_refs(3):
+            for include_verse_numbers in (False, True):
+                nose.assert_equal(
+                    get_ref_content(
+                        chapter_parts, ref, include_verse_numbers),
+                    get_legacy_ref_content(
+                        chapter_html, ref, include_verse_numbers))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_streamed_chapter_parts_fixture():
+    """should render same content from partially parsed chapter for verses"""
+    with open('tests/html/psa.23.html') as html_file:
+        chapter_html = html_file.read().decode('utf-8')
+    chapter_parts = get_chapter_parts(chapter_html)
+    for chunk_size in (1, 7, 64, 256):
+        for ref in get_refs(10):
+            if 'verse' not in ref:
+                continue
+            streamed_chapter_parts = get_streamed_chapter_parts(
+                chapter_html, ref, chunk_size)
+            for include_verse_numbers in (False, True):
+                nose.assert_equal(
+                    get_ref_content(
+                        streamed_chapter_parts, ref, include_verse_numbers),
+                    get_ref_content(
+                        chapter_parts, ref, include_verse_numbers))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_chapter_parts_merged():
+    """should merge consecutive chapter parts belonging to the same verses"""
+    parser = yvs.ChapterParser()
+    parser.feed('<div class="p"><span class="verse v1">'
+                '<span class="content">a</span><span class="content">b'
+                '</span></span></div>')
+    nose.assert_equal(parser.chapter_parts, [
+        [yvs.MARKER_PART, [], '\n\n'],
+        [yvs.CONTENT_PART, [1], 'ab'],
+        [yvs.MARKER_PART, [], '\n']])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_cache_chapter_parts():
+    """should only parse chapter HTML once for all references in chapter"""
+    ref_content = yvs.get_copied_ref('59/psa.23.2')
+    yvs.get_copied_ref('59/psa.23')
+    with patch('yvs.copy_ref.ChapterParser') as chapter_parser:
+        nose.assert_equal(yvs.get_copied_ref('59/psa.23.2'), ref_content)
+        yvs.get_copied_ref('59/psa.23.3-5')
+        chapter_parser.assert_not_called()
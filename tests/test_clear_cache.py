@@ -6,25 +6,31 @@
 import shutil
 
 import nose.tools as nose
+from mock import patch
 
 import yvs.clear_cache as yvs
 from tests import set_up, tear_down
 
 
 @nose.with_setup(set_up, tear_down)
-def test_clear_cache():
+@patch('yvs.core.start_background_process')
+def test_clear_cache(start_background_process):
     """should remove cache directory when cache is cleared"""
     yvs.main()
     nose.assert_false(
         os.path.exists(yvs.cache.LOCAL_CACHE_DIR_PATH),
         'local cache directory exists')
+    start_background_process.assert_called_once_with(
+        'yvs.cache', yvs.cache.get_cache_tombstone_paths())
 
 
 @nose.with_setup(set_up, tear_down)
-def test_clear_cache_silent_fail():
+@patch('yvs.core.start_background_process')
+def test_clear_cache_silent_fail(start_background_process):
     """should fail silently if cache directory does not exist"""
     shutil.rmtree(yvs.cache.LOCAL_CACHE_DIR_PATH)
     yvs.main()
     nose.assert_false(
         os.path.exists(yvs.cache.LOCAL_CACHE_DIR_PATH),
         'local cache directory exists')
+    start_background_process.assert_not_called()
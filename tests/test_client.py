@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import os.path
+import tempfile
+
+import nose.tools as nose
+from mock import patch
+
+import yvs.client as yvs
+import yvs.filter_refs as filter_refs
+from tests import set_up, tear_down
+from tests.decorators import redirect_stdout
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.client.SERVER_DIR_PATH', tempfile.gettempdir())
+@patch('yvs.client.SERVER_SOCKET_PATH',
+       os.path.join(tempfile.gettempdir(), 'yvs-nonexistent.sock'))
+@redirect_stdout
+def test_main_no_server(out):
+    """should run script filter in-process if server is not running"""
+    yvs.main('filter_refs', ['john 3'])
+    nose.assert_equal(
+        out.getvalue().rstrip(),
+        filter_refs.core.get_result_list_feedback_str(
+            filter_refs.get_result_list('john 3')))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_main_unknown_module():
+    """should refuse to run modules which are not script filters"""
+    with nose.assert_raises(ValueError):
+        yvs.main('clear_cache', [])
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.client.SERVER_DIR_PATH', '/nonexistent/yvs')
+def test_server_dir_missing():
+    """should not trust nonexistent server directory"""
+    nose.assert_false(yvs.is_server_dir_trusted())
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('os.getuid', return_value=-1)
+def test_server_dir_untrusted(getuid):
+    """should not contact server in directory owned by another user"""
+    nose.assert_is_none(yvs.get_server_output('filter_refs', ['john 3']))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import glob
+import json
+import marshal
+import os
+import os.path
+
+import nose.tools as nose
+from mock import patch
+
+import yvs.compile_data as yvs
+from tests import set_up, tear_down
+from tests.decorators import redirect_stdout
+
+
+def get_json_bible(language_id):
+    with open(get_bible_path(language_id), 'r') as bible_file:
+        return json.load(bible_file)
+
+
+def get_bible_path(language_id):
+    return yvs.core.get_bible_data_path('bible-{}.json'.format(language_id))
+
+
+# Retrieves the path to a data file outside of the packaged data directory,
+# which tests may freely modify
+def get_temp_data_path():
+    os.mkdir(yvs.core.COMPILED_DATA_DIR_PATH)
+    return os.path.join(yvs.core.LOCAL_DATA_DIR_PATH, 'test-data.json')
+
+
+def write_data_file(data_path, data):
+    with open(data_path, 'w') as data_file:
+        json.dump(data, data_file)
+
+
+def write_snapshot(data_path, snapshot):
+    with open(yvs.core.get_compiled_data_path(data_path), 'wb') as \
+            compiled_file:
+        compiled_file.write(snapshot)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_compile_data_files():
+    """should compile a snapshot for every packaged data file"""
+    compiled_paths = yvs.compile_data_files()
+    data_paths = glob.glob(yvs.core.get_bible_data_path('*.json'))
+    nose.assert_equal(len(compiled_paths), len(data_paths))
+    for data_path in data_paths:
+        nose.assert_true(
+            os.path.exists(yvs.core.get_compiled_data_path(data_path)),
+            'compiled snapshot does not exist')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_compile_data_files_existing_dir():
+    """should recompile snapshots if compiled data directory already exists"""
+    yvs.compile_data_files()
+    yvs.compile_data_files()
+    nose.assert_equal(
+        yvs.core.load_data_file(get_bible_path('eng')),
+        get_json_bible('eng'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_load_compiled():
+    """should load compiled snapshot without parsing JSON"""
+    yvs.compile_data_files()
+    with patch('json.load') as json_load:
+        bible = yvs.core.load_data_file(get_bible_path('eng'))
+        book_metadata = yvs.core.get_book_metadata()
+        languages = yvs.core.get_languages()
+        json_load.assert_not_called()
+    nose.assert_equal(bible, get_json_bible('eng'))
+    nose.assert_in('gen', book_metadata)
+    nose.assert_greater(len(languages), 0)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_load_missing():
+    """should fall back to JSON if compiled snapshot does not exist"""
+    nose.assert_equal(
+        yvs.core.load_data_file(get_bible_path('eng')),
+        get_json_bible('eng'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_load_corrupted():
+    """should fall back to JSON if compiled snapshot is corrupted"""
+    yvs.compile_data_files()
+    data_path = get_bible_path('eng')
+    write_snapshot(data_path, b'\x00corrupted')
+    nose.assert_equal(
+        yvs.core.load_data_file(get_bible_path('eng')),
+        get_json_bible('eng'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_load_checksum_mismatch():
+    """should fall back to JSON if snapshot payload fails its checksum"""
+    yvs.compile_data_files()
+    data_path = get_bible_path('eng')
+    payload = marshal.dumps({'books': [], 'versions': []})
+    write_snapshot(data_path, marshal.dumps((
+        yvs.core.COMPILED_DATA_FORMAT_VERSION,
+        yvs.core.get_compiled_data_source_info(data_path),
+        yvs.core.get_compiled_data_checksum(payload) + 1,
+        payload)))
+    nose.assert_equal(
+        yvs.core.load_data_file(get_bible_path('eng')),
+        get_json_bible('eng'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_load_stale():
+    """should fall back to JSON if snapshot was compiled from another file"""
+    yvs.compile_data_files()
+    data_path = get_bible_path('eng')
+    payload = marshal.dumps({'books': [], 'versions': []})
+    source_size, source_mtime, source_checksum = (
+        yvs.core.get_compiled_data_source_info(data_path))
+    write_snapshot(data_path, marshal.dumps((
+        yvs.core.COMPILED_DATA_FORMAT_VERSION,
+        (source_size + 1, source_mtime, source_checksum),
+        yvs.core.get_compiled_data_checksum(payload),
+        payload)))
+    nose.assert_equal(
+        yvs.core.load_data_file(get_bible_path('eng')),
+        get_json_bible('eng'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_load_edited_same_size():
+    """should fall back to JSON if source was edited without changing size"""
+    data_path = get_temp_data_path()
+    write_data_file(data_path, {'version': 111})
+    yvs.compile_data_file(data_path)
+    write_data_file(data_path, {'version': 112})
+    data_mtime = os.path.getmtime(data_path)
+    os.utime(data_path, (data_mtime + 10, data_mtime + 10))
+    nose.assert_equal(yvs.core.load_data_file(data_path), {'version': 112})
+
+
+@nose.with_setup(set_up, tear_down)
+def test_load_copied():
+    """should load snapshot if source was copied without being changed"""
+    data_path = get_temp_data_path()
+    write_data_file(data_path, {'version': 111})
+    yvs.compile_data_file(data_path)
+    data_mtime = os.path.getmtime(data_path)
+    os.utime(data_path, (data_mtime + 10, data_mtime + 10))
+    with patch('json.load') as json_load:
+        nose.assert_equal(
+            yvs.core.load_data_file(data_path), {'version': 111})
+        json_load.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+def test_load_format_version_mismatch():
+    """should fall back to JSON if snapshot uses another format version"""
+    yvs.compile_data_files()
+    data_path = get_bible_path('eng')
+    payload = marshal.dumps({'books': [], 'versions': []})
+    write_snapshot(data_path, marshal.dumps((
+        yvs.core.COMPILED_DATA_FORMAT_VERSION + 1,
+        yvs.core.get_compiled_data_source_info(data_path),
+        yvs.core.get_compiled_data_checksum(payload),
+        payload)))
+    nose.assert_equal(
+        yvs.core.load_data_file(get_bible_path('eng')),
+        get_json_bible('eng'))
+
+
+@nose.with_setup(set_up, tear_down)
+@redirect_stdout
+def test_main(out):
+    """should print the path to every compiled snapshot"""
+    yvs.main()
+    nose.assert_equal(
+        out.getvalue().splitlines(),
+        [yvs.core.get_compiled_data_path(data_path) for data_path in
+         sorted(glob.glob(yvs.core.get_bible_data_path('*.json')))])
@@ -6,25 +6,58 @@
 import json
 
 import nose.tools as nose
-from mock import Mock, NonCallableMock, patch
+from mock import patch
 
 import tests
 import yvs.copy_ref as yvs
+import yvs.web as web
 from tests.decorators import redirect_stdout, use_user_prefs
 
 with open('tests/html/psa.23.html') as html_file:
-    patch_urlopen = patch(
-        'urllib2.urlopen', return_value=NonCallableMock(
-            read=Mock(return_value=html_file.read())))
+    html_content = html_file.read()
+# The size of the chunks in which the chapter HTML is served
+html_chunk_size = 256
+
+
+# Serves the chapter HTML in chunks (as if it were being downloaded),
+# recording every chunk which is read
+def get_url_body_chunks(url):
+    read_html_chunks = []
+    get_url_body_chunks.read_html_chunks = read_html_chunks
+
+    def get_html_chunks():
+        for i in range(0, len(html_content), html_chunk_size):
+            read_html_chunks.append(html_content[i:i + html_chunk_size])
+            yield read_html_chunks[-1]
+
+    return 'identity', get_html_chunks()
+
+
+patch_get_url_body = patch(
+    'yvs.web.get_url_body',
+    return_value=(html_content, 'identity'))
+patch_get_url_body_chunks = patch(
+    'yvs.web.get_url_body_chunks', side_effect=get_url_body_chunks)
+# Copying a reference must never start a real prefetch process during tests
+patch_start_background_process = patch('yvs.core.start_background_process')
+# Nor may it fork the test process to finish reading a streamed chapter
+patch_fork_background_process = patch('yvs.core.fork_background_process')
 
 
 def set_up():
-    patch_urlopen.start()
+    patch_get_url_body.start()
+    patch_get_url_body_chunks.start()
+    patch_start_background_process.start()
+    patch_fork_background_process.start()
     tests.set_up()
 
 
 def tear_down():
-    patch_urlopen.stop()
+    patch_get_url_body.stop()
+    patch_get_url_body_chunks.stop()
+    patch_start_background_process.stop()
+    patch_fork_background_process.stop()
+    del yvs.streamed_chapters[:]
     tests.tear_down()
 
 
@@ -175,21 +208,78 @@ def test_versenumbers_range_middle():
 
 
 @nose.with_setup(set_up, tear_down)
-@patch('yvs.web.get_url_content', return_value='abc')
-def test_url_always_chapter(get_url_content):
+def test_url_always_chapter():
     """should always fetch HTML from chapter URL"""
-    yvs.get_copied_ref('59/psa.23.2')
-    get_url_content.assert_called_once_with(
+    yvs.get_copied_ref('59/psa.23')
+    yvs.get_copied_ref('59/psa.24.2')
+    web.get_url_body.assert_called_once_with(
         'https://www.bible.com/bible/59/PSA.23')
+    web.get_url_body_chunks.assert_called_once_with(
+        'https://www.bible.com/bible/59/PSA.24')
 
 
 @nose.with_setup(set_up, tear_down)
 def test_cache_url_content():
     """should cache chapter URL content after first fetch"""
-    yvs.get_copied_ref('59/psa.23.2')
-    with patch('urllib2.Request') as request:
+    yvs.get_copied_ref('59/psa.23')
+    with patch('yvs.web.get_url_body') as get_url_body:
         yvs.get_copied_ref('59/psa.23.3')
-        request.assert_not_called()
+        get_url_body.assert_not_called()
+    web.get_url_body_chunks.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+def test_stream_verse():
+    """should stop reading chapter HTML once copied verses are parsed"""
+    ref_content = yvs.get_copied_ref('59/psa.23.1')
+    nose.assert_regexp_matches(ref_content, 'Lorem')
+    nose.assert_less(len(get_url_body_chunks.read_html_chunks),
+                     len(html_content) // html_chunk_size)
+    nose.assert_false(yvs.cache.has_cache_entry('59/psa.23.json'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_finish_streamed_chapter():
+    """should finish reading streamed chapter without downloading it again"""
+    ref_content = yvs.get_copied_ref('59/psa.23.1')
+    yvs.finish_streamed_chapters()
+    nose.assert_equal(b''.join(get_url_body_chunks.read_html_chunks),
+                      html_content)
+    web.get_url_body_chunks.assert_called_once_with(
+        'https://www.bible.com/bible/59/PSA.23')
+    web.get_url_body.assert_not_called()
+    nose.assert_equal(yvs.streamed_chapters, [])
+    nose.assert_true(yvs.cache.has_cache_entry('59/psa.23.json'))
+    nose.assert_equal(yvs.get_copied_ref('59/psa.23.1'), ref_content)
+    nose.assert_equal(
+        json.loads(yvs.cache.get_cache_entry_content('59/psa.23.json')),
+        yvs.get_chapter_parts(yvs.core.get_ref(
+            '59/psa.23', yvs.core.get_user_prefs())))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_stream_verse_same_content():
+    """should copy same verse content from partial chapter as full chapter"""
+    ref_uids = ['59/psa.23.{}'.format(verse) for verse in range(1, 11)]
+    ref_uids.extend(('59/psa.23.1-2', '59/psa.23.2-4', '59/psa.23.6-8'))
+    streamed_ref_contents = []
+    for ref_uid in ref_uids:
+        streamed_ref_contents.append(yvs.get_copied_ref(ref_uid))
+    yvs.get_copied_ref('59/psa.23')
+    for ref_uid, streamed_ref_content in zip(ref_uids, streamed_ref_contents):
+        nose.assert_equal(yvs.get_copied_ref(ref_uid), streamed_ref_content)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_stream_last_verse():
+    """should cache chapter parts if chapter HTML is read in full"""
+    yvs.get_copied_ref('59/psa.23.10')
+    nose.assert_equal(b''.join(get_url_body_chunks.read_html_chunks),
+                      html_content)
+    nose.assert_true(yvs.cache.has_cache_entry('59/psa.23.json'))
+    with patch('yvs.web.get_url_body_chunks') as get_url_body_chunks_mock:
+        yvs.get_copied_ref('59/psa.23.2')
+        get_url_body_chunks_mock.assert_not_called()
 
 
 @nose.with_setup(set_up, tear_down)
@@ -223,3 +313,25 @@ def test_main(out):
             }
         }
     })
+    yvs.core.fork_background_process.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+@redirect_stdout
+def test_main_prefetch(out):
+    """main function should start prefetch in background"""
+    yvs.main('59/psa.23.1')
+    yvs.core.fork_background_process.assert_called_once_with(
+        yvs.finish_streamed_chapters)
+    yvs.core.start_background_process.assert_called_with(
+        'yvs.prefetch', ['59/psa.23.1'])
+
+
+@nose.with_setup(set_up, tear_down)
+@redirect_stdout
+def test_main_prefetch_error(out):
+    """main function should copy reference even if prefetch fails"""
+    with patch('yvs.prefetch.start_prefetch', side_effect=OSError):
+        yvs.main('59/psa.23.1')
+    main_json = json.loads(out.getvalue())
+    nose.assert_equal(main_json['alfredworkflow']['arg'], '59/psa.23.1')
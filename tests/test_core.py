@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+import os.path
+import time
+
+import nose.tools as nose
+from mock import patch
+
+import yvs.core as core
+from tests import set_up, tear_down
+
+
+def write_data_file(data_file_name, data, mtime=None):
+    data_path = os.path.join(core.LOCAL_DATA_DIR_PATH, data_file_name)
+    with open(data_path, 'w') as data_file:
+        json.dump(data, data_file)
+    if mtime is not None:
+        os.utime(data_path, (mtime, mtime))
+    return data_path
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_data_file_memoized():
+    """should only load data file once if it has not changed"""
+    data_path = write_data_file('foo.json', {'foo': 1})
+    with patch('yvs.core.load_data_file', wraps=core.load_data_file) as \
+            load_data_file:
+        core.get_data_file(data_path)
+        data = core.get_data_file(data_path)
+        load_data_file.assert_called_once_with(data_path)
+    nose.assert_equal(data, {'foo': 1})
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_data_file_changed():
+    """should reload data file if its modification time has changed"""
+    data_path = write_data_file('foo.json', {'foo': 1}, mtime=1000)
+    core.get_data_file(data_path)
+    write_data_file('foo.json', {'foo': 2}, mtime=2000)
+    nose.assert_equal(core.get_data_file(data_path), {'foo': 2})
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.MAX_NUM_LOADED_DATA_FILES', 2)
+def test_get_data_file_bounded():
+    """should evict least recently used data file if too many are loaded"""
+    foo_path = write_data_file('foo.json', {'foo': 1})
+    bar_path = write_data_file('bar.json', {'bar': 2})
+    baz_path = write_data_file('baz.json', {'baz': 3})
+    core.get_data_file(foo_path)
+    core.get_data_file(bar_path)
+    core.get_data_file(foo_path)
+    core.get_data_file(baz_path)
+    nose.assert_equal(list(core.loaded_data_files), [foo_path, baz_path])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_bible_memoized():
+    """should share loaded bible data across calls"""
+    nose.assert_is(core.get_bible('eng'), core.get_bible('eng'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_default_user_prefs_copy():
+    """should not allow changes to default preferences to persist"""
+    default_user_prefs = core.get_default_user_prefs()
+    default_user_prefs['language'] = 'foo'
+    nose.assert_not_equal(core.get_default_user_prefs()['language'], 'foo')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_book():
+    """should retrieve name of book with the given ID"""
+    bible = core.get_bible('eng')
+    nose.assert_equal(core.get_book(bible, 'jhn'), 'John')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_book_nonexistent():
+    """should return None if no book has the given ID"""
+    bible = core.get_bible('eng')
+    nose.assert_is_none(core.get_book(bible, 'xyz'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_version():
+    """should retrieve version with the given ID"""
+    bible = core.get_bible('eng')
+    nose.assert_equal(core.get_version(bible, 59)['name'], 'ESV')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_version_nonexistent():
+    """should return None if no version has the given ID"""
+    bible = core.get_bible('eng')
+    nose.assert_is_none(core.get_version(bible, 999))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_fork_background_process():
+    """should call function within detached forked process"""
+    result_path = os.path.join(core.LOCAL_DATA_DIR_PATH, 'forked.json')
+    temp_result_path = result_path + '.tmp'
+
+    def write_process_ids():
+        with open(temp_result_path, 'w') as result_file:
+            json.dump([os.getpid(), os.getsid(0)], result_file)
+        os.rename(temp_result_path, result_path)
+
+    core.fork_background_process(write_process_ids)
+    for i in range(500):
+        if os.path.exists(result_path):
+            break
+        time.sleep(0.01)
+    with open(result_path, 'r') as result_file:
+        child_pid, child_sid = json.load(result_file)
+    nose.assert_not_equal(child_pid, os.getpid())
+    nose.assert_equal(child_sid, child_pid)
+    os.waitpid(child_pid, 0)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_index_bible_first():
+    """should index the first of any books or versions sharing an ID"""
+    bible = {
+        'books': [{'id': 'jhn', 'name': 'John'}, {'id': 'jhn', 'name': 'Jn'}],
+        'versions': [{'id': 1, 'name': 'KJV'}, {'id': 1, 'name': 'KJ'}]
+    }
+    core.index_bible(bible)
+    nose.assert_equal(core.get_book(bible, 'jhn'), 'John')
+    nose.assert_equal(core.get_version(bible, 1)['name'], 'KJV')
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import io
+import json
+import os.path
+from io import BytesIO
+
+import nose.tools as nose
+from mock import patch
+
+import yvs.extract_refs as yvs
+from tests import set_up, tear_down
+from tests.decorators import redirect_stdout, use_user_prefs
+
+TEXT_LINES = [
+    'For God so loved the world (John 3:16), and love is patient'
+    ' (1 Cor 13:4-7).\n',
+    'Read Psalm 23 tonight, then Acts 2:1–4 and Gen. 1:1.\n',
+    'In a 3 day span we read 200 pages; Acts 29 and John 3:99 do not exist.\n',
+    'the romans 8 lowercase chapter is ignored, but romans 8:28 is not.\n'
+]
+
+
+def get_text_file_path():
+    text_file_path = os.path.join(yvs.core.LOCAL_DATA_DIR_PATH, 'text.txt')
+    with io.open(text_file_path, 'w', encoding='utf-8') as text_file:
+        text_file.writelines(TEXT_LINES)
+    return text_file_path
+
+
+def get_uids(refs):
+    return [(line_num, ref['uid']) for line_num, ref in refs]
+
+
+@nose.with_setup(set_up, tear_down)
+def test_extract_refs():
+    """should extract every reference along with its line number"""
+    refs = list(yvs.extract_refs_from_lines(TEXT_LINES))
+    nose.assert_equal(get_uids(refs), [
+        (1, '111/jhn.3.16'),
+        (1, '111/1co.13.4-7'),
+        (2, '111/psa.23'),
+        (2, '111/act.2.1-4'),
+        (2, '111/gen.1.1'),
+        (4, '111/rom.8.28')
+    ])
+    nose.assert_equal(refs[1][1]['text'], '1 Cor 13:4-7')
+    nose.assert_equal(refs[1][1]['name'], '1 Corinthians 13:4-7')
+
+
+@nose.with_setup(set_up, tear_down)
+@use_user_prefs({'language': 'eng', 'version': 59, 'copybydefault': False})
+def test_extract_refs_version():
+    """should resolve references using the preferred version"""
+    refs = list(yvs.extract_refs_from_lines(['See John 3:16.']))
+    nose.assert_equal(get_uids(refs), [(1, '59/jhn.3.16')])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_extract_refs_nonexistent():
+    """should ignore references to nonexistent books, chapters, or verses"""
+    refs = list(yvs.extract_refs_from_lines([
+        'Hezekiah 3:16, Acts 29, John 3:99, John 3:1-99']))
+    nose.assert_equal(refs, [])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_extract_refs_numbered_book_after_word():
+    """should keep number of book preceded by word which is not a book"""
+    refs = list(yvs.extract_refs_from_lines([
+        'see 2 Kings 2:11', 'in 1 John 4:8', 'and 2 Cor 13:4']))
+    nose.assert_equal(get_uids(refs), [
+        (1, '111/2ki.2.11'),
+        (2, '111/1jn.4.8'),
+        (3, '111/2co.13.4')
+    ])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_extract_refs_invalid_range():
+    """should treat ranges ending before they begin as single verses"""
+    refs = list(yvs.extract_refs_from_lines(['John 3:16-2']))
+    nose.assert_equal(get_uids(refs), [(1, '111/jhn.3.16')])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_extract_refs_lazy():
+    """should consume lines one at a time"""
+    def get_lines():
+        yield 'John 3:16\n'
+        raise AssertionError('too many lines consumed')
+    refs = yvs.extract_refs_from_lines(get_lines())
+    nose.assert_equal(next(refs)[1]['uid'], '111/jhn.3.16')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_extract_refs_from_file():
+    """should extract references from a file"""
+    nose.assert_equal(
+        get_uids(yvs.extract_refs_from_file(get_text_file_path())),
+        get_uids(yvs.extract_refs_from_lines(TEXT_LINES)))
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.extract_refs.CHUNK_SIZE', 50)
+def test_extract_refs_from_file_parallel():
+    """should extract the same references when using multiple processes"""
+    nose.assert_equal(
+        get_uids(yvs.extract_refs_from_file(get_text_file_path(), 3)),
+        get_uids(yvs.extract_refs_from_lines(TEXT_LINES)))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_chunk_lines():
+    """should assign every line to exactly one chunk"""
+    text_file_path = get_text_file_path()
+    file_size = os.path.getsize(text_file_path)
+    for chunk_size in (1, 7, 75, 76, 77, file_size):
+        lines = []
+        for chunk_start in xrange(0, file_size, chunk_size):
+            lines.extend(yvs.get_chunk_lines(
+                text_file_path, chunk_start, chunk_start + chunk_size))
+        nose.assert_equal(lines, TEXT_LINES)
+
+
+@nose.with_setup(set_up, tear_down)
+@redirect_stdout
+def test_main(out):
+    """should print every reference as a JSON line"""
+    text_file_path = get_text_file_path()
+    yvs.main([text_file_path])
+    refs = [json.loads(line) for line in out.getvalue().splitlines()]
+    nose.assert_equal(len(refs), 6)
+    nose.assert_equal(refs[0], {
+        'file': text_file_path,
+        'line': 1,
+        'text': 'John 3:16',
+        'name': 'John 3:16',
+        'uid': '111/jhn.3.16'
+    })
+
+
+@nose.with_setup(set_up, tear_down)
+@redirect_stdout
+def test_main_stdin(out):
+    """should read from stdin if no file is given"""
+    stdin = BytesIO(''.join(TEXT_LINES).encode('utf-8'))
+    with patch('sys.stdin', stdin):
+        yvs.main([])
+    refs = [json.loads(line) for line in out.getvalue().splitlines()]
+    nose.assert_equal(len(refs), 6)
+    nose.assert_equal(refs[3]['uid'], '111/act.2.1-4')
+    nose.assert_equal(refs[3]['file'], '-')
@@ -126,6 +126,26 @@ def test_show_current_refformat():
     })
 
 
+@nose.with_setup(set_up, tear_down)
+def test_show_cache_sizes():
+    """should show all cache sizes if no value is given"""
+    results = yvs.get_result_list('cachesize')
+    nose.assert_equal(len(results), 5)
+    nose.assert_equal(results[2]['title'], '25 MB')
+    nose.assert_equal(results[2]['valid'], False)
+    nose.assert_equal(results[3]['variables']['value_id'], '52428800')
+
+
+@nose.with_setup(set_up, tear_down)
+@use_user_prefs({'language': 'eng', 'version': 59, 'cachesize': 1572864})
+def test_show_current_cache_size():
+    """should show current cache size as an available value"""
+    results = yvs.get_result_list('cachesize 1 5')
+    nose.assert_equal(len(results), 1)
+    nose.assert_equal(results[0]['title'], '1.5 MB')
+    nose.assert_equal(results[0]['valid'], False)
+
+
 @nose.with_setup(set_up, tear_down)
 def test_nonexistent_pref():
     """should not match nonexistent preference"""
@@ -206,7 +226,7 @@ def test_filter_preferences_name_partial():
 def test_filter_preferences_show_current():
     """should show current values for all preferences"""
     results = yvs.get_result_list('')
-    nose.assert_equal(len(results), 5)
+    nose.assert_equal(len(results), 6)
     nose.assert_in('English', results[0]['subtitle'])
     nose.assert_in('NIV', results[1]['subtitle'])
 
@@ -218,7 +238,7 @@ def test_filter_preferences_show_current():
 def test_filter_preferences_show_current_valid_only():
     """should not show invalid current preference values"""
     results = yvs.get_result_list('')
-    nose.assert_equal(len(results), 5)
+    nose.assert_equal(len(results), 6)
     nose.assert_in('currently', results[0]['subtitle'])
     nose.assert_not_in('currently', results[1]['subtitle'])
 
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import nose.tools as nose
+from mock import patch
+
+import yvs.filter_refs as yvs
+from tests import set_up, tear_down
+from tests.decorators import use_user_prefs
+
+QUERY_STRS = ['john 3:16', 'xyz', '1 cor 13.4-7 esv', 'a 3', '']
+
+
+@nose.with_setup(set_up, tear_down)
+def test_batch_order():
+    """should return result lists in the same order as the queries"""
+    result_lists = yvs.get_result_lists(QUERY_STRS)
+    nose.assert_equal(
+        result_lists,
+        [yvs.get_result_list(query_str) for query_str in QUERY_STRS])
+    nose.assert_equal(result_lists[0][0]['title'], 'John 3:16 (NIV)')
+    nose.assert_equal(result_lists[1], [])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_batch_empty():
+    """should return no result lists for no queries"""
+    nose.assert_equal(yvs.get_result_lists([]), [])
+
+
+@nose.with_setup(set_up, tear_down)
+@use_user_prefs({'language': 'eng', 'version': 59, 'copybydefault': False})
+def test_batch_load_once():
+    """should only load preferences and bible data once per batch"""
+    with patch('yvs.core.get_bible', wraps=yvs.core.get_bible) as get_bible:
+        with patch('yvs.core.get_book_metadata',
+                   wraps=yvs.core.get_book_metadata) as get_book_metadata:
+            result_lists = yvs.get_result_lists(QUERY_STRS)
+            get_bible.assert_called_once_with('eng')
+            get_book_metadata.assert_called_once_with()
+    yvs.core.get_user_prefs.assert_called_once_with()
+    nose.assert_equal(result_lists[0][0]['title'], 'John 3:16 (ESV)')
@@ -4,6 +4,7 @@
 from __future__ import print_function, unicode_literals
 
 import nose.tools as nose
+from mock import patch
 
 import yvs.filter_refs as yvs
 from tests import set_up, tear_down
@@ -89,3 +90,15 @@ def test_nonexistent():
     """should not match nonexistent books"""
     results = yvs.get_result_list('xyz')
     nose.assert_equal(len(results), 0)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_book_name_index_reuse():
+    """should only split book names once per load of the bible data"""
+    with patch('yvs.filter_refs.split_book_name_into_parts',
+               wraps=yvs.split_book_name_into_parts) as split_book_name:
+        yvs.get_result_list('luke')
+        yvs.get_result_list('john')
+        nose.assert_equal(
+            split_book_name.call_count,
+            len(yvs.core.get_bible('eng')['books']))
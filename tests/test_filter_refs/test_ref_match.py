@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import random
+import re
+
+import nose.tools as nose
+
+import yvs.filter_refs as yvs
+
+# The characters from which the random query strings below are generated
+QUERY_CHARS = 'abcjnosz  ' '0123456789  ' 'éäßЖ路加經' '٣²' ':.-!_'
+
+# Query strings exercised by the rest of the filter_refs tests
+TEST_QUERY_STRS = [
+    'luk', 'Matthew', 'r', '1 cor', '2', 'c', 'la', 'philippians', 'xyz',
+    'matthew 5', 'a 3', 'luke 4', 'ps 0', '', '!!!', '  romans  8  28  nl  ',
+    '!1@co#13$4^7&es*', '2 co 3 x y z 1 2 3', 'é 3', 'é', '1 ch',
+    'john 3:16', 'matthew 6:34', 'Psalms 19:', 'Psalms 19.', 'Psalms 19.7-',
+    'genesis 50:20', 'a 25:2', 'a 2:50', 'a 2:4-51', 'ps 23.7-9', 'mat 4',
+    'gá 4', 'mat 5.3', 'ph 4', '1co', '1 co13', '1 co 13esv', '創世記1:3次經',
+    'luke 4:8', 'a 3:2', 'luke 4.8', 'luke 4 8', '1 cor 13.4-7',
+    '1 cor 13.4-3', 'ps 23:0', 'lucas 4:8 rvr1', '路加 4:8 cunp-上',
+    'e 4:8 esv', '1 peter 5:7    esv', 'luke 4:8 es', 'luke 4:8 c',
+    'hosea 6:3 nlab', 'hosea 6:3 amp', 'hosea 6:3 xyz', 'malachi 3:2 esv'
+]
+
+
+# The original regular expression implementation of get_ref_match, used as a
+# reference for the hand-written tokenizer
+def get_ref_match_regex(query_str):
+    patt = '^{book}(?:{chapter}(?:{verse}{endverse})?{version})?$'.format(
+        book=r'(\d?(?:[^\W\d_]|\s)+|\d)\s?',
+        chapter=r'(\d+)\s?',
+        verse=r'(\d+)\s?',
+        endverse=r'(\d+)?\s?',
+        version=r'([^\W\d_](?:[^\W\d_]\d*|\s)*)?.*?')
+    ref_match = re.search(patt, query_str, flags=re.UNICODE)
+    return ref_match.groups() if ref_match else None
+
+
+def check_ref_match(query_str):
+    nose.assert_equal(
+        yvs.get_ref_match(query_str), get_ref_match_regex(query_str),
+        'different match for {!r}'.format(query_str))
+
+
+def test_ref_match_test_queries():
+    """should tokenize test queries identically to regular expression"""
+    for query_str in TEST_QUERY_STRS:
+        check_ref_match(query_str)
+        check_ref_match(yvs.normalize_query_str(query_str))
+
+
+def test_ref_match_generated_queries():
+    """should tokenize generated queries identically to regular expression"""
+    query_random = random.Random(531)
+    for i in xrange(5000):
+        query_str = ''.join(
+            query_random.choice(QUERY_CHARS)
+            for c in xrange(query_random.randint(0, 12)))
+        check_ref_match(query_str)
+        check_ref_match(yvs.normalize_query_str(query_str))
+
+
+def test_ref_match_structured_queries():
+    """should tokenize reference-like queries identically to regex"""
+    query_random = random.Random(316)
+    parts = ['1', '2', '23', 'co', 'cor', 'ps', 'song of', 'é', 'esv',
+             'rvr1960', 'cunp 上', ' ', ' ', ':', '.', '-']
+    for i in xrange(5000):
+        query_str = ''.join(
+            query_random.choice(parts)
+            for p in xrange(query_random.randint(1, 8)))
+        check_ref_match(query_str)
+        check_ref_match(yvs.normalize_query_str(query_str))
+
+
+def test_normalize_query_str_shorthand():
+    """should separate digits from letters in shorthand references"""
+    nose.assert_equal(yvs.normalize_query_str('1co13esv'), '1 co13 esv')
+    nose.assert_equal(yvs.normalize_query_str(' 1CO 13:4-7 '), '1 co 13 4 7')
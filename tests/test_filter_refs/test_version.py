@@ -3,6 +3,9 @@
 
 from __future__ import print_function, unicode_literals
 
+import glob
+import os.path
+
 import nose.tools as nose
 
 import yvs.filter_refs as yvs
@@ -95,3 +98,41 @@ def test_id():
     results = yvs.get_result_list('malachi 3:2 esv')
     nose.assert_equal(results[0]['uid'], 'yvs-59/mal.3.2')
     nose.assert_equal(len(results), 1)
+
+
+# The original linear-scan implementation of guess_version, used as a
+# reference for the indexed implementation
+def guess_version_linear(versions, version_query):
+    for i in xrange(len(version_query), 0, -1):
+        for version in versions:
+            normalized_version_name = yvs.normalize_query_str(version['name'])
+            if normalized_version_name == version_query[:i]:
+                return version
+    for i in xrange(len(version_query), 0, -1):
+        for version in versions:
+            normalized_version_name = yvs.normalize_query_str(version['name'])
+            if (normalized_version_name.startswith(version_query[:i])):
+                return version
+    return None
+
+
+@nose.with_setup(set_up, tear_down)
+def test_guess_version_differential():
+    """should guess the same versions as a linear scan of all versions"""
+    for bible_path in glob.glob('yvs/data/bible/bible-*.json'):
+        language_id = os.path.basename(bible_path)[len('bible-'):-len('.json')]
+        bible = yvs.core.get_bible(language_id)
+        version_queries = ['', 'x', 'xyz', '1', 'a b c', 'n', 'nl', 'nlab']
+        for version in bible['versions']:
+            version_name = yvs.normalize_query_str(version['name'])
+            for i in xrange(1, len(version_name) + 1):
+                version_queries.append(version_name[:i])
+                version_queries.append(version_name[:i] + 'x')
+                version_queries.append(version_name[:i] + ' 1')
+                version_queries.append(version_name[:i - 1] + 'z')
+        for version_query in version_queries:
+            nose.assert_equal(
+                yvs.guess_version(bible, version_query),
+                guess_version_linear(bible['versions'], version_query),
+                'different version guessed for {!r} ({})'.format(
+                    version_query, language_id))
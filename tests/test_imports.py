@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import json
+import subprocess
+import sys
+
+import nose.tools as nose
+
+# The maximum number of seconds of CPU time any entry point may take to import;
+# the budget is generous (entry points import in well under half of it), and
+# is checked against the fastest of several imports, so that noise on a busy
+# machine does not fail the check (CPU time is measured rather than elapsed
+# time, since it does not grow while other processes hog the CPU)
+IMPORT_TIME_BUDGET = 0.1
+# The number of times each entry point is imported when checking its import
+# time
+NUM_IMPORT_MEASUREMENTS = 5
+
+# Modules which are expensive to import, and which no entry point should import
+# until they are actually needed
+HEAVY_MODULES = {'gzip', 'httplib', 'shutil', 'ssl', 'urllib', 'urllib2'}
+# Modules only needed by entry points which use the cache; the cache database
+# itself (and with it sqlite3) is only needed once an entry is read or written
+CACHE_MODULES = {'fcntl', 'sqlite3'}
+
+# Measures the import of the given module in a fresh interpreter, reporting
+# the CPU time taken and the names of all modules imported as a result
+IMPORT_MEASUREMENT_SCRIPT = """
+import json
+import sys
+import time
+start_time = time.clock()
+import {module_name}
+print(json.dumps({{
+    'import_time': time.clock() - start_time,
+    'modules': [name for name, module in sys.modules.items() if module]
+}}))
+"""
+
+
+def measure_import(module_name):
+    return json.loads(subprocess.check_output([
+        sys.executable, '-c',
+        IMPORT_MEASUREMENT_SCRIPT.format(module_name=module_name)]))
+
+
+def check_import(module_name, disallowed_modules):
+    measurements = [measure_import(module_name)
+                    for i in range(NUM_IMPORT_MEASUREMENTS)]
+    nose.assert_less(
+        min(measurement['import_time'] for measurement in measurements),
+        IMPORT_TIME_BUDGET, '{} took too long to import'.format(module_name))
+    nose.assert_equal(
+        disallowed_modules.intersection(measurements[0]['modules']),
+        set(), '{} imported heavy modules'.format(module_name))
+
+
+def test_import_filter_refs():
+    """filter_refs should import quickly without heavy modules"""
+    check_import('yvs.filter_refs',
+                 HEAVY_MODULES | CACHE_MODULES | {'HTMLParser', 'hashlib'})
+
+
+def test_import_filter_prefs():
+    """filter_prefs should import quickly without heavy modules"""
+    check_import('yvs.filter_prefs',
+                 HEAVY_MODULES | CACHE_MODULES | {'HTMLParser', 'hashlib'})
+
+
+def test_import_search_refs():
+    """search_refs should import quickly without networking modules"""
+    check_import('yvs.search_refs', HEAVY_MODULES | {'sqlite3'})
+
+
+def test_import_copy_ref():
+    """copy_ref should import quickly without networking modules"""
+    check_import('yvs.copy_ref', HEAVY_MODULES | {'sqlite3'})
+
+
+def test_import_set_pref():
+    """set_pref should import quickly without heavy modules"""
+    check_import('yvs.set_pref',
+                 HEAVY_MODULES | CACHE_MODULES | {'HTMLParser'})
+
+
+def test_import_client():
+    """client should import quickly without any workflow modules"""
+    check_import('yvs.client', HEAVY_MODULES | CACHE_MODULES |
+                 {'HTMLParser', 'yvs.core'})
+
+
+def test_import_clear_cache():
+    """clear_cache should import quickly without the cache database"""
+    check_import('yvs.clear_cache', HEAVY_MODULES | {'HTMLParser', 'sqlite3'})
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import json
+
+import nose.tools as nose
+from mock import patch
+
+import yvs.inspect_cache as yvs
+from tests import set_up, tear_down
+from tests.decorators import redirect_stdout
+
+
+def add_cache_entries():
+    yvs.cache.add_cache_entry('111/psa.23.html', 'x' * 3000)
+    yvs.cache.add_cache_entry('111/psa.23.json', 'x' * 500)
+    yvs.cache.add_cache_entry('59/jhn.3.html', 'x' * 2000)
+    yvs.cache.add_cache_entry('111/love others.html', 'x' * 100)
+    yvs.cache.get_cache_entry_content('111/psa.23.html')
+    yvs.cache.get_cache_entry_content('59/jhn.3.html')
+    yvs.cache.get_cache_entry_content('59/jhn.4.html')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_entry_type():
+    """should determine type of cache entry from its key"""
+    nose.assert_equal(yvs.get_entry_type('111/psa.23.html'), 'chapters')
+    nose.assert_equal(yvs.get_entry_type('111/1co.13.html'), 'chapters')
+    nose.assert_equal(yvs.get_entry_type('111/psa.23.json'), 'parsed chapters')
+    nose.assert_equal(
+        yvs.get_entry_type('111/love others.html'), 'search results')
+    nose.assert_equal(
+        yvs.get_entry_type('111/1 john 3.html'), 'search results')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_hit_ratio():
+    """should show hit ratio of cache"""
+    add_cache_entries()
+    results = yvs.get_result_list()
+    nose.assert_equal(results[0]['title'], 'Hit ratio: 67%')
+    nose.assert_equal(
+        results[0]['subtitle'], '2 hits, 1 misses (4.9 KB served from cache)')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_hit_ratio_empty():
+    """should not show hit ratio if cache has never been used"""
+    results = yvs.get_result_list()
+    nose.assert_equal(results[0]['title'], 'Hit ratio: n/a')
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.cache.get_max_cache_size', return_value=5500)
+def test_size(get_max_cache_size):
+    """should show size of cache"""
+    add_cache_entries()
+    results = yvs.get_result_list()
+    nose.assert_equal(results[1]['title'], 'Size: 2.5 KB of 5.4 KB')
+    nose.assert_equal(
+        results[1]['subtitle'], '3 entries (5.5 KB written, 1 evicted)')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_entry_types():
+    """should show number of entries of each type"""
+    add_cache_entries()
+    results = yvs.get_result_list()
+    nose.assert_equal(
+        [(result['title'], result['subtitle']) for result in results[2:5]], [
+            ('Chapters: 2 entries', '4.9 KB'),
+            ('Parsed chapters: 1 entries', '500 B'),
+            ('Search results: 1 entries', '100 B')])
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.inspect_cache.NUM_LARGEST_ENTRIES', 2)
+def test_largest_entries():
+    """should show largest entries in cache"""
+    add_cache_entries()
+    results = yvs.get_result_list()
+    nose.assert_equal(len(results), 7)
+    nose.assert_equal(
+        [result['title'] for result in results[5:]],
+        ['111/psa.23.html', '59/jhn.3.html'])
+    nose.assert_equal(
+        results[5]['subtitle'], 'One of the largest entries (2.9 KB)')
+
+
+@nose.with_setup(set_up, tear_down)
+@redirect_stdout
+def test_main(out):
+    """should print cache results in Alfred feedback format"""
+    yvs.main()
+    feedback_str = out.getvalue()
+    results = json.loads(feedback_str)['items']
+    nose.assert_equal(results[0]['title'], 'Hit ratio: n/a')
+    nose.assert_equal(results[0]['valid'], False)
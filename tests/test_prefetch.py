@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import json
+
+import nose.tools as nose
+from mock import patch
+
+import yvs.cache as cache
+import yvs.core as core
+import yvs.prefetch as prefetch
+from tests import set_up, tear_down
+
+with open('tests/html/psa.23.html') as html_file:
+    html_content = html_file.read()
+
+
+def get_ref(ref_uid):
+    return core.get_ref(ref_uid, core.get_user_prefs())
+
+
+@nose.with_setup(set_up, tear_down)
+def test_adjacent_chapters():
+    """should retrieve chapters before and after chapter"""
+    nose.assert_equal(prefetch.get_adjacent_chapter_ids(
+        'jhn', 3, core.get_bible('eng'), core.get_book_metadata()),
+        ['jhn.2', 'jhn.4'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_adjacent_chapters_across_books():
+    """should retrieve adjacent chapters of neighboring books"""
+    bible = core.get_bible('eng')
+    book_metadata = core.get_book_metadata()
+    nose.assert_equal(prefetch.get_adjacent_chapter_ids(
+        'mrk', 1, bible, book_metadata), ['mat.28', 'mrk.2'])
+    nose.assert_equal(prefetch.get_adjacent_chapter_ids(
+        'jhn', 21, bible, book_metadata), ['jhn.20', 'act.1'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_adjacent_chapters_bible_bounds():
+    """should not retrieve chapters beyond start or end of Bible"""
+    bible = core.get_bible('eng')
+    book_metadata = core.get_book_metadata()
+    nose.assert_equal(prefetch.get_adjacent_chapter_ids(
+        'gen', 1, bible, book_metadata), ['gen.2'])
+    nose.assert_equal(prefetch.get_adjacent_chapter_ids(
+        'rev', 22, bible, book_metadata), ['rev.21'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_record_chapter_transition():
+    """should count chapters copied after each chapter"""
+    for chapter_id in ('jhn.3', 'rom.8', 'jhn.3', 'rom.8', 'jhn.3'):
+        prefetch.record_chapter_transition(chapter_id)
+    transitions = prefetch.get_chapter_transitions()
+    nose.assert_equal(transitions['last'], 'jhn.3')
+    nose.assert_equal(transitions['next'], {
+        'jhn.3': {'rom.8': 2}, 'rom.8': {'jhn.3': 2}})
+    nose.assert_equal(
+        prefetch.get_likely_next_chapter_id(transitions, 'jhn.3'), 'rom.8')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_record_chapter_transition_limit():
+    """should only remember most frequent chapters copied after chapter"""
+    for chapter_num in range(1, prefetch.MAX_TRANSITIONS_PER_CHAPTER + 2):
+        prefetch.record_chapter_transition('jhn.3')
+        prefetch.record_chapter_transition('rom.{}'.format(chapter_num))
+        prefetch.record_chapter_transition('jhn.3')
+        prefetch.record_chapter_transition('rom.{}'.format(chapter_num))
+    next_counts = prefetch.get_chapter_transitions()['next']['jhn.3']
+    nose.assert_equal(
+        len(next_counts), prefetch.MAX_TRANSITIONS_PER_CHAPTER)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_prefetch_likely_next_chapter():
+    """should prefetch chapter frequently copied after copied chapter"""
+    transitions = {'last': 'rom.8', 'next': {'jhn.3': {'rom.8': 2}}}
+    nose.assert_equal(prefetch.get_prefetch_chapter_uids(
+        get_ref('111/jhn.3.16'), core.get_user_prefs(), transitions),
+        ['111/jhn.2', '111/jhn.4', '111/rom.8'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_prefetch_unlikely_next_chapter():
+    """should not prefetch chapter rarely copied after copied chapter"""
+    transitions = {'last': 'rom.8', 'next': {'jhn.3': {'rom.8': 1}}}
+    nose.assert_equal(prefetch.get_prefetch_chapter_uids(
+        get_ref('111/jhn.3.16'), core.get_user_prefs(), transitions),
+        ['111/jhn.2', '111/jhn.4'])
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.core.start_background_process')
+def test_start_prefetch(start_background_process):
+    """should pass copied reference to background prefetch process"""
+    prefetch.start_prefetch('111/jhn.3.16')
+    start_background_process.assert_called_once_with(
+        'yvs.prefetch', ['111/jhn.3.16'])
+    nose.assert_is_none(prefetch.get_chapter_transitions()['last'])
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.prefetch.prefetch_chapters')
+def test_main_cached(prefetch_chapters):
+    """should not prefetch if adjacent chapters are cached"""
+    cache.add_cache_entry('111/jhn.2.json', '[]')
+    cache.add_cache_entry('111/jhn.4.html', '<html></html>')
+    prefetch.main('111/jhn.3.16')
+    prefetch_chapters.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.prefetch.prefetch_chapters')
+def test_main_budget_exhausted(prefetch_chapters):
+    """should not prefetch if daily budget has been used up"""
+    prefetch.add_num_prefetched_bytes(prefetch.PREFETCH_DAILY_BYTE_BUDGET)
+    prefetch.main('111/jhn.3.16')
+    prefetch_chapters.assert_not_called()
+    nose.assert_equal(prefetch.get_chapter_transitions()['last'], 'jhn.3')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_add_num_prefetched_bytes():
+    """should accumulate number of bytes prefetched today"""
+    prefetch.add_num_prefetched_bytes(100)
+    prefetch.add_num_prefetched_bytes(50)
+    nose.assert_equal(prefetch.get_num_prefetched_bytes(), 150)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_num_prefetched_bytes_reset_daily():
+    """should not count bytes prefetched on previous days"""
+    with open(prefetch.get_prefetch_budget_path(), 'w') as budget_file:
+        json.dump({'date': '2000-01-01', 'num_bytes': 100}, budget_file)
+    nose.assert_equal(prefetch.get_num_prefetched_bytes(), 0)
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.get_url_body', return_value=(html_content, 'identity'))
+def test_main(get_url_body):
+    """should record copy and prefetch adjacent chapters as prefetch process"""
+    prefetch.main('111/psa.23.1')
+    nose.assert_equal(prefetch.get_chapter_transitions()['last'], 'psa.23')
+    nose.assert_true(cache.has_cache_entry('111/psa.22.html'))
+    nose.assert_true(cache.has_cache_entry('111/psa.24.html'))
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.get_url_body', return_value=(html_content, 'identity'))
+def test_prefetch_chapters(get_url_body):
+    """should fetch, cache, and parse prefetched chapters"""
+    prefetch.prefetch_chapters(['111/psa.23'])
+    nose.assert_equal(
+        cache.get_cache_entry_content('111/psa.23.html').encode('utf-8'),
+        html_content)
+    nose.assert_true(cache.has_cache_entry('111/psa.23.json'))
+    nose.assert_equal(
+        prefetch.get_num_prefetched_bytes(), len(html_content))
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.get_url_body', return_value=(html_content, 'identity'))
+def test_prefetch_chapters_budget_exhausted(get_url_body):
+    """should stop prefetching once daily budget has been used up"""
+    with patch('yvs.prefetch.PREFETCH_DAILY_BYTE_BUDGET', len(html_content)):
+        prefetch.prefetch_chapters(['111/psa.23', '111/psa.24'])
+    nose.assert_equal(get_url_body.call_count, 1)
+    nose.assert_false(cache.has_cache_entry('111/psa.24.html'))
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.get_url_body', return_value=(html_content, 'identity'))
+def test_prefetch_chapters_slots_taken(get_url_body):
+    """should not prefetch if too many prefetch processes are running"""
+    slot_files = [prefetch.acquire_prefetch_slot()
+                  for slot_num in range(prefetch.MAX_PREFETCH_PROCESSES)]
+    try:
+        nose.assert_is_none(prefetch.acquire_prefetch_slot())
+        prefetch.prefetch_chapters(['111/psa.23'])
+    finally:
+        for slot_file in slot_files:
+            slot_file.close()
+    get_url_body.assert_not_called()
@@ -6,25 +6,25 @@
 import json
 
 import nose.tools as nose
-from mock import Mock, NonCallableMock, patch
+from mock import patch
 
 import tests
 import yvs.search_refs as yvs
 from tests.decorators import redirect_stdout, use_user_prefs
 
 with open('tests/html/search.html') as html_file:
-    patch_urlopen = patch(
-        'urllib2.urlopen', return_value=NonCallableMock(
-            read=Mock(return_value=html_file.read())))
+    patch_get_url_body = patch(
+        'yvs.web.get_url_body',
+        return_value=(html_file.read(), 'identity'))
 
 
 def set_up():
-    patch_urlopen.start()
+    patch_get_url_body.start()
     tests.set_up()
 
 
 def tear_down():
-    patch_urlopen.stop()
+    patch_get_url_body.stop()
     tests.tear_down()
 
 
@@ -59,11 +59,11 @@ def test_result_arg():
 
 
 @nose.with_setup(set_up, tear_down)
-@patch('yvs.web.get_url_content', return_value='abc')
-def test_unicode_input(get_url_content):
+@patch('yvs.web.get_url_body', return_value=(b'abc', 'identity'))
+def test_unicode_input(get_url_body):
     """should correctly handle non-ASCII characters in query string"""
     yvs.get_result_list('é')
-    get_url_content.assert_called_once_with(
+    get_url_body.assert_called_once_with(
         'https://www.bible.com/search/bible?q=%C3%A9&version_id=111')
 
 
@@ -71,9 +71,33 @@ def test_unicode_input(get_url_content):
 def test_cache_url_content():
     """should cache search URL content after first fetch"""
     yvs.get_result_list('love others')
-    with patch('urllib2.Request') as request:
+    with patch('yvs.web.get_url_body') as get_url_body:
         yvs.get_result_list('love others')
-        request.assert_not_called()
+        get_url_body.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.refresh_cached_url_content')
+def test_fresh_cache_url_content(refresh_cached_url_content):
+    """should not refresh cached search URL content before it expires"""
+    yvs.get_result_list('love others')
+    yvs.get_result_list('love others')
+    refresh_cached_url_content.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.search_refs.SEARCH_HTML_TTL', 0)
+@patch('yvs.web.refresh_cached_url_content')
+def test_refresh_expired_cache_url_content(refresh_cached_url_content):
+    """should show expired search results while refreshing them"""
+    results = yvs.get_result_list('love others')
+    with patch('yvs.web.get_url_body') as get_url_body:
+        nose.assert_equal(yvs.get_result_list('love others'), results)
+        nose.assert_equal(yvs.get_result_list('love others'), results)
+        get_url_body.assert_not_called()
+    refresh_cached_url_content.assert_called_once_with(
+        'https://www.bible.com/search/bible?q=love+others&version_id=111',
+        '111/love others.html', ttl=0)
 
 
 @nose.with_setup(set_up, tear_down)
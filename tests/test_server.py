@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+
+import nose.tools as nose
+from mock import patch
+
+import tests
+import yvs.client as client
+import yvs.filter_refs as filter_refs
+import yvs.server as yvs
+from tests.decorators import redirect_stdout
+
+server_dir_path = tempfile.mkdtemp(prefix='yvs-server-')
+server_dir_patcher = patch(
+    'yvs.client.SERVER_DIR_PATH', server_dir_path)
+server_socket_patcher = patch(
+    'yvs.client.SERVER_SOCKET_PATH',
+    os.path.join(server_dir_path, 'server.sock'))
+
+
+def set_up():
+    server_dir_patcher.start()
+    server_socket_patcher.start()
+    tests.set_up()
+
+
+def tear_down():
+    tests.tear_down()
+    shutil.rmtree(server_dir_path, ignore_errors=True)
+    server_socket_patcher.stop()
+    server_dir_patcher.stop()
+
+
+# Runs the given test with the resident server listening in the background
+def with_server(func):
+    def wrapper(*args, **kwargs):
+        server = yvs.create_server()
+        server_thread = threading.Thread(
+            target=server.serve_forever, kwargs={'poll_interval': 0.01})
+        server_thread.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            server.shutdown()
+            server.server_close()
+            server_thread.join()
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+@nose.with_setup(set_up, tear_down)
+@with_server
+def test_server_output():
+    """should respond with output of the requested script filter"""
+    server_output = client.get_server_output('filter_refs', ['john 3'])
+    nose.assert_equal(
+        server_output, yvs.get_entry_point_output('filter_refs', ['john 3']))
+    nose.assert_equal(
+        server_output.rstrip(),
+        filter_refs.core.get_result_list_feedback_str(
+            filter_refs.get_result_list('john 3')))
+
+
+@nose.with_setup(set_up, tear_down)
+@with_server
+@patch('yvs.server.get_entry_point_output', return_value=b'server output')
+@redirect_stdout
+def test_client_main(out, get_entry_point_output):
+    """client should print output received from server"""
+    client.main('filter_refs', ['john 3'])
+    get_entry_point_output.assert_called_once_with('filter_refs', ['john 3'])
+    nose.assert_equal(out.getvalue(), b'server output')
+
+
+@nose.with_setup(set_up, tear_down)
+@with_server
+def test_server_unknown_module():
+    """should not respond to requests for unknown modules"""
+    nose.assert_is_none(client.get_server_output('clear_cache', []))
+
+
+@nose.with_setup(set_up, tear_down)
+@with_server
+@patch('yvs.server.ResidentServer.handle_error')
+@patch('yvs.filter_refs.main', side_effect=Exception)
+def test_server_error(main, handle_error):
+    """should not respond if script filter raises an exception"""
+    nose.assert_is_none(client.get_server_output('filter_refs', ['john 3']))
+
+
+@nose.with_setup(set_up, tear_down)
+@with_server
+def test_server_running():
+    """should detect that server is already running"""
+    nose.assert_true(yvs.is_server_running())
+    with patch('yvs.server.create_server') as create_server:
+        yvs.main()
+        create_server.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.server.ResidentServer.timeout', 0.01)
+def test_main_idle():
+    """should shut down and remove socket once server is idle"""
+    yvs.main()
+    nose.assert_false(
+        os.path.exists(client.SERVER_SOCKET_PATH), 'server socket exists')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_create_server_stale_socket():
+    """should replace socket left behind by server which did not exit"""
+    os.mkdir(client.SERVER_DIR_PATH)
+    with open(client.SERVER_SOCKET_PATH, 'w'):
+        pass
+    server = yvs.create_server()
+    server.server_close()
+    nose.assert_true(
+        os.path.exists(client.SERVER_SOCKET_PATH), 'server socket missing')
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.client.is_server_dir_trusted', return_value=False)
+def test_create_server_untrusted(is_server_dir_trusted):
+    """should refuse to listen in directory owned by another user"""
+    with nose.assert_raises(OSError):
+        yvs.create_server()
@@ -4,11 +4,10 @@
 from __future__ import print_function, unicode_literals
 
 import json
-import os
-import os.path
 
 import nose.tools as nose
 
+import yvs.cache as cache
 import yvs.set_pref as yvs
 from tests import set_up, tear_down
 from tests.decorators import redirect_stdout
@@ -41,16 +40,13 @@ def test_set_nonexistent():
 
 
 @nose.with_setup(set_up, tear_down)
-def test_set_language_clear_cache():
-    """should clear cache when setting language"""
-    nose.assert_true(
-        os.path.exists(yvs.cache.LOCAL_CACHE_DIR_PATH),
-        'local cache directory does not exist')
-    yvs.cache.add_cache_entry('foo', 'blah blah')
+def test_set_language_keep_cache():
+    """should keep cache when setting language"""
+    cache.add_cache_entry('111/psa.23.html', 'blah blah')
     yvs.set_pref('language', 'spa')
-    nose.assert_false(
-        os.path.exists(yvs.cache.LOCAL_CACHE_DIR_PATH),
-        'local cache directory exists')
+    yvs.set_pref('language', 'eng')
+    nose.assert_equal(
+        cache.get_cache_entry_content('111/psa.23.html'), 'blah blah')
 
 
 @nose.with_setup(set_up, tear_down)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import os
+import os.path
+import shutil
+import tempfile
+
+import nose.tools as nose
+from mock import patch
+
+import tests
+import yvs.cache as cache
+import yvs.copy_ref as copy_ref
+import yvs.prefetch as prefetch
+import yvs.version_pack as version_pack
+from tests.decorators import redirect_stdout
+
+with open('tests/html/psa.23.html') as html_file:
+    html_content = html_file.read()
+
+temp_dir_path = os.path.join(tempfile.gettempdir(), 'yvs-packs')
+pack_path = os.path.join(temp_dir_path, 'niv.yvspack')
+
+
+def set_up():
+    tests.set_up()
+    os.mkdir(temp_dir_path)
+
+
+def tear_down():
+    shutil.rmtree(temp_dir_path)
+    tests.tear_down()
+
+
+def get_chapter_parts():
+    parser = copy_ref.ChapterParser()
+    parser.feed(html_content.decode('utf-8'))
+    return parser.chapter_parts
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_chapter_parts():
+    """should read chapter parts from imported pack"""
+    version_pack.write_version_pack(version_pack.build_version_pack(
+        111, {('psa', 23): get_chapter_parts()}), pack_path)
+    version_pack.import_version_pack(pack_path)
+    nose.assert_equal(
+        version_pack.get_chapter_parts(111, 'psa', 23), get_chapter_parts())
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_missing_chapter_parts():
+    """should return None for chapter missing from imported pack"""
+    version_pack.write_version_pack(version_pack.build_version_pack(
+        111, {('psa', 23): get_chapter_parts()}), pack_path)
+    version_pack.import_version_pack(pack_path)
+    nose.assert_is_none(version_pack.get_chapter_parts(111, 'psa', 24))
+    nose.assert_is_none(version_pack.get_chapter_parts(111, 'psa', 151))
+    nose.assert_is_none(version_pack.get_chapter_parts(111, 'xyz', 1))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_chapter_parts_no_pack():
+    """should return None if version has no imported pack"""
+    nose.assert_is_none(version_pack.get_chapter_parts(111, 'psa', 23))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_chapter_parts_corrupted_pack():
+    """should return None if imported pack is corrupted"""
+    os.mkdir(version_pack.get_version_packs_dir_path())
+    for pack in (b'', b'YVSPACK\0', b'x' * 100):
+        with open(version_pack.get_version_pack_path(111), 'wb') as pack_file:
+            pack_file.write(pack)
+        nose.assert_is_none(version_pack.get_chapter_parts(111, 'psa', 23))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_import_invalid_pack():
+    """should refuse to import file which is not a version pack"""
+    with open(pack_path, 'wb') as pack_file:
+        pack_file.write(html_content)
+    with nose.assert_raises(ValueError):
+        version_pack.import_version_pack(pack_path)
+    nose.assert_false(os.path.exists(version_pack.get_version_pack_path(111)))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_export_cached_chapters():
+    """should export pack from cached chapters"""
+    cache.add_cache_entry('111/psa.23.html', html_content.decode('utf-8'))
+    nose.assert_equal(version_pack.export_version_pack(111, pack_path), 1)
+    nose.assert_equal(version_pack.import_version_pack(pack_path), 111)
+    nose.assert_equal(
+        version_pack.get_chapter_parts(111, 'psa', 23), get_chapter_parts())
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.get_url_response')
+def test_export_cached_chapters_missing_entry(get_url_response):
+    """should skip chapters evicted from cache without fetching them"""
+    cache.add_cache_entry('111/psa.23.html', html_content.decode('utf-8'))
+    cache_stats = cache.get_cache_stats()
+    cache_stats['entries'].append({'key': '111/psa.24.html', 'size': 100})
+    with patch('yvs.cache.get_cache_stats', return_value=cache_stats):
+        nose.assert_equal(version_pack.export_version_pack(111, pack_path), 1)
+    get_url_response.assert_not_called()
+    cache_stats = cache.get_cache_stats()
+    nose.assert_equal(
+        (cache_stats['num_hits'], cache_stats['num_misses']), (0, 0))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_export_saved_chapters():
+    """should export pack from directory of saved chapter pages"""
+    html_dir_path = os.path.join(temp_dir_path, 'html')
+    os.mkdir(html_dir_path)
+    shutil.copy('tests/html/psa.23.html',
+                os.path.join(html_dir_path, 'PSA.23.html'))
+    shutil.copy('tests/html/psa.23.html',
+                os.path.join(html_dir_path, 'notes.html'))
+    nose.assert_equal(version_pack.export_version_pack(
+        111, pack_path, html_dir_path=html_dir_path), 1)
+    version_pack.import_version_pack(pack_path)
+    nose.assert_equal(
+        version_pack.get_chapter_parts(111, 'psa', 23), get_chapter_parts())
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.get_url_body')
+def test_copy_ref_offline(get_url_body):
+    """should copy reference from imported pack without network"""
+    version_pack.write_version_pack(version_pack.build_version_pack(
+        111, {('psa', 23): get_chapter_parts()}), pack_path)
+    version_pack.import_version_pack(pack_path)
+    ref_content = copy_ref.get_copied_ref('111/psa.23.2')
+    nose.assert_regexp_matches(ref_content, 'nunc nulla')
+    nose.assert_not_regexp_matches(ref_content, 'fermentum')
+    get_url_body.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+@redirect_stdout
+@patch('yvs.web.get_url_body')
+@patch('yvs.prefetch.prefetch_chapters')
+@patch('yvs.core.start_background_process')
+def test_copy_ref_no_prefetch(out, start_background_process, prefetch_chapters,
+                              get_url_body):
+    """should not prefetch chapters contained in imported pack"""
+    version_pack.write_version_pack(version_pack.build_version_pack(
+        111, {('psa', chapter): get_chapter_parts()
+              for chapter in (22, 23, 24)}), pack_path)
+    version_pack.import_version_pack(pack_path)
+    copy_ref.main('111/psa.23.1')
+    # Run the prefetch process which the copy started
+    process_args = start_background_process.call_args[0]
+    nose.assert_equal(process_args, ('yvs.prefetch', ['111/psa.23.1']))
+    prefetch.main(*process_args[1])
+    prefetch_chapters.assert_not_called()
+    get_url_body.assert_not_called()
+
+
+@nose.with_setup(set_up, tear_down)
+@redirect_stdout
+def test_main(out):
+    """should export and import packs from command line"""
+    cache.add_cache_entry('111/psa.23.html', html_content.decode('utf-8'))
+    version_pack.main(['export', '111', pack_path])
+    version_pack.main(['import', pack_path])
+    nose.assert_equal(out.getvalue().splitlines(), [
+        'Exported 1 chapters to {}'.format(pack_path).encode('utf-8'),
+        b'Imported pack for version 111'])
+    nose.assert_equal(
+        version_pack.get_chapter_parts(111, 'psa', 23), get_chapter_parts())
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.get_url_body', return_value=(html_content, 'identity'))
+def test_copy_ref_same_content(get_url_body):
+    """should copy same reference content from pack as from network"""
+    ref_content = copy_ref.get_copied_ref('111/psa.23')
+    version_pack.export_version_pack(111, pack_path)
+    shutil.rmtree(cache.LOCAL_CACHE_DIR_PATH)
+    version_pack.import_version_pack(pack_path)
+    nose.assert_equal(copy_ref.get_copied_ref('111/psa.23'), ref_content)
+    nose.assert_equal(get_url_body.call_count, 1)
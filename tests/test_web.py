@@ -3,67 +3,352 @@
 
 from __future__ import print_function, unicode_literals
 
+import BaseHTTPServer
+import httplib
+import os
+import socket
+import SocketServer
+import sys
+import threading
+import zlib
 from gzip import GzipFile
 from StringIO import StringIO
 
 import nose.tools as nose
-from mock import Mock, NonCallableMock, patch
+from mock import patch
 
 import tests
+import yvs.cache as cache
 import yvs.web as web
 
 
 with open('tests/html/psa.23.html') as html_file:
     html_content = html_file.read()
-    patch_urlopen = patch(
-        'urllib2.urlopen', return_value=NonCallableMock(
-            read=Mock(return_value=html_content)))
+
+
+def get_gzipped_content(content):
+    gzip_buf = StringIO()
+    with GzipFile(fileobj=gzip_buf, mode='wb') as gzip_file:
+        gzip_file.write(content)
+    return gzip_buf.getvalue()
+
+
+gzipped_content = get_gzipped_content(html_content)
+deflated_content = zlib.compress(html_content)
+# Some servers send raw deflate data (without a zlib header) instead
+raw_deflated_content = deflated_content[2:-4]
+# Content whose multi-byte characters are split across chunks when read
+unicode_content = '✓ é 中 '.encode('utf-8') * 1000
+
+
+# Serves the test chapter HTML over keep-alive connections, counting every
+# connection made to the server
+class ChapterRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Buffer each response so that it is sent all at once (as real servers
+    # do), since small writes to a kept-alive connection are otherwise delayed
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.num_connections += 1
+
+    def send_body(self, status, body, headers={}):
+        self.send_response(status)
+        self.send_header('Content-Length', len(body))
+        for header_name, header_value in headers.items():
+            self.send_header(header_name, header_value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.request_paths.append(self.path)
+        self.server.request_headers.append(dict(self.headers))
+        if self.path == '/redirect':
+            self.send_body(302, b'', {'Location': '/bible/59/psa.23'})
+        elif self.path == '/missing':
+            self.send_body(404, b'')
+        elif self.path == '/gzip':
+            self.send_body(200, gzipped_content, {'Content-Encoding': 'gzip'})
+        elif self.path == '/deflate':
+            self.send_body(200, deflated_content,
+                           {'Content-Encoding': 'deflate'})
+        elif self.path == '/rawdeflate':
+            self.send_body(200, raw_deflated_content,
+                           {'Content-Encoding': 'deflate'})
+        elif self.path == '/unicode':
+            self.send_body(200, get_gzipped_content(unicode_content),
+                           {'Content-Encoding': 'gzip'})
+        elif self.path == '/close':
+            self.send_body(200, html_content, {'Connection': 'close'})
+            self.close_connection = True
+        else:
+            self.send_body(200, html_content)
+        # Simulate a server which closes idle connections without warning
+        if self.server.close_silently:
+            self.close_connection = True
+
+    # Acts as a proxy which refuses to open tunnels
+    def do_CONNECT(self):
+        self.server.request_paths.append(self.path)
+        self.server.request_headers.append(dict(self.headers))
+        self.send_body(403, b'')
+
+    def log_message(self, *args):
+        pass
+
+
+class ChapterServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), ChapterRequestHandler)
+        self.num_connections = 0
+        self.request_paths = []
+        self.request_headers = []
+        self.close_silently = False
+
+    # Clients may close connections without reading entire responses
+    def handle_error(self, request, client_address):
+        pass
+
+
+server = None
+
+
+def get_server_url(path):
+    return 'http://127.0.0.1:{}{}'.format(server.server_address[1], path)
 
 
 def set_up():
-    patch_urlopen.start()
+    global server
+    server = ChapterServer()
+    threading.Thread(
+        target=server.serve_forever, kwargs={'poll_interval': 0.01}).start()
     tests.set_up()
 
 
 def tear_down():
-    patch_urlopen.stop()
+    web.close_pooled_connections()
+    server.shutdown()
+    server.server_close()
     tests.tear_down()
 
 
 @nose.with_setup(set_up, tear_down)
-@patch('urllib2.Request')
-def test_get_url_content(request):
+def test_get_url_content():
     """should fetch uncompressed URL content"""
-    url = 'https://www.bible.com/bible/59/psa.23'
-    web.get_url_content(url)
-    request.assert_called_once_with(url, headers={
-        'User-Agent': 'YouVersion Suggest',
-        'Accept-Encoding': 'gzip, deflate'
-    })
+    url_content = web.get_url_content(get_server_url('/bible/59/psa.23'))
+    nose.assert_equal(url_content.encode('utf-8'), html_content)
+    nose.assert_equal(server.request_headers[0]['user-agent'],
+                      'YouVersion Suggest')
+    nose.assert_equal(server.request_headers[0]['accept-encoding'],
+                      'gzip, deflate')
 
 
 @nose.with_setup(set_up, tear_down)
-@patch('urllib2.urlopen')
-@patch('urllib2.Request')
-def test_get_url_content_timeout(request, urlopen):
-    """should timeout URL content request after 3 seconds"""
-    web.get_url_content('https://www.bible.com/bible/59/psa.23')
-    urlopen.assert_called_once_with(request.return_value, timeout=5)
+def test_get_url_content_timeout():
+    """should timeout URL content request after 5 seconds"""
+    web.get_url_content(get_server_url('/bible/59/psa.23'))
+    connection = web.pooled_connections.values()[0][0][0]
+    nose.assert_equal(connection.timeout, 5)
 
 
 @nose.with_setup(set_up, tear_down)
-@patch('urllib2.Request')
-def test_get_url_content_compressed(request):
+def test_get_url_content_compressed():
     """should automatically decompress compressed URL content"""
-    url = 'https://www.bible.com/bible/59/psa.23'
-    gzip_buf = StringIO()
-    with GzipFile(fileobj=gzip_buf, mode='wb') as gzip_file:
-        gzip_file.write(html_content)
-    gzipped_content = gzip_buf.getvalue()
-    response_mock = NonCallableMock(
-        read=Mock(return_value=gzipped_content),
-        info=Mock(return_value=NonCallableMock(
-            get=Mock(return_value='gzip'))))
-    with patch('urllib2.urlopen', return_value=response_mock):
-        url_content = web.get_url_content(url).encode('utf-8')
-        nose.assert_equal(url_content, html_content)
+    url_content = web.get_url_content(get_server_url('/gzip'))
+    nose.assert_equal(url_content.encode('utf-8'), html_content)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_url_body_compressed():
+    """should keep compressed URL body compressed"""
+    nose.assert_equal(
+        web.get_url_body(get_server_url('/gzip')), (gzipped_content, 'gzip'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_url_content_deflated():
+    """should decompress deflated URL content"""
+    for path in ('/deflate', '/rawdeflate'):
+        url_content = web.get_url_content(get_server_url(path))
+        nose.assert_equal(url_content.encode('utf-8'), html_content)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_cached_url_content_deflated():
+    """should cache deflated URL content as text"""
+    url_content = web.get_cached_url_content(
+        get_server_url('/deflate'), 'foo')
+    nose.assert_equal(cache.get_cache_entry_content('foo'), url_content)
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.URL_CHUNK_SIZE', 7)
+def test_get_url_content_chunks():
+    """should decompress and decode URL content in chunks as it is read"""
+    url_content_chunks = list(
+        web.get_url_content_chunks(get_server_url('/unicode')))
+    nose.assert_less_equal(max(len(url_content_chunk) for url_content_chunk
+                               in url_content_chunks), 7)
+    nose.assert_equal(
+        ''.join(url_content_chunks), unicode_content.decode('utf-8'))
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.URL_CHUNK_SIZE', 7)
+def test_abandon_url_content_chunks():
+    """should not reuse connection if URL content is not read in full"""
+    url_content_chunks = web.get_url_content_chunks(
+        get_server_url('/unicode'))
+    next(url_content_chunks)
+    url_content_chunks.close()
+    url_content = web.get_url_content(get_server_url('/bible/59/psa.23'))
+    nose.assert_equal(url_content.encode('utf-8'), html_content)
+    nose.assert_equal(server.num_connections, 2)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_url_content_redirect():
+    """should follow redirects when fetching URL content"""
+    url_content = web.get_url_content(get_server_url('/redirect'))
+    nose.assert_equal(url_content.encode('utf-8'), html_content)
+    nose.assert_equal(server.num_connections, 1)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_url_content_error():
+    """should raise exception if URL content cannot be fetched"""
+    with nose.assert_raises(httplib.HTTPException):
+        web.get_url_content(get_server_url('/missing'))
+
+
+@nose.with_setup(set_up, tear_down)
+def test_reuse_connection():
+    """should reuse connection for consecutive requests to same host"""
+    for i in range(3):
+        web.get_url_content(get_server_url('/bible/59/psa.23'))
+    nose.assert_equal(server.num_connections, 1)
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('yvs.web.POOLED_CONNECTION_IDLE_TIMEOUT', 0)
+def test_idle_connection_timeout():
+    """should not reuse connection which has been idle for too long"""
+    for i in range(2):
+        web.get_url_content(get_server_url('/bible/59/psa.23'))
+    nose.assert_equal(server.num_connections, 2)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_max_pooled_connections():
+    """should close least recently released connection when pool is full"""
+    host = '127.0.0.1:{}'.format(server.server_address[1])
+    connections = []
+    for i in range(web.MAX_POOLED_CONNECTIONS_PER_HOST + 1):
+        connection, is_reused = web.get_pooled_connection('http', host)
+        connection.connect()
+        connections.append(connection)
+    for connection in connections:
+        web.release_pooled_connection('http', host, connection)
+    nose.assert_equal(
+        [connection for connection, release_time in
+         web.pooled_connections['http', host]],
+        connections[1:])
+    nose.assert_is_none(connections[0].sock)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_connection_close():
+    """should not reuse connection which server has asked to close"""
+    for i in range(2):
+        web.get_url_content(get_server_url('/close'))
+    nose.assert_equal(server.num_connections, 2)
+    nose.assert_equal(web.pooled_connections.values(), [[]])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_stale_connection():
+    """should retry request if server closed idle connection"""
+    server.close_silently = True
+    for i in range(2):
+        url_content = web.get_url_content(get_server_url('/bible/59/psa.23'))
+        nose.assert_equal(url_content.encode('utf-8'), html_content)
+    nose.assert_equal(server.num_connections, 2)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_http_proxy():
+    """should send HTTP requests via configured proxy"""
+    with patch('yvs.web.proxies', {'http': get_server_url('').replace(
+            '//', '//user:p%40ss@')}):
+        url_content = web.get_url_content(
+            'http://www.bible.com/bible/59/psa.23')
+    nose.assert_equal(url_content.encode('utf-8'), html_content)
+    nose.assert_equal(
+        server.request_paths, ['http://www.bible.com/bible/59/psa.23'])
+    nose.assert_equal(server.request_headers[0]['proxy-authorization'],
+                      'Basic dXNlcjpwQHNz')
+
+
+@nose.with_setup(set_up, tear_down)
+def test_https_proxy():
+    """should tunnel HTTPS requests through configured proxy"""
+    with patch('yvs.web.proxies', {'https': get_server_url('')}):
+        with nose.assert_raises(socket.error):
+            web.get_url_content('https://www.bible.com/bible/59/psa.23')
+    nose.assert_equal(server.request_paths, ['www.bible.com:443'])
+
+
+@nose.with_setup(set_up, tear_down)
+@patch.dict('os.environ', {'no_proxy': '127.0.0.1'})
+def test_proxy_bypass():
+    """should not send requests via proxy to hosts excluded from proxying"""
+    with patch('yvs.web.proxies', {'http': 'http://127.0.0.1:9'}):
+        url_content = web.get_url_content(get_server_url('/bible/59/psa.23'))
+    nose.assert_equal(url_content.encode('utf-8'), html_content)
+    nose.assert_equal(server.request_paths, ['/bible/59/psa.23'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_cached_url_content_compressed():
+    """should cache compressed URL content without recompressing it"""
+    with patch('yvs.cache.add_cache_entry') as add_cache_entry:
+        url_content = web.get_cached_url_content(
+            get_server_url('/gzip'), 'foo')
+    nose.assert_equal(url_content.encode('utf-8'), html_content)
+    add_cache_entry.assert_called_once_with(
+        'foo', gzipped_content, 'gzip', ttl=None)
+
+
+@nose.with_setup(set_up, tear_down)
+@patch('subprocess.Popen')
+def test_refresh_cached_url_content(popen):
+    """should refresh cached URL content in a detached process"""
+    web.refresh_cached_url_content(
+        'https://www.bible.com/search/bible?q=é', 'foo', ttl=60)
+    nose.assert_equal(popen.call_args[0][0], [
+        sys.executable, '-m', 'yvs.web',
+        b'https://www.bible.com/search/bible?q=\xc3\xa9', b'foo', b'60'])
+    nose.assert_equal(popen.call_args[1]['preexec_fn'], os.setsid)
+
+
+@nose.with_setup(set_up, tear_down)
+def test_main():
+    """should cache URL content when run as a refresh process"""
+    web.main(get_server_url('/bible/59/psa.23'), 'foo', 60)
+    entry = cache.get_cache_entry('foo')
+    nose.assert_equal(entry['content'].encode('utf-8'), html_content)
+    nose.assert_false(entry['is_expired'])
+
+
+@nose.with_setup(set_up, tear_down)
+def test_get_cached_url_content_uncompressed():
+    """should cache uncompressed URL content as text"""
+    url_content = web.get_cached_url_content(
+        get_server_url('/bible/59/psa.23'), 'foo')
+    nose.assert_equal(cache.get_cache_entry_content('foo'), url_content)
@@ -4,24 +4,24 @@
 from __future__ import print_function, unicode_literals
 
 import nose.tools as nose
-from mock import Mock, NonCallableMock, patch
+from mock import patch
 
 import tests
 from yvs.yv_parser import YVParser
 
 with open('tests/html/psa.23.html') as html_file:
-    patch_urlopen = patch(
-        'urllib2.urlopen', return_value=NonCallableMock(
-            read=Mock(return_value=html_file.read())))
+    patch_get_url_body = patch(
+        'yvs.web.get_url_body',
+        return_value=(html_file.read(), 'identity'))
 
 
 def set_up():
-    patch_urlopen.start()
+    patch_get_url_body.start()
     tests.set_up()
 
 
 def tear_down():
-    patch_urlopen.stop()
+    patch_get_url_body.stop()
     tests.tear_down()
 
 
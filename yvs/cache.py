@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-import hashlib
+import binascii
+import fcntl
 import os
 import os.path
-import shutil
+import sys
+import time
+import zlib
 
 import yvs.core as core
 
@@ -13,8 +16,94 @@
     core.HOME_DIR_PATH, 'Library', 'Caches',
     'com.runningwithcrayons.Alfred', 'Workflow Data', core.WORKFLOW_UID)
 
-# The maximum number of cache entries to store
-MAX_NUM_CACHE_ENTRIES = 100
+# The number of seconds to wait for another process to finish writing to the
+# cache database before giving up
+CACHE_BUSY_TIMEOUT = 10
+
+# The version of the cache database schema; whenever the schema changes, this
+# number must be incremented so that existing caches are rebuilt
+CACHE_SCHEMA_VERSION = 1
+
+# The statements used to create the cache database; the number and total size
+# of entries are kept up to date by triggers so that they never need to be
+# counted (the size of each entry is its stored content's length in bytes), and
+# every entry records the value of a counter (incremented whenever any entry is
+# added or read) so that the least recently used entries can be found via an
+# index; entries without an expiry time never expire; the totals table also
+# holds the counters reported by get_cache_stats (see
+# record_pending_cache_counters for how reads update them)
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    content TEXT NOT NULL,
+    encoding TEXT NOT NULL DEFAULT 'identity',
+    size INTEGER NOT NULL,
+    last_access INTEGER NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS entries_by_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS totals (
+    num_entries INTEGER NOT NULL,
+    total_size INTEGER NOT NULL,
+    num_accesses INTEGER NOT NULL,
+    num_hits INTEGER NOT NULL DEFAULT 0,
+    num_misses INTEGER NOT NULL DEFAULT 0,
+    num_evictions INTEGER NOT NULL DEFAULT 0,
+    num_bytes_written INTEGER NOT NULL DEFAULT 0,
+    num_bytes_served INTEGER NOT NULL DEFAULT 0
+);
+INSERT INTO totals (num_entries, total_size, num_accesses)
+    SELECT 0, 0, 0 WHERE NOT EXISTS (SELECT * FROM totals);
+CREATE TRIGGER IF NOT EXISTS entry_added AFTER INSERT ON entries BEGIN
+    UPDATE totals SET num_entries = num_entries + 1,
+        total_size = total_size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entry_removed AFTER DELETE ON entries BEGIN
+    UPDATE totals SET num_entries = num_entries - 1,
+        total_size = total_size - OLD.size;
+END;
+"""
+
+# The zlib window bits value which decompresses data in the gzip format
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# The fraction of cache entries which count as recently used; reading an entry
+# which is already among them does not mark it as the most recently used entry
+# (which would require a write), since it is in no danger of being evicted
+# soon; eviction is therefore only approximately LRU, since such an entry keeps
+# its place in the eviction order even if entries after it were used less
+# recently
+RECENT_CACHE_ENTRY_FRACTION = 0.5
+
+# The counters which reading the cache updates, in the order in which they are
+# recorded in the pending counters file (see record_pending_cache_counters)
+PENDING_CACHE_COUNTER_NAMES = ('num_hits', 'num_misses', 'num_bytes_served')
+
+
+# The class of connections to the cache database (see
+# get_cache_connection_class), which is only defined once the database is used
+cache_connection_class = None
+
+
+# Retrieves the class of connections to the cache database, which hold a lock
+# on the cache (see lock_cache) until they are closed; sqlite3 is only
+# imported once the database is actually used, since some entry points (e.g.
+# clear_cache) import this module without ever opening the database
+def get_cache_connection_class():
+
+    global cache_connection_class
+    if cache_connection_class is None:
+        import sqlite3
+
+        class CacheConnection(sqlite3.Connection):
+
+            def close(self):
+                sqlite3.Connection.close(self)
+                self.lock_file.close()
+
+        cache_connection_class = CacheConnection
+    return cache_connection_class
 
 
 # Creates the directory (and any nonexistent parent directories) where this
@@ -22,86 +111,468 @@
 def create_local_cache_dirs():
 
     try:
-        os.makedirs(get_cache_entry_dir_path())
+        os.makedirs(LOCAL_CACHE_DIR_PATH)
     except OSError:
         pass
 
 
-# Calculates the unique SHA1 checksum used as the filename for a cache entry
-def get_cache_entry_checksum(entry_key):
+# Retrieves the path to the database file containing all cache entries
+def get_cache_db_path():
 
-    return hashlib.sha1(entry_key.encode('utf-8')).hexdigest()
+    return os.path.join(LOCAL_CACHE_DIR_PATH, 'cache.sqlite')
 
 
-# Retrieves the local filepath for a cache entry
-def get_cache_entry_path(entry_key):
+# Removes the files used by previous versions of the workflow to store cache
+# entries (a manifest file plus one file per entry)
+def remove_legacy_cache_files():
 
-    entry_checksum = get_cache_entry_checksum(entry_key)
-    return os.path.join(get_cache_entry_dir_path(), entry_checksum)
+    import shutil
+    try:
+        shutil.rmtree(os.path.join(LOCAL_CACHE_DIR_PATH, 'entries'))
+    except OSError:
+        pass
+    try:
+        os.remove(os.path.join(LOCAL_CACHE_DIR_PATH, 'manifest.txt'))
+    except OSError:
+        pass
 
 
-# Retrieves the path to the directory where all cache entries are stored
-def get_cache_entry_dir_path():
+# Retrieves the path to the file which every process using the cache locks;
+# the lock file lives outside of the cache directory so that it survives the
+# cache being cleared
+def get_cache_lock_path():
 
-    return os.path.join(LOCAL_CACHE_DIR_PATH, 'entries')
+    return os.path.join(core.LOCAL_DATA_DIR_PATH, 'cache.lock')
 
 
-# Retrieves the path to the manifest file listing all cache entries
-def get_cache_manifest_path():
+# Acquires a lock of the given type on the cache, waiting for any conflicting
+# lock held by another process to be released; processes merely reading or
+# writing entries share the lock (since the database handles concurrent access
+# to entries itself), whereas restructuring or removing the database requires
+# an exclusive lock; the lock is held until the returned file is closed
+def lock_cache(lock_type):
 
-    return os.path.join(LOCAL_CACHE_DIR_PATH, 'manifest.txt')
+    core.create_local_data_dir()
+    lock_file = open(get_cache_lock_path(), 'a')
+    try:
+        fcntl.flock(lock_file, lock_type)
+    except IOError:
+        lock_file.close()
+        raise
+    return lock_file
 
 
-# Purge all expired entries in the cache
-def purge_expired_cache_entries(manifest_file):
-    # Read checksums from manifest; splitlines(True) preserves newlines
-    manifest_file.seek(0)
-    entry_checksums = manifest_file.read().splitlines(True)
-    # Purge the oldest entry if the cache is too large
-    if len(entry_checksums) > MAX_NUM_CACHE_ENTRIES:
-        old_entry_checksum = entry_checksums[0].rstrip()
-        manifest_file.truncate(0)
-        manifest_file.seek(0)
-        manifest_file.writelines(entry_checksums[1:])
-        os.remove(os.path.join(
-            get_cache_entry_dir_path(), old_entry_checksum))
+# Retrieves the version of the schema with which the cache database was created
+def get_cache_schema_version(connection):
 
+    return connection.execute('PRAGMA user_version').fetchone()[0]
 
-# Adds to the cache a new entry with the given content
-def add_cache_entry(entry_key, entry_content):
 
-    create_local_cache_dirs()
+# Creates the tables of the cache database if they do not exist, recreating
+# them if they were created for a different version of the schema
+def create_cache_schema(connection):
 
-    # Write entry content to entry file
-    entry_path = get_cache_entry_path(entry_key)
-    with open(entry_path, 'w') as entry_file:
-        entry_file.write(entry_content.encode('utf-8'))
+    if get_cache_schema_version(connection) == CACHE_SCHEMA_VERSION:
+        return
+    # The cache is volatile, so any existing entries can simply be discarded
+    with connection:
+        connection.execute('DROP TABLE IF EXISTS entries')
+        connection.execute('DROP TABLE IF EXISTS totals')
+    connection.executescript(CACHE_SCHEMA)
+    connection.execute('PRAGMA user_version = {:d}'.format(
+        CACHE_SCHEMA_VERSION))
+    remove_legacy_cache_files()
 
-    entry_checksum = os.path.basename(entry_path)
-    cache_manifest_path = get_cache_manifest_path()
-    with open(cache_manifest_path, 'a+') as manifest_file:
-        # Write the new entry checksum to manifest file
-        manifest_file.write(entry_checksum)
-        manifest_file.write('\n')
-        purge_expired_cache_entries(manifest_file)
 
+# Opens a connection to the cache database, which holds the lock acquired via
+# the given lock file
+def connect_cache_db(lock_file):
 
-# Retrieves the unmodified content of a cache entry
-def get_cache_entry_content(entry_key):
+    try:
+        create_local_cache_dirs()
+        import sqlite3
+        connection = sqlite3.connect(
+            get_cache_db_path(), timeout=CACHE_BUSY_TIMEOUT,
+            factory=get_cache_connection_class())
+    except Exception:
+        lock_file.close()
+        raise
+    connection.lock_file = lock_file
+    return connection
+
+
+# Opens a connection to the cache database, creating the database if needed
+def get_cache_connection():
+
+    connection = connect_cache_db(lock_cache(fcntl.LOCK_SH))
+    if get_cache_schema_version(connection) == CACHE_SCHEMA_VERSION:
+        return connection
+    connection.close()
+
+    # The schema is only ever created or rebuilt by one process at a time,
+    # and only while no other process is using the cache
+    connection = connect_cache_db(lock_cache(fcntl.LOCK_EX))
+    try:
+        create_cache_schema(connection)
+        fcntl.flock(connection.lock_file, fcntl.LOCK_SH)
+    except Exception:
+        connection.close()
+        raise
+    return connection
+
+
+# Retrieves the maximum total size (in bytes) of all cache entries, as set by
+# the user
+def get_max_cache_size():
+
+    return core.get_user_prefs()['cachesize']
+
+
+# Adds the given amounts to the counters of the same names in the totals table;
+# the counters are updated within the caller's transaction, so keeping them
+# costs no more than a single extra statement
+def increment_cache_counters(connection, **increments):
+
+    connection.execute('UPDATE totals SET {}'.format(', '.join(
+        '{0} = {0} + :{0}'.format(counter_name)
+        for counter_name in increments)), increments)
+
+
+# Retrieves the path to the file recording counter increments not yet added to
+# the totals table; the file lives in the cache directory so that clearing the
+# cache also resets the counters
+def get_pending_cache_counters_path():
+
+    return os.path.join(LOCAL_CACHE_DIR_PATH, 'counters.pending')
+
+
+# Records the given counter increments so they can later be added to the totals
+# table by a write which happens anyway (see flush_pending_cache_counters), so
+# that reading the cache never requires a database write of its own; the
+# increments are appended to the pending counters file as a single line, which
+# is cheap since the file is never synced; appending processes share a lock on
+# the file, so that it is never emptied while being written (see
+# flush_pending_cache_counters)
+def record_pending_cache_counters(**increments):
+
+    pending_counters_file = os.open(
+        get_pending_cache_counters_path(),
+        os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(pending_counters_file, fcntl.LOCK_SH)
+        os.write(pending_counters_file, '{}\n'.format(' '.join(
+            str(increments.get(counter_name, 0))
+            for counter_name in PENDING_CACHE_COUNTER_NAMES)))
+    finally:
+        os.close(pending_counters_file)
+
+
+# Sums the counter increments recorded in the given (open) pending counters
+# file
+def read_pending_cache_counters(pending_counters_file):
+
+    counters = dict.fromkeys(PENDING_CACHE_COUNTER_NAMES, 0)
+    for line in pending_counters_file:
+        try:
+            increments = [int(value) for value in line.split()]
+        except ValueError:
+            # Skip any line left incomplete by a crashed process
+            continue
+        if len(increments) == len(PENDING_CACHE_COUNTER_NAMES):
+            for counter_name, increment in zip(
+                    PENDING_CACHE_COUNTER_NAMES, increments):
+                counters[counter_name] += increment
+    return counters
+
+
+# Sums the counter increments not yet added to the totals table, without
+# flushing them
+def get_pending_cache_counters():
+
+    try:
+        with open(get_pending_cache_counters_path(), 'r') as \
+                pending_counters_file:
+            return read_pending_cache_counters(pending_counters_file)
+    except IOError:
+        return dict.fromkeys(PENDING_CACHE_COUNTER_NAMES, 0)
+
+
+# Adds all pending counter increments to the totals table within the caller's
+# write transaction; the pending file is read and emptied while exclusively
+# locked, so that no increment is appended in between (and thereby lost); the
+# file is emptied rather than removed, since a process may already have opened
+# it while waiting for the lock (since the counters are only statistics,
+# increments are simply lost if the transaction fails)
+def flush_pending_cache_counters(connection):
 
-    create_local_cache_dirs()
-    entry_path = get_cache_entry_path(entry_key)
     try:
-        with open(entry_path, 'r') as entry_file:
-            return entry_file.read().decode('utf-8')
+        pending_counters_file = open(get_pending_cache_counters_path(), 'r+')
     except IOError:
+        return
+    try:
+        fcntl.flock(pending_counters_file, fcntl.LOCK_EX)
+        counters = read_pending_cache_counters(pending_counters_file)
+        pending_counters_file.truncate(0)
+    finally:
+        pending_counters_file.close()
+    increment_cache_counters(connection, **counters)
+
+
+# Purge all expired entries in the cache, given the maximum total size (in
+# bytes) of all cache entries
+def purge_expired_cache_entries(connection, max_cache_size):
+
+    num_evictions = 0
+    # Purge the least recently used entries until the cache is back under
+    # budget
+    while connection.execute(
+            'SELECT total_size FROM totals').fetchone()[0] > max_cache_size:
+        connection.execute(
+            'DELETE FROM entries WHERE id ='
+            ' (SELECT id FROM entries ORDER BY last_access LIMIT 1)')
+        num_evictions += 1
+    if num_evictions:
+        increment_cache_counters(connection, num_evictions=num_evictions)
+
+
+# Returns True if an entry last used at the given access count is among the
+# most recently used entries (see RECENT_CACHE_ENTRY_FRACTION)
+def is_recent_cache_entry(connection, last_access):
+
+    num_accesses, num_entries = connection.execute(
+        'SELECT num_accesses, num_entries FROM totals').fetchone()
+    return (num_accesses - last_access <
+            num_entries * RECENT_CACHE_ENTRY_FRACTION)
+
+
+# Marks the entry with the given key as the most recently used entry
+def touch_cache_entry(connection, entry_key):
+
+    connection.execute('UPDATE totals SET num_accesses = num_accesses + 1')
+    connection.execute(
+        'UPDATE entries SET last_access = (SELECT num_accesses FROM totals)'
+        ' WHERE key = ?', (entry_key,))
+
+
+# Adds to the cache a new entry with the given content; if a content encoding
+# other than 'identity' is given, the content must be the bytes of the UTF-8
+# encoded content compressed using that encoding (which are stored as-is); if a
+# TTL is given, the entry expires after that many seconds
+def add_cache_entry(entry_key, entry_content, content_encoding='identity',
+                    ttl=None):
+
+    import sqlite3
+    if ttl is None:
+        expires_at = None
+    else:
+        expires_at = time.time() + ttl
+    if content_encoding == 'identity':
+        entry_size = len(entry_content.encode('utf-8'))
+    else:
+        entry_content = sqlite3.Binary(entry_content)
+        entry_size = len(entry_content)
+    # The user's preferences are read before the cache is locked, so that the
+    # lock (and the write transaction) is never held while reading them
+    max_cache_size = get_max_cache_size()
+
+    connection = get_cache_connection()
+    try:
+        # The entry is added and old entries are purged in a single
+        # transaction, so the cache is never left in a partial state
+        with connection:
+            # Replacing an existing entry makes it the newest entry
+            connection.execute(
+                'DELETE FROM entries WHERE key = ?', (entry_key,))
+            connection.execute(
+                'INSERT INTO entries'
+                ' (key, content, encoding, size, last_access, expires_at)'
+                ' VALUES (?, ?, ?, ?, 0, ?)',
+                (entry_key, entry_content, content_encoding, entry_size,
+                 expires_at))
+            touch_cache_entry(connection, entry_key)
+            increment_cache_counters(
+                connection, num_bytes_written=entry_size)
+            flush_pending_cache_counters(connection)
+            purge_expired_cache_entries(connection, max_cache_size)
+    finally:
+        connection.close()
+
+
+# Decodes the given stored cache entry content to a Unicode string
+def decode_cache_entry_content(entry_content, content_encoding):
+
+    if content_encoding == 'gzip':
+        return zlib.decompress(
+            bytes(entry_content), GZIP_WBITS).decode('utf-8')
+    else:
+        return entry_content
+
+
+# Retrieves the cache entry with the given key (marking it as the most recently
+# used entry, unless it already is among the most recently used entries), or
+# None if no such entry exists; the entry's unmodified (decompressed) content
+# is returned even if the entry has expired; only marking the entry as used
+# writes to the database (hits and misses are otherwise counted via the pending
+# counters file)
+def get_cache_entry(entry_key):
+
+    connection = get_cache_connection()
+    try:
+        row = connection.execute(
+            'SELECT content, encoding, size, expires_at, last_access'
+            ' FROM entries WHERE key = ?', (entry_key,)).fetchone()
+        if row:
+            counters = {'num_hits': 1, 'num_bytes_served': row[2]}
+        else:
+            counters = {'num_misses': 1}
+        if row and not is_recent_cache_entry(connection, row[4]):
+            with connection:
+                touch_cache_entry(connection, entry_key)
+                increment_cache_counters(connection, **counters)
+                flush_pending_cache_counters(connection)
+        else:
+            record_pending_cache_counters(**counters)
+    finally:
+        connection.close()
+    if row:
+        entry_content, content_encoding, entry_size, expires_at = row[:4]
+        return {
+            'content': decode_cache_entry_content(
+                entry_content, content_encoding),
+            'is_expired': expires_at is not None and expires_at <= time.time()
+        }
+    else:
+        return None
+
+
+# Retrieves the unmodified (decompressed) content of a cache entry (marking the
+# entry as the most recently used entry), regardless of whether it has expired
+def get_cache_entry_content(entry_key):
+
+    entry = get_cache_entry(entry_key)
+    if entry:
+        return entry['content']
+    else:
         return None
 
 
-# Removes all cache entries and the directory itself
+# Retrieves the unmodified (decompressed) content of a cache entry, or None if
+# no such entry exists; unlike get_cache_entry_content, this neither marks the
+# entry as used nor counts as a cache hit or miss
+def peek_cache_entry_content(entry_key):
+
+    connection = get_cache_connection()
+    try:
+        row = connection.execute(
+            'SELECT content, encoding FROM entries WHERE key = ?',
+            (entry_key,)).fetchone()
+    finally:
+        connection.close()
+    if row:
+        return decode_cache_entry_content(*row)
+    else:
+        return None
+
+
+# Returns True if the cache contains an entry with any of the given keys;
+# unlike reading an entry, this neither marks any entry as used nor counts as
+# a cache hit or miss
+def has_cache_entry(*entry_keys):
+
+    connection = get_cache_connection()
+    try:
+        return connection.execute(
+            'SELECT EXISTS (SELECT * FROM entries WHERE key IN ({}))'.format(
+                ', '.join('?' * len(entry_keys))),
+            entry_keys).fetchone()[0] == 1
+    finally:
+        connection.close()
+
+
+# Postpones the expiry of the given cache entry by the given number of seconds
+# if the entry has expired; returns True if the entry's expiry was postponed,
+# so that of all processes which find an expired entry, only one refreshes it
+def claim_expired_cache_entry(entry_key, claim_duration):
+
+    now = time.time()
+    connection = get_cache_connection()
+    try:
+        with connection:
+            cursor = connection.execute(
+                'UPDATE entries SET expires_at = ?'
+                ' WHERE key = ? AND expires_at <= ?',
+                (now + claim_duration, entry_key, now))
+            return cursor.rowcount == 1
+    finally:
+        connection.close()
+
+
+# Retrieves statistics describing the effectiveness and contents of the cache
+# (including the key and size of every entry)
+def get_cache_stats():
+
+    connection = get_cache_connection()
+    try:
+        cursor = connection.execute(
+            'SELECT num_entries, total_size, num_hits, num_misses,'
+            ' num_evictions, num_bytes_written, num_bytes_served FROM totals')
+        stats = dict(zip(
+            (column[0] for column in cursor.description), cursor.fetchone()))
+        # Include any increments not yet added to the totals table
+        for counter_name, increment in get_pending_cache_counters().items():
+            stats[counter_name] += increment
+        stats['entries'] = [{'key': entry_key, 'size': entry_size}
+                            for entry_key, entry_size in connection.execute(
+                                'SELECT key, size FROM entries')]
+    finally:
+        connection.close()
+
+    stats['max_size'] = get_max_cache_size()
+    return stats
+
+
+# Retrieves the paths to every cache directory which has been cleared but not
+# yet removed
+def get_cache_tombstone_paths():
+
+    import glob
+    return glob.glob('{}.*.deleted'.format(LOCAL_CACHE_DIR_PATH))
+
+
+# Removes all cache entries and the directory itself; the directory is renamed
+# to a unique tombstone (which is instant regardless of the cache's size) and
+# then deleted by a detached background process, so that the caller never
+# waits for the deletion; any tombstones left behind by a previous reaper which
+# did not finish are deleted along with it
 def clear_cache():
 
+    # The tombstone's name is random so that it never clashes with that of a
+    # tombstone still being deleted
+    tombstone_path = '{}.{}.deleted'.format(
+        LOCAL_CACHE_DIR_PATH, binascii.hexlify(os.urandom(8)))
+    # Wait for other processes to finish using the cache, so that none of them
+    # writes to the database while it is being moved; any process using the
+    # cache afterwards creates a new cache directory, so it never writes to
+    # the directory being deleted
+    lock_file = lock_cache(fcntl.LOCK_EX)
     try:
-        shutil.rmtree(LOCAL_CACHE_DIR_PATH)
+        os.rename(LOCAL_CACHE_DIR_PATH, tombstone_path)
     except OSError:
         pass
+    finally:
+        lock_file.close()
+    tombstone_paths = get_cache_tombstone_paths()
+    if tombstone_paths:
+        core.start_background_process('yvs.cache', tombstone_paths)
+
+
+# Deletes the given cache tombstones; run within a detached background process
+def main(*tombstone_paths):
+
+    import shutil
+    for tombstone_path in tombstone_paths:
+        shutil.rmtree(tombstone_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*[arg.decode('utf-8') for arg in sys.argv[1:]])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import importlib
+import os
+import os.path
+import socket
+import sys
+
+# The script filter modules which may be run through the resident server
+ENTRY_POINT_MODULES = ('filter_refs', 'filter_prefs', 'search_refs')
+
+# Path to the directory containing the socket of the resident server; the
+# socket cannot live in the workflow's cache directory because Unix socket
+# paths are limited to roughly 100 characters
+SERVER_DIR_PATH = os.path.join('/tmp', 'yvs-{}'.format(os.getuid()))
+# Path to the Unix domain socket on which the resident server listens
+SERVER_SOCKET_PATH = os.path.join(SERVER_DIR_PATH, 'server.sock')
+# The number of seconds to wait for the resident server to respond
+SERVER_TIMEOUT = 10
+
+
+# Returns True if the resident server directory belongs to the current user
+# (and therefore any server listening within it can be trusted)
+def is_server_dir_trusted():
+
+    try:
+        return os.stat(SERVER_DIR_PATH).st_uid == os.getuid()
+    except OSError:
+        return False
+
+
+# Retrieves the output of the given script filter as produced by the resident
+# server; returns None if the server is not running or fails to respond
+def get_server_output(module_name, args):
+
+    if not is_server_dir_trusted():
+        return None
+
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    response_chunks = []
+    try:
+        client_socket.settimeout(SERVER_TIMEOUT)
+        client_socket.connect(SERVER_SOCKET_PATH)
+        # The request consists of the module name followed by its arguments,
+        # all separated by null characters
+        client_socket.sendall('\0'.join([module_name] + args).encode('utf-8'))
+        client_socket.shutdown(socket.SHUT_WR)
+        response_chunk = client_socket.recv(4096)
+        while response_chunk:
+            response_chunks.append(response_chunk)
+            response_chunk = client_socket.recv(4096)
+    except socket.error:
+        return None
+    finally:
+        client_socket.close()
+
+    # The server closes the connection without responding if the script filter
+    # raised an exception
+    return b''.join(response_chunks) or None
+
+
+# Runs the given script filter within the current process
+def run_entry_point(module_name, args):
+
+    module = importlib.import_module('yvs.{}'.format(module_name))
+    module.main(*args)
+
+
+# Forwards the given script filter invocation to the resident server (which
+# keeps the workflow's modules and data loaded between keystrokes), or runs the
+# script filter in-process if the server is not running
+def main(module_name, args):
+
+    if module_name not in ENTRY_POINT_MODULES:
+        raise ValueError('Unknown script filter: {}'.format(module_name))
+
+    server_output = get_server_output(module_name, args)
+    if server_output is None:
+        run_entry_point(module_name, args)
+    else:
+        sys.stdout.write(server_output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1].decode('utf-8'),
+         [arg.decode('utf-8') for arg in sys.argv[2:]])
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import glob
+import json
+import marshal
+import os
+import os.path
+
+import yvs.core as core
+
+
+# Compiles the given JSON data file into a snapshot which can be loaded without
+# parsing any JSON
+def compile_data_file(data_path):
+
+    with open(data_path, 'r') as data_file:
+        data = json.load(data_file)
+
+    payload = marshal.dumps(data)
+    snapshot = marshal.dumps((
+        core.COMPILED_DATA_FORMAT_VERSION,
+        core.get_compiled_data_source_info(data_path),
+        core.get_compiled_data_checksum(payload),
+        payload))
+
+    # Write the snapshot to a temporary file first so that a half-written
+    # snapshot is never read
+    compiled_path = core.get_compiled_data_path(data_path)
+    temp_compiled_path = '{}.tmp'.format(compiled_path)
+    with open(temp_compiled_path, 'wb') as compiled_file:
+        compiled_file.write(snapshot)
+    os.rename(temp_compiled_path, compiled_path)
+
+    return compiled_path
+
+
+# Compiles every packaged Bible data file (books, versions, languages, etc.)
+def compile_data_files():
+
+    try:
+        os.makedirs(core.COMPILED_DATA_DIR_PATH)
+    except OSError:
+        pass
+
+    return [compile_data_file(data_path) for data_path in
+            sorted(glob.glob(core.get_bible_data_path('*.json')))]
+
+
+def main():
+
+    for compiled_path in compile_data_files():
+        print(compiled_path.encode('utf-8'))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,33 +8,35 @@
 
 import yvs.core as core
 import yvs.cache as cache
-import yvs.web as web
+import yvs.prefetch as prefetch
+import yvs.version_pack as version_pack
 from yvs.yv_parser import YVParser
 
 
-# An HTML parser which receives HTML from the page for a YouVersion
-# Bible reference and parses it to construct a shareable plain text reference
-class ReferenceParser(YVParser):
+# The kinds of parts which make up a parsed chapter; markers (i.e. paragraph
+# and line breaks) are included when rendering any range of verses in the
+# chapter, whereas verse labels and verse content are only included for verses
+# within the range
+MARKER_PART = 0
+LABEL_PART = 1
+CONTENT_PART = 2
+
+# Chapters whose download was stopped once the copied verses had been parsed,
+# as (ref, chapter HTML chunks read so far, iterator over the remaining chunks)
+# tuples; see finish_streamed_chapters
+streamed_chapters = []
+
+
+# An HTML parser which receives HTML from the page for a YouVersion Bible
+# chapter and parses it into an ordered table of parts, from which a shareable
+# plain text reference can be rendered for any range of verses in the chapter
+class ChapterParser(YVParser):
 
     # Elements that should be surrounded by blank lines
     block_elems = {'b', 'p', 'm'}
     # Elements that should trigger a line break
     break_elems = {'li1', 'q1', 'q2', 'qc', 'qm1', 'qm2'}
 
-    # Associates the given reference object with this parser instance
-    def __init__(self, ref, include_verse_numbers=False):
-        YVParser.__init__(self)
-        if 'verse' in ref:
-            # If reference is a verse or verse range, set the correct range of
-            # verses to copy
-            self.verse_start = ref['verse']
-            self.verse_end = ref.get('endverse', self.verse_start)
-        else:
-            # Otherwise, assume reference is a chapter
-            self.verse_start = 1
-            self.verse_end = None
-        self.include_verse_numbers = include_verse_numbers
-
     # Resets parser variables (implicitly called when parser is instantiated)
     def reset(self):
         YVParser.reset(self)
@@ -49,27 +51,38 @@ def reset(self):
         self.label_depth = 0
         self.content_depth = 0
         self.verse_nums = []
-        self.content_parts = []
-
-    # Returns True if parser is currently within the a verse to include
-    # (otherwise, returns False)
-    def is_in_verse(self):
-        return any(self.in_verse and
-                   (verse_num >= self.verse_start and
-                    (not self.verse_end or verse_num <= self.verse_end))
-                   for verse_num in self.verse_nums)
-
-    # Returns True if parser is currently within the content of a verse to
-    # include
+        self.chapter_parts = []
+
+    # Appends a part of the given kind to the chapter, where the part belongs
+    # to the given verses; consecutive parts of the same kind belonging to the
+    # same verses are merged, since they are always rendered together
+    def add_chapter_part(self, part_kind, verse_nums, text):
+        if self.chapter_parts:
+            last_part = self.chapter_parts[-1]
+            if last_part[0] == part_kind and last_part[1] == verse_nums:
+                last_part[2] += text
+                return
+        self.chapter_parts.append([part_kind, verse_nums, text])
+
+    # Appends a paragraph or line break to the chapter
+    def add_marker(self, text):
+        self.add_chapter_part(MARKER_PART, [], text)
+
+    # Returns True if the parser has moved past the given verse (and has
+    # therefore parsed every part belonging to it)
+    def has_passed_verse(self, verse_num):
+        return bool(self.verse_nums) and min(self.verse_nums) > verse_num
+
+    # Returns True if parser is currently within the content of a verse
     def is_in_verse_content(self):
-        return (self.is_in_verse() and self.in_verse_content
+        return (self.in_verse and self.in_verse_content
                 and not self.in_verse_note)
 
-    # Returns True if parser is currently within the label of a verse to
-    # include (otherwise, returns False)
+    # Returns True if parser is currently within the label of a verse
+    # (otherwise, returns False)
     def is_in_verse_label(self):
-        return (self.is_in_verse() and self.include_verse_numbers and
-                self.in_verse_label and not self.in_verse_note)
+        return (self.in_verse and self.in_verse_label
+                and not self.in_verse_note)
 
     # Detects the start of blocks, breaks, verses, and verse content
     def handle_starttag(self, tag, attrs):
@@ -89,10 +102,10 @@ def handle_starttag(self, tag, attrs):
         if elem_class in self.block_elems:
             self.in_block = True
             self.block_depth = self.depth
-            self.content_parts.append('\n\n')
+            self.add_marker('\n\n')
         # Detect line breaks within a single verse
         if elem_class in self.break_elems:
-            self.content_parts.append('\n')
+            self.add_marker('\n')
         # Detect beginning of a single verse (may include footnotes)
         if 'verse' in elem_class_names:
             self.in_verse = True
@@ -116,7 +129,7 @@ def handle_starttag(self, tag, attrs):
     def handle_endtag(self, tag):
         if self.in_block and self.depth == self.block_depth:
             self.in_block = False
-            self.content_parts.append('\n')
+            self.add_marker('\n')
         elif self.in_verse and self.depth == self.verse_depth:
             self.in_verse = False
         elif self.in_verse_label and self.depth == self.label_depth:
@@ -130,9 +143,10 @@ def handle_endtag(self, tag):
     # Handles verse labels and content
     def handle_data(self, data):
         if self.is_in_verse_label():
-            self.content_parts.append(' {} '.format(data.strip()))
+            self.add_chapter_part(
+                LABEL_PART, self.verse_nums, ' {} '.format(data.strip()))
         if self.is_in_verse_content():
-            self.content_parts.append(data)
+            self.add_chapter_part(CONTENT_PART, self.verse_nums, data)
 
 
 # Retrieves the UID of the chapter to which this reference belongs
@@ -144,30 +158,166 @@ def get_ref_chapter_uid(ref):
         chapter=ref['chapter'])
 
 
+# Retrieves the URL of the chapter to which the reference belongs
+def get_chapter_url(ref):
+
+    return core.get_ref_url(ref_uid=get_ref_chapter_uid(ref))
+
+
 # Retrieves HTML for of the chapter to which the reference belongs
 def get_chapter_html(ref):
 
-    chapter_uid = get_ref_chapter_uid(ref)
-    url = core.get_ref_url(ref_uid=chapter_uid)
-
-    entry_key = '{}.html'.format(chapter_uid)
+    entry_key = '{}.html'.format(get_ref_chapter_uid(ref))
     chapter_html = cache.get_cache_entry_content(entry_key)
     if not chapter_html:
-        chapter_html = web.get_url_content(url)
-        cache.add_cache_entry(entry_key, chapter_html)
+        # The networking modules are only imported when content actually
+        # needs to be fetched
+        import yvs.web as web
+        # The content of a chapter never changes, so it never expires
+        chapter_html = web.get_cached_url_content(
+            get_chapter_url(ref), entry_key)
 
     return chapter_html
 
 
+# Caches the given parts of the chapter to which the reference belongs
+def add_chapter_parts_cache_entry(ref, chapter_parts):
+
+    cache.add_cache_entry(
+        '{}.json'.format(get_ref_chapter_uid(ref)),
+        json.dumps(chapter_parts, ensure_ascii=False, separators=(',', ':')))
+
+
+# Parses the given chunks of chapter HTML (as they are downloaded) until every
+# verse up to the given verse has been parsed; returns the parsed chapter parts
+# and whether every chunk was parsed
+def parse_chapter_html_chunks(chapter_html_chunks, verse_end):
+
+    parser = ChapterParser()
+    pending_html = ''
+    for chapter_html_chunk in chapter_html_chunks:
+        # The parser handles text as soon as it is fed, so text split across
+        # chunks would be handled in pieces (e.g. a 7-9 verse label would be
+        # rendered as 7 - 9); therefore, text after the last complete tag is
+        # held back until the next chunk arrives
+        pending_html += chapter_html_chunk
+        tag_end_index = pending_html.rfind('>') + 1
+        parser.feed(pending_html[:tag_end_index])
+        pending_html = pending_html[tag_end_index:]
+        if parser.has_passed_verse(verse_end):
+            return parser.chapter_parts, False
+    parser.feed(pending_html)
+    return parser.chapter_parts, True
+
+
+# Yields the given chunks, appending each to the given list as it is yielded
+def record_chunks(chunks, recorded_chunks):
+
+    for chunk in chunks:
+        recorded_chunks.append(chunk)
+        yield chunk
+
+
+# Parses the chapter to which the given verse reference belongs while it is
+# being downloaded, stopping as soon as every verse in the reference has been
+# parsed; the returned parts may therefore be incomplete, in which case the
+# download is left open so that the rest of the chapter can be read later
+# (see finish_streamed_chapters) rather than downloaded again
+def get_streamed_chapter_parts(ref):
+
+    import yvs.web as web
+    url_content_chunks = web.get_url_content_chunks(get_chapter_url(ref))
+    chapter_html_chunks = []
+    chapter_parts, is_complete = parse_chapter_html_chunks(
+        record_chunks(url_content_chunks, chapter_html_chunks),
+        ref.get('endverse', ref['verse']))
+    if is_complete:
+        add_chapter_parts_cache_entry(ref, chapter_parts)
+    else:
+        streamed_chapters.append(
+            (ref, chapter_html_chunks, url_content_chunks))
+    return chapter_parts
+
+
+# Reads the rest of every chapter whose download was stopped early (see
+# get_streamed_chapter_parts), and caches the parts of each complete chapter
+def finish_streamed_chapters():
+
+    while streamed_chapters:
+        ref, chapter_html_chunks, url_content_chunks = streamed_chapters.pop(0)
+        chapter_html_chunks.extend(url_content_chunks)
+        parser = ChapterParser()
+        parser.feed(''.join(chapter_html_chunks))
+        add_chapter_parts_cache_entry(ref, parser.chapter_parts)
+
+
+# Retrieves the parts of the chapter to which the reference belongs (as
+# produced by ChapterParser), preferring any imported version pack containing
+# the chapter; otherwise, the parts are cached alongside the chapter HTML so
+# that the HTML only needs to be parsed once; if the chapter has yet to be
+# downloaded and the reference is to specific verses, only the parts needed
+# to render those verses are guaranteed to be retrieved
+def get_chapter_parts(ref):
+
+    chapter_parts = version_pack.get_chapter_parts(
+        ref['version_id'], ref['book_id'], ref['chapter'])
+    if chapter_parts is not None:
+        return chapter_parts
+
+    chapter_json = cache.get_cache_entry_content(
+        '{}.json'.format(get_ref_chapter_uid(ref)))
+    if chapter_json:
+        return json.loads(chapter_json)
+
+    if 'verse' in ref and not cache.has_cache_entry(
+            '{}.html'.format(get_ref_chapter_uid(ref))):
+        return get_streamed_chapter_parts(ref)
+
+    parser = ChapterParser()
+    parser.feed(get_chapter_html(ref))
+    add_chapter_parts_cache_entry(ref, parser.chapter_parts)
+    return parser.chapter_parts
+
+
+# Returns True if the given chapter part should be included when rendering the
+# given range of verses (where a verse end of None denotes the chapter's end)
+def is_part_in_range(part, verse_start, verse_end, include_verse_numbers):
+
+    part_kind, verse_nums = part[0], part[1]
+    if part_kind == MARKER_PART:
+        return True
+    if part_kind == LABEL_PART and not include_verse_numbers:
+        return False
+    return any(verse_num >= verse_start and
+               (not verse_end or verse_num <= verse_end)
+               for verse_num in verse_nums)
+
+
+# Renders the unformatted content of the given reference from the parts of
+# the chapter to which it belongs
+def render_chapter_parts(chapter_parts, ref, include_verse_numbers):
+
+    if 'verse' in ref:
+        # If reference is a verse or verse range, set the correct range of
+        # verses to copy
+        verse_start = ref['verse']
+        verse_end = ref.get('endverse', verse_start)
+    else:
+        # Otherwise, assume reference is a chapter
+        verse_start = 1
+        verse_end = None
+    return ''.join(part[2] for part in chapter_parts
+                   if is_part_in_range(
+                       part, verse_start, verse_end, include_verse_numbers))
+
+
 # Parses actual reference content from chapter HTML
 def get_ref_content(ref, ref_format, include_verse_numbers):
 
-    chapter_html = get_chapter_html(ref)
-    parser = ReferenceParser(ref, include_verse_numbers)
-    parser.feed(chapter_html)
+    chapter_parts = get_chapter_parts(ref)
     # Format reference content by removing superfluous whitespace and such
-    ref_content = core.normalize_ref_content(
-        ''.join(parser.content_parts))
+    ref_content = core.normalize_ref_content(render_chapter_parts(
+        chapter_parts, ref, include_verse_numbers))
 
     if ref_content:
         copied_content = ref_format.format(
@@ -209,6 +359,16 @@ def main(ref_uid):
             }
         }
     }))
+    # Prefetching is merely an optimization, so failing to start it must never
+    # fail the copy itself
+    try:
+        prefetch.start_prefetch(ref_uid)
+    except Exception:
+        pass
+    if streamed_chapters:
+        # The rest of the chapter is read over the connection which is already
+        # open, within a forked process so that Alfred need not wait for it
+        core.fork_background_process(finish_streamed_chapters)
 
 
 if __name__ == '__main__':
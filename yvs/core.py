@@ -4,10 +4,14 @@
 from __future__ import print_function, unicode_literals
 
 import json
+import marshal
 import os
 import os.path
 import re
+import sys
 import unicodedata
+import zlib
+from collections import OrderedDict
 
 # Unique identifier for the workflow
 WORKFLOW_UID = 'com.calebevans.youversionsuggest'
@@ -20,6 +24,19 @@
     'Workflow Data', WORKFLOW_UID)
 # Path to the directory containing data files apart of the packaged workflow
 PACKAGED_CODE_DIR_PATH = os.path.join(os.getcwd(), 'yvs')
+# Path to the directory containing precompiled snapshots of the packaged data
+# files (generated by the yvs.compile_data build step)
+COMPILED_DATA_DIR_PATH = os.path.join(PACKAGED_CODE_DIR_PATH, 'compiled')
+
+# The version of the compiled data snapshot format; snapshots written with any
+# other format version are ignored
+COMPILED_DATA_FORMAT_VERSION = 2
+
+# The maximum number of data files to keep loaded in memory at once
+MAX_NUM_LOADED_DATA_FILES = 8
+# Data files already loaded by this process, keyed by path and ordered from
+# least to most recently used; each value is a (mtime, data) tuple
+loaded_data_files = OrderedDict()
 
 # The template used to build the URL for a Bible reference
 REF_URL_TEMPLATE = 'https://www.bible.com/bible/{ref}'
@@ -35,39 +52,192 @@ def create_local_data_dir():
         pass
 
 
+# Runs the given module (with the given arguments) within a detached background
+# process, so that the caller never waits for it to finish
+def start_background_process(module_name, args):
+
+    # subprocess is only needed when a background process is actually started
+    import subprocess
+    with open(os.devnull, 'r+') as devnull:
+        # The process runs in its own session and has no access to the
+        # caller's output, so Alfred does not wait for it to finish
+        subprocess.Popen(
+            [sys.executable, '-m', module_name] +
+            [arg.encode('utf-8') for arg in args],
+            stdin=devnull, stdout=devnull, stderr=devnull,
+            close_fds=True, preexec_fn=os.setsid)
+
+
+# Calls the given function within a forked, detached background process, so
+# that the caller never waits for it to finish; unlike a process started via
+# start_background_process, the forked process inherits this process's state
+# (e.g. open network connections), but has no access to the caller's output
+def fork_background_process(func):
+
+    # Flush any pending output first, so that it is never written twice
+    sys.stdout.flush()
+    if os.fork():
+        return
+    try:
+        os.setsid()
+        with open(os.devnull, 'r+') as devnull:
+            for stream_fd in (0, 1, 2):
+                os.dup2(devnull.fileno(), stream_fd)
+        func()
+    finally:
+        # The process must never return to the caller's code
+        os._exit(0)
+
+
+# Retrieves the path to the given file within the packaged Bible data directory
+def get_bible_data_path(data_file_name):
+
+    return os.path.join(
+        PACKAGED_CODE_DIR_PATH, 'data', 'bible', data_file_name)
+
+
+# Retrieves the path to the precompiled snapshot of the given JSON data file
+def get_compiled_data_path(data_path):
+
+    data_file_name = os.path.splitext(os.path.basename(data_path))[0]
+    return os.path.join(
+        COMPILED_DATA_DIR_PATH, '{}.marshal'.format(data_file_name))
+
+
+# Calculates the checksum used to verify the payload of a compiled snapshot
+# (and to identify the contents of the file it was compiled from)
+def get_compiled_data_checksum(payload):
+
+    return zlib.adler32(payload) & 0xffffffff
+
+
+# Calculates the checksum of the contents of the given JSON data file
+def get_compiled_data_source_checksum(data_path):
+
+    with open(data_path, 'rb') as data_file:
+        return get_compiled_data_checksum(data_file.read())
+
+
+# Retrieves the size, modification time, and checksum of the given JSON data
+# file, which together identify the file a snapshot was compiled from
+def get_compiled_data_source_info(data_path):
+
+    data_stat = os.stat(data_path)
+    return (data_stat.st_size, data_stat.st_mtime,
+            get_compiled_data_source_checksum(data_path))
+
+
+# Returns True if the given JSON data file is the same file described by the
+# given source info (as stored in a compiled snapshot)
+def is_compiled_data_source_current(data_path, source_info):
+
+    source_size, source_mtime, source_checksum = source_info
+    data_stat = os.stat(data_path)
+    if data_stat.st_size != source_size:
+        return False
+    # Any edit changes the file's modification time, so the file only needs to
+    # be read if its modification time differs; the file may merely have been
+    # copied (e.g. when the workflow is installed, since zip archives only
+    # store modification times to the nearest two seconds), in which case its
+    # contents are unchanged
+    if data_stat.st_mtime == source_mtime:
+        return True
+    return get_compiled_data_source_checksum(data_path) == source_checksum
+
+
+# Loads the precompiled snapshot of the given JSON data file; returns None if
+# the snapshot is missing, corrupted, or was compiled from a different file
+def load_compiled_data(data_path):
+
+    try:
+        # The entire snapshot is read with a single read() call
+        with open(get_compiled_data_path(data_path), 'rb') as compiled_file:
+            format_version, source_info, checksum, payload = marshal.loads(
+                compiled_file.read())
+        if (format_version != COMPILED_DATA_FORMAT_VERSION or
+                not is_compiled_data_source_current(data_path, source_info) or
+                checksum != get_compiled_data_checksum(payload)):
+            return None
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+
+    return marshal.loads(payload)
+
+
+# Loads the JSON data file at the given path, preferring its precompiled
+# snapshot (and falling back to the JSON itself if the snapshot is unusable)
+def load_data_file(data_path):
+
+    data = load_compiled_data(data_path)
+    if data is None:
+        with open(data_path, 'r') as data_file:
+            data = json.load(data_file)
+    return data
+
+
+# Retrieves the contents of the given data file, loading the file only if it
+# has not already been loaded by this process or has changed since; the
+# returned data is shared between callers and must not be mutated
+def get_data_file(data_path):
+
+    data_mtime = os.path.getmtime(data_path)
+    loaded_data_file = loaded_data_files.pop(data_path, None)
+    if loaded_data_file is None or loaded_data_file[0] != data_mtime:
+        loaded_data_file = (data_mtime, load_data_file(data_path))
+
+    # Mark the data file as most recently used, evicting the least recently
+    # used data files if too many are loaded
+    loaded_data_files[data_path] = loaded_data_file
+    while len(loaded_data_files) > MAX_NUM_LOADED_DATA_FILES:
+        loaded_data_files.popitem(last=False)
+
+    return loaded_data_file[1]
+
+
+# Builds the lookup maps used to find a book or version of the given bible by
+# its ID in constant time
+def index_bible(bible):
+
+    bible['book_by_id'] = {}
+    for book in bible['books']:
+        bible['book_by_id'].setdefault(book['id'], book)
+    bible['version_by_id'] = {}
+    for version in bible['versions']:
+        bible['version_by_id'].setdefault(version['id'], version)
+
+
 # Retrieves bible data object (books, versions, etc.) for the given language
 def get_bible(language_id):
 
-    bible_path = os.path.join(
-        PACKAGED_CODE_DIR_PATH, 'data', 'bible',
-        'bible-{}.json'.format(language_id))
-    with open(bible_path, 'r') as bible_file:
-        return json.load(bible_file)
+    bible = get_data_file(
+        get_bible_data_path('bible-{}.json'.format(language_id)))
+    # The lookup maps only need to be built once per load of the bible data
+    if 'book_by_id' not in bible:
+        index_bible(bible)
+    return bible
 
 
 # Retrieves metadata for every book of the Bible, including chapter counts
 def get_book_metadata():
 
-    book_metadata_path = os.path.join(
-        PACKAGED_CODE_DIR_PATH, 'data', 'bible', 'book-metadata.json')
-    with open(book_metadata_path, 'r') as book_metadata_file:
-        return json.load(book_metadata_file)
+    return get_data_file(get_bible_data_path('book-metadata.json'))
 
 
-# Retrieves name of first book whose id matches the given id
-def get_book(books, book_id):
+# Retrieves name of first book whose id matches the given id (or None if no
+# book has the given id)
+def get_book(bible, book_id):
 
-    for book in books:  # pragma: no branch
-        if book['id'] == book_id:
-            return book['name']
+    book = bible['book_by_id'].get(book_id)
+    if book:
+        return book['name']
+    else:
+        return None
 
 
 # Retrieves first version object whose id matches the given id
-def get_version(versions, version_id):
+def get_version(bible, version_id):
 
-    for version in versions:
-        if version['id'] == version_id:
-            return version
+    return bible['version_by_id'].get(version_id)
 
 
 # Retrieves a list of all supported versions for the given language
@@ -80,10 +250,7 @@ def get_versions(language_id):
 # Retrieves a list of all supported languages
 def get_languages():
 
-    languages_path = os.path.join(
-        PACKAGED_CODE_DIR_PATH, 'data', 'bible', 'languages.json')
-    with open(languages_path, 'r') as languages_file:
-        return json.load(languages_file)
+    return get_data_file(get_bible_data_path('languages.json'))
 
 
 # Build the object for a single result list feedback item
@@ -129,8 +296,8 @@ def get_default_user_prefs_path():
 # Retrieves the default values for all workflow preferences
 def get_default_user_prefs():
 
-    with open(get_default_user_prefs_path(), 'r') as defaults_file:
-        return json.load(defaults_file)
+    # Return a copy since callers are free to modify the preferences
+    return get_data_file(get_default_user_prefs_path()).copy()
 
 
 # Retrieves the path to the workflow's user preferences file
@@ -216,7 +383,7 @@ def get_ref(ref_uid, user_prefs):
 
     # Include book name using book ID and currently-set language
     bible = get_bible(user_prefs['language'])
-    book_name = get_book(bible['books'], ref['book_id'])
+    book_name = get_book(bible, ref['book_id'])
     ref['book'] = book_name
 
     # Include verse number if it exists
@@ -230,7 +397,7 @@ def get_ref(ref_uid, user_prefs):
         ref['endverse'] = int(endverse_match)
 
     # Include full version name (acronym) if it exists
-    version_name = get_version(bible['versions'], ref['version_id'])['name']
+    version_name = get_version(bible, ref['version_id'])['name']
     ref['version'] = version_name
 
     return ref
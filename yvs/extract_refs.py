@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import json
+import os.path
+import re
+import sys
+
+import yvs.core as core
+import yvs.filter_refs as filter_refs
+
+# Pattern matching any text which may be a Bible reference (e.g. "John 3:16",
+# "1 Cor 13:4-7", or "Psalm 23"); each candidate reference is then resolved
+# against the book names of the preferred language
+CANDIDATE_REF_PATT = re.compile(
+    r'(?<!\w)(?:(\d)\s?)?([^\W\d_]{2,})\.?\s?(\d+)'
+    r'(?:[:.](\d+)(?:\s?[-–]\s?(\d+))?)?',
+    flags=re.UNICODE)
+
+# The approximate number of bytes of a file processed by each worker process
+# at a time (when extracting references with multiple processes)
+CHUNK_SIZE = 1024 * 1024
+
+
+# Resolves the given candidate reference match to a reference object, or
+# returns None if the candidate is not actually a reference
+def get_ref_from_candidate(ref_match, user_prefs, bible, book_metadata):
+
+    book_prefix, book_word, chapter, verse, endverse = ref_match.groups()
+    # Chapter-only references (e.g. "Romans 8") are only recognized when the
+    # book name is capitalized, to avoid matching ordinary phrases
+    if not verse and book_word[0].islower():
+        return None
+
+    query = filter_refs.get_query_object(
+        filter_refs.normalize_query_str(ref_match.group(0)))
+    if not query or 'chapter' not in query:
+        return None
+    matching_books = filter_refs.get_matching_books(
+        bible, book_metadata, query)
+    if not matching_books:
+        return None
+    book = matching_books[0]
+
+    # Discard references to chapters or verses which do not exist
+    if query['chapter'] > book['metadata']['chapters']:
+        return None
+    last_verse = book['metadata']['verses'][query['chapter'] - 1]
+    if query.get('verse', 0) > last_verse:
+        return None
+    if query.get('endverse', 0) > last_verse:
+        return None
+
+    ref = {
+        'book_id': book['id'],
+        'book': book['name'],
+        'chapter': query['chapter']
+    }
+    uid = '{version}/{book}.{chapter}'.format(
+        version=user_prefs['version'],
+        book=ref['book_id'],
+        chapter=ref['chapter'])
+    if 'verse' in query:
+        ref['verse'] = query['verse']
+        uid += '.{verse}'.format(verse=ref['verse'])
+    if query.get('endverse', 0) > query.get('verse', 0):
+        ref['endverse'] = query['endverse']
+        uid += '-{endverse}'.format(endverse=ref['endverse'])
+
+    return {
+        'text': ref_match.group(0),
+        'uid': uid,
+        'name': core.get_basic_ref_name(ref)
+    }
+
+
+# Extracts every reference from the given lines, yielding the one-based line
+# number of each reference alongside the reference itself; lines are consumed
+# one at a time, so any number of lines can be processed in constant memory
+def extract_refs_from_lines(lines):
+
+    user_prefs = core.get_user_prefs()
+    bible = core.get_bible(user_prefs['language'])
+    book_metadata = core.get_book_metadata()
+
+    for line_num, line in enumerate(lines, start=1):
+        pos = 0
+        ref_match = CANDIDATE_REF_PATT.search(line, pos)
+        while ref_match:
+            ref = get_ref_from_candidate(
+                ref_match, user_prefs, bible, book_metadata)
+            if ref:
+                yield line_num, ref
+                pos = ref_match.end()
+            else:
+                # The chapter number of a rejected candidate may actually be
+                # the number of the next book (e.g. the 2 in "see 2 Kings
+                # 2:11"), so resume scanning from the chapter number
+                pos = ref_match.start(3)
+            ref_match = CANDIDATE_REF_PATT.search(line, pos)
+
+
+# Retrieves the lines of the given file which start within the given range of
+# byte offsets (so that consecutive ranges never share a line)
+def get_chunk_lines(file_path, chunk_start, chunk_end):
+
+    with open(file_path, 'rb') as text_file:
+        if chunk_start > 0:
+            # Skip the line in progress, which belongs to the previous chunk
+            text_file.seek(chunk_start - 1)
+            text_file.readline()
+        while text_file.tell() < chunk_end:
+            line = text_file.readline()
+            if not line:
+                break
+            yield line.decode('utf-8', 'replace')
+
+
+# Extracts every reference from the given chunk of a file, returning the
+# number of lines in the chunk and every (line number, reference) pair (line
+# numbers being relative to the start of the chunk); run by worker processes
+def extract_refs_from_chunk(chunk):
+
+    # Chunks are small enough to be held in memory all at once
+    lines = list(get_chunk_lines(*chunk))
+    return len(lines), list(extract_refs_from_lines(lines))
+
+
+# Extracts every reference from the given file using a pool of worker
+# processes, each handling one chunk of the file at a time; results are
+# yielded in the same order as they appear in the file
+def extract_refs_from_file_parallel(file_path, num_jobs):
+
+    import multiprocessing
+
+    # Ensure user preferences exist before starting the workers, which would
+    # otherwise race to create them
+    core.get_user_prefs()
+    file_size = os.path.getsize(file_path)
+    chunks = ((file_path, chunk_start, chunk_start + CHUNK_SIZE)
+              for chunk_start in xrange(0, file_size, CHUNK_SIZE))
+    pool = multiprocessing.Pool(num_jobs)
+    try:
+        line_offset = 0
+        for num_lines, refs in pool.imap(extract_refs_from_chunk, chunks):
+            for line_num, ref in refs:
+                yield line_offset + line_num, ref
+            line_offset += num_lines
+    finally:
+        pool.terminate()
+
+
+# Extracts every reference from the given file (or stdin if the path is '-')
+def extract_refs_from_file(file_path, num_jobs=1):
+
+    if file_path == '-':
+        lines = (line.decode('utf-8', 'replace') for line in sys.stdin)
+        for line_num, ref in extract_refs_from_lines(lines):
+            yield line_num, ref
+    elif num_jobs > 1:
+        for line_num, ref in extract_refs_from_file_parallel(
+                file_path, num_jobs):
+            yield line_num, ref
+    else:
+        with io.open(file_path, 'r', encoding='utf-8',
+                     errors='replace') as text_file:
+            for line_num, ref in extract_refs_from_lines(text_file):
+                yield line_num, ref
+
+
+def parse_cli_args(args):
+
+    parser = argparse.ArgumentParser(
+        description='Print every Bible reference in the given text files as'
+                    ' JSON lines')
+    parser.add_argument(
+        'file_paths', metavar='FILE', nargs='*', default=['-'],
+        help='a text file to scan (or - for stdin, the default)')
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=1,
+        help='the number of processes used to scan each file')
+    return parser.parse_args(args)
+
+
+def main(args):
+
+    cli_args = parse_cli_args(args)
+    for file_path in cli_args.file_paths:
+        for line_num, ref in extract_refs_from_file(
+                file_path, num_jobs=cli_args.jobs):
+            ref['file'] = file_path
+            ref['line'] = line_num
+            print(json.dumps(ref, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
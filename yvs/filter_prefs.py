@@ -54,6 +54,14 @@ def get_pref_defs(user_prefs):
             'values': get_copy_by_default_values(),
             'description': 'Choose whether to copy references to the clipboard'
                            'without pressing the command key'
+        },
+        {
+            'id': 'cachesize',
+            'name': 'Cache Size',
+            'short_name': 'cache size',
+            'values': get_cache_size_values(user_prefs),
+            'description': 'Set the maximum amount of disk space used to'
+                           ' cache Bible content'
         }
     ]
 
@@ -137,6 +145,26 @@ def get_copy_by_default_values():
     ]
 
 
+# Get a list of all available values for the "Cache Size" preference (in
+# bytes)
+def get_cache_size_values(user_prefs):
+
+    cache_sizes = [size_mb * 1024 * 1024 for size_mb in (5, 10, 25, 50, 100)]
+    # Display the user's current preference in the list
+    if user_prefs['cachesize'] not in cache_sizes:
+        cache_sizes.append(user_prefs['cachesize'])
+
+    return [get_cache_size_value(cache_size) for cache_size in cache_sizes]
+
+
+def get_cache_size_value(cache_size):
+
+    return {
+        'id': cache_size,
+        'name': '{:g} MB'.format(cache_size / 1024.0 / 1024.0)
+    }
+
+
 # Get the value object with the given ID for the given preference
 def get_pref_value(pref_def, value_id):
 
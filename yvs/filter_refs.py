@@ -5,31 +5,107 @@
 
 import re
 import sys
+from bisect import bisect_left
 from operator import itemgetter
 
 import yvs.core as core
 
 
-# Parses the given query string into components of a Bible reference
+# Returns True if the given character is a letter (more precisely, a word
+# character which is neither a digit nor an underscore)
+def is_letter(char):
+
+    return char.isalnum() and not char.isdecimal()
+
+
+# Retrieves the index of the first character at or after the given index which
+# is not a digit
+def skip_digits(query_str, i):
+
+    while i < len(query_str) and query_str[i].isdecimal():
+        i += 1
+    return i
+
+
+# Retrieves the index just past the whitespace character at the given index (if
+# there is one)
+def skip_space(query_str, i):
+
+    if i < len(query_str) and query_str[i].isspace():
+        i += 1
+    return i
+
+
+# Parses the given query string into components of a Bible reference, scanning
+# the string once; returns a (book, chapter, verse, endverse, version) tuple
+# where every component except the book may be None, or returns None if the
+# query string is not a reference at all
 def get_ref_match(query_str):
 
-    # Pattern for parsing any bible reference
-    patt = '^{book}(?:{chapter}(?:{verse}{endverse})?{version})?$'.format(
-        book=r'(\d?(?:[^\W\d_]|\s)+|\d)\s?',
-        chapter=r'(\d+)\s?',
-        verse=r'(\d+)\s?',
-        endverse=r'(\d+)?\s?',
-        version=r'([^\W\d_](?:[^\W\d_]\d*|\s)*)?.*?')
-    return re.search(patt, query_str, flags=re.UNICODE)
+    # The book is a run of letters and whitespace, optionally preceded by a
+    # single digit (e.g. "1 cor"); the run must be followed by the chapter or
+    # by the end of the query
+    i = 1 if query_str[:1].isdecimal() else 0
+    book_end = i
+    while book_end < len(query_str) and (is_letter(query_str[book_end]) or
+                                         query_str[book_end].isspace()):
+        book_end += 1
+    if (book_end > i and
+            (book_end == len(query_str) or query_str[book_end].isdecimal())):
+        i = book_end
+    elif i == 1:
+        # Otherwise, the book may be the single leading digit by itself (e.g.
+        # "2" or "23", the latter meaning book "2" and chapter 3)
+        book_end = 1
+        i = skip_space(query_str, book_end)
+        if i < len(query_str) and not query_str[i].isdecimal():
+            return None
+    else:
+        return None
+    book = query_str[:book_end]
+
+    if i == len(query_str):
+        return (book, None, None, None, None)
+
+    chapter_end = skip_digits(query_str, i)
+    chapter = query_str[i:chapter_end]
+    i = skip_space(query_str, chapter_end)
+
+    verse = None
+    endverse = None
+    if i < len(query_str) and query_str[i].isdecimal():
+        verse_end = skip_digits(query_str, i)
+        verse = query_str[i:verse_end]
+        i = skip_space(query_str, verse_end)
+        endverse_end = skip_digits(query_str, i)
+        if endverse_end > i:
+            endverse = query_str[i:endverse_end]
+        i = skip_space(query_str, endverse_end)
+
+    # The version is a letter followed by any letters (each optionally
+    # followed by digits) and whitespace; anything after the version (or in
+    # place of it) is ignored
+    version = None
+    if i < len(query_str) and is_letter(query_str[i]):
+        version_end = i + 1
+        while version_end < len(query_str):
+            if is_letter(query_str[version_end]):
+                version_end = skip_digits(query_str, version_end + 1)
+            elif query_str[version_end].isspace():
+                version_end += 1
+            else:
+                break
+        version = query_str[i:version_end]
+
+    return (book, chapter, verse, endverse, version)
 
 
 def normalize_query_str(query_str):
 
     query_str = core.normalize_query_str(query_str)
-    # Parse shorthand reference notation
+    # Parse shorthand reference notation (since the query string is already
+    # normalized, this cannot introduce any extraneous whitespace)
     query_str = re.sub(r'(\d)(?=[a-z])', '\\1 ', query_str)
-    query_str = re.sub(r'\s+', ' ', query_str)
-    query_str = query_str.strip()
 
     return query_str
 
@@ -43,47 +119,60 @@ def get_query_object(query_str):
     if not ref_match:
         return None
 
+    book_match, chapter_match, verse_match, endverse_match, version_match = \
+        ref_match
+
     # Create query object for storing query data
     query = {}
 
-    book_match = ref_match.group(1)
     query['book'] = book_match.rstrip()
 
-    chapter_match = ref_match.group(2)
     if chapter_match:
         query['chapter'] = max(1, int(chapter_match))
 
-    verse_match = ref_match.group(3)
     if verse_match:
         query['verse'] = max(1, int(verse_match))
 
-    endverse_match = ref_match.group(4)
     if endverse_match:
         query['endverse'] = int(endverse_match)
 
-    version_match = ref_match.group(5)
     if version_match:
         query['version'] = normalize_query_str(version_match)
 
     return query
 
 
+# Builds the maps used to find a version by its normalized name, or by any
+# prefix of its normalized name; each name or prefix maps to the first version
+# (in list order) with that name or prefix; the maps are built once per load of
+# the bible data
+def index_version_names(bible):
+
+    bible['version_by_name'] = {}
+    bible['version_by_name_prefix'] = {}
+    for version in bible['versions']:
+        normalized_version_name = normalize_query_str(version['name'])
+        bible['version_by_name'].setdefault(normalized_version_name, version)
+        for i in xrange(1, len(normalized_version_name) + 1):
+            bible['version_by_name_prefix'].setdefault(
+                normalized_version_name[:i], version)
+
+
 # Finds a version which best matches the given version query
-def guess_version(versions, version_query):
+def guess_version(bible, version_query):
+
+    if 'version_by_name' not in bible:
+        index_version_names(bible)
 
     # Chop off character from version query until matching version can be
     # found (if a matching version even exists)
     for i in xrange(len(version_query), 0, -1):
-        for version in versions:
-            normalized_version_name = normalize_query_str(version['name'])
-            if normalized_version_name == version_query[:i]:
-                return version
+        if version_query[:i] in bible['version_by_name']:
+            return bible['version_by_name'][version_query[:i]]
     # Give partial matches lower precedence over exact matches
     for i in xrange(len(version_query), 0, -1):
-        for version in versions:
-            normalized_version_name = normalize_query_str(version['name'])
-            if (normalized_version_name.startswith(version_query[:i])):
-                return version
+        if version_query[:i] in bible['version_by_name_prefix']:
+            return bible['version_by_name_prefix'][version_query[:i]]
 
     return None
 
@@ -108,28 +197,55 @@ def split_book_name_into_parts(book_name):
     return (' '.join(book_words[w:]) for w in range(len(book_words)))
 
 
+# Retrieves the sorted index of every word suffix of every book name in the
+# given bible (e.g. "song of songs", "of songs", and "songs"); each entry is a
+# tuple of the suffix, the priority of a match on that suffix, and the index of
+# the book; the index is built once per load of the bible data
+def get_book_name_index(bible):
+
+    if 'book_name_index' not in bible:
+        book_name_index = []
+        for b, book in enumerate(bible['books']):
+            book_name_words = split_book_name_into_parts(book['name'])
+            for w, book_word in enumerate(book_name_words):
+                # Give more priority to book names that are matched sooner
+                # (e.g. if the query matched the first word of a book name,
+                # as opposed to the second or third word)
+                book_name_index.append((book_word, ((w + 1) * 100) + b, b))
+        book_name_index.sort()
+        bible['book_name_index'] = book_name_index
+
+    return bible['book_name_index']
+
+
 # Retrieves list of books matching the given query
-def get_matching_books(books, query):
+def get_matching_books(bible, book_metadata, query):
+
+    book_name_index = get_book_name_index(bible)
+    book_priorities = {}
+
+    # Since the index is sorted, all suffixes starting with the queried book
+    # name are adjacent to each other
+    i = bisect_left(book_name_index, (query['book'],))
+    while (i < len(book_name_index) and
+           book_name_index[i][0].startswith(query['book'])):
+        book_word, priority, b = book_name_index[i]
+        # Each book is only matched by its highest-priority suffix
+        if priority < book_priorities.get(b, priority + 1):
+            book_priorities[b] = priority
+        i += 1
 
     matching_books = []
-    book_metadata = core.get_book_metadata()
-
-    for b, book in enumerate(books):
-        book_name_words = split_book_name_into_parts(book['name'])
-        for w, book_word in enumerate(book_name_words):
-            if book_word.startswith(query['book']):
-                matching_books.append({
-                    'id': book['id'],
-                    'name': book['name'],
-                    # Give more priority to book names that are matched sooner
-                    # (e.g. if the query matched the first word of a book name,
-                    # as opposed to the second or third word)
-                    'priority': ((w + 1) * 100) + b,
-                    # Store the metadata for the respective book (e.g. chapter
-                    # count) on this matching book object for convenience
-                    'metadata': book_metadata[book['id']]
-                })
-                break
+    for b, priority in book_priorities.items():
+        book = bible['books'][b]
+        matching_books.append({
+            'id': book['id'],
+            'name': book['name'],
+            'priority': priority,
+            # Store the metadata for the respective book (e.g. chapter count)
+            # on this matching book object for convenience
+            'metadata': book_metadata[book['id']]
+        })
 
     matching_books.sort(key=itemgetter('priority'))
     return matching_books
@@ -141,11 +257,10 @@ def choose_best_version(user_prefs, bible, query):
     chosen_version = None
 
     if 'version' in query:
-        chosen_version = guess_version(bible['versions'], query['version'])
+        chosen_version = guess_version(bible, query['version'])
 
     if not chosen_version and 'version' in user_prefs:
-        chosen_version = core.get_version(
-            bible['versions'], user_prefs['version'])
+        chosen_version = core.get_version(bible, user_prefs['version'])
 
     return chosen_version
 
@@ -204,8 +319,9 @@ def get_result(book, query, chosen_version, user_prefs):
     return result
 
 
-# Retrieves search resylts matching the given query
-def get_result_list(query_str):
+# Retrieves search results matching the given query, using the given
+# preferences and data which have already been loaded
+def get_result_list_from_data(query_str, user_prefs, bible, book_metadata):
 
     query_str = normalize_query_str(query_str)
     query = get_query_object(query_str)
@@ -213,9 +329,6 @@ def get_result_list(query_str):
     if not query:
         return []
 
-    user_prefs = core.get_user_prefs()
-    bible = core.get_bible(user_prefs['language'])
-
     if 'chapter' not in query:
         query['chapter'] = 1
 
@@ -223,7 +336,27 @@ def get_result_list(query_str):
 
     # Build and return result list from books matching the query
     return [get_result(book, query, chosen_version, user_prefs)
-            for book in get_matching_books(bible['books'], query)]
+            for book in get_matching_books(bible, book_metadata, query)]
+
+
+# Retrieves a list of search results for each of the given queries (in the
+# same order); preferences and Bible data are only loaded once for the entire
+# batch, so this is much faster than calling get_result_list for each query
+def get_result_lists(query_strs):
+
+    user_prefs = core.get_user_prefs()
+    bible = core.get_bible(user_prefs['language'])
+    book_metadata = core.get_book_metadata()
+
+    return [get_result_list_from_data(
+            query_str, user_prefs, bible, book_metadata)
+            for query_str in query_strs]
+
+
+# Retrieves search results matching the given query
+def get_result_list(query_str):
+
+    return get_result_lists([query_str])[0]
 
 
 def main(query_str):
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import re
+
+import yvs.core as core
+import yvs.cache as cache
+
+# The number of largest cache entries to list
+NUM_LARGEST_ENTRIES = 5
+
+
+# Retrieves the type of the cache entry with the given key, as a plural noun
+def get_entry_type(entry_key):
+
+    if entry_key.endswith('.json'):
+        return 'parsed chapters'
+    # Chapter keys contain a dot between the book and chapter (e.g.
+    # 111/psa.23.html), whereas normalized search queries never contain dots
+    elif re.search(r'^\d+/\w+\.\d+\.html$', entry_key, flags=re.UNICODE):
+        return 'chapters'
+    else:
+        return 'search results'
+
+
+# Formats the given number of bytes as a human-readable size
+def get_size_str(num_bytes):
+
+    if num_bytes < 1024:
+        return '{:d} B'.format(num_bytes)
+    elif num_bytes < 1024 * 1024:
+        return '{:.1f} KB'.format(num_bytes / 1024.0)
+    else:
+        return '{:.1f} MB'.format(num_bytes / 1024.0 / 1024.0)
+
+
+# Retrieves the result describing how often content is served from the cache
+def get_hit_ratio_result(stats):
+
+    num_lookups = stats['num_hits'] + stats['num_misses']
+    if num_lookups:
+        hit_ratio = '{:.0%}'.format(float(stats['num_hits']) / num_lookups)
+    else:
+        hit_ratio = 'n/a'
+    return {
+        'title': 'Hit ratio: {}'.format(hit_ratio),
+        'subtitle': '{:,d} hits, {:,d} misses ({} served from cache)'.format(
+            stats['num_hits'], stats['num_misses'],
+            get_size_str(stats['num_bytes_served'])),
+        'valid': False
+    }
+
+
+# Retrieves the result describing how much space the cache occupies
+def get_size_result(stats):
+
+    return {
+        'title': 'Size: {} of {}'.format(
+            get_size_str(stats['total_size']),
+            get_size_str(stats['max_size'])),
+        'subtitle': '{:,d} entries ({} written, {:,d} evicted)'.format(
+            stats['num_entries'], get_size_str(stats['num_bytes_written']),
+            stats['num_evictions']),
+        'valid': False
+    }
+
+
+# Retrieves one result for every type of entry in the cache
+def get_entry_type_results(stats):
+
+    entries_by_type = {}
+    for entry in stats['entries']:
+        entries_by_type.setdefault(
+            get_entry_type(entry['key']), []).append(entry)
+
+    return [{
+        'title': '{}: {:,d} entries'.format(
+            entry_type.capitalize(), len(entries)),
+        'subtitle': get_size_str(sum(entry['size'] for entry in entries)),
+        'valid': False
+    } for entry_type, entries in sorted(entries_by_type.items())]
+
+
+# Retrieves one result for each of the largest entries in the cache
+def get_largest_entry_results(stats):
+
+    largest_entries = sorted(
+        stats['entries'], key=lambda entry: entry['size'],
+        reverse=True)[:NUM_LARGEST_ENTRIES]
+    return [{
+        'title': entry['key'],
+        'subtitle': 'One of the largest entries ({})'.format(
+            get_size_str(entry['size'])),
+        'valid': False
+    } for entry in largest_entries]
+
+
+# Retrieves result list describing the effectiveness and contents of the cache
+def get_result_list():
+
+    stats = cache.get_cache_stats()
+    return ([get_hit_ratio_result(stats), get_size_result(stats)] +
+            get_entry_type_results(stats) +
+            get_largest_entry_results(stats))
+
+
+def main():
+
+    print(core.get_result_list_feedback_str(get_result_list()))
+
+
+if __name__ == '__main__':
+    main()
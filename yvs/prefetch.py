@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import fcntl
+import json
+import os
+import os.path
+import sys
+import time
+
+import yvs.core as core
+import yvs.cache as cache
+import yvs.version_pack as version_pack
+
+# The maximum number of prefetch processes which may run at once; any
+# prefetch started while this many are running is skipped
+MAX_PREFETCH_PROCESSES = 2
+# The maximum number of bytes which prefetch processes may download per day
+PREFETCH_DAILY_BYTE_BUDGET = 2 * 1024 * 1024
+# The number of times a chapter must have been copied after another (that is
+# not adjacent to it) before it is prefetched alongside the adjacent chapters
+MIN_TRANSITION_COUNT = 2
+# The maximum number of chapters remembered as having been copied after each
+# chapter; only the most frequent are kept
+MAX_TRANSITIONS_PER_CHAPTER = 5
+
+
+# Retrieves the path to the file recording which chapters are copied after
+# which (the transition model)
+def get_chapter_transitions_path():
+
+    return os.path.join(core.LOCAL_DATA_DIR_PATH, 'chapter-transitions.json')
+
+
+# Retrieves the path to the file recording how many bytes have been prefetched
+# today
+def get_prefetch_budget_path():
+
+    return os.path.join(core.LOCAL_DATA_DIR_PATH, 'prefetch-budget.json')
+
+
+# Retrieves the path to the lock file for the given prefetch process slot
+def get_prefetch_slot_path(slot_num):
+
+    return os.path.join(
+        core.LOCAL_DATA_DIR_PATH, 'prefetch-{}.lock'.format(slot_num))
+
+
+# Retrieves the transition model, which maps the ID of each chapter (e.g.
+# jhn.3, regardless of version) to the number of times every other chapter was
+# copied right after it; the ID of the last copied chapter is also included
+def get_chapter_transitions():
+
+    try:
+        with open(get_chapter_transitions_path(), 'r') as transitions_file:
+            return json.load(transitions_file)
+    except (IOError, ValueError):
+        return {'last': None, 'next': {}}
+
+
+# Records that the chapter with the given ID was copied right after the last
+# copied chapter
+def record_chapter_transition(chapter_id):
+
+    transitions = get_chapter_transitions()
+    last_chapter_id = transitions['last']
+    if last_chapter_id and last_chapter_id != chapter_id:
+        next_counts = transitions['next'].setdefault(last_chapter_id, {})
+        next_counts[chapter_id] = next_counts.get(chapter_id, 0) + 1
+        if len(next_counts) > MAX_TRANSITIONS_PER_CHAPTER:
+            del next_counts[min(next_counts, key=next_counts.get)]
+    transitions['last'] = chapter_id
+
+    # Write the model to a temporary file first so that a half-written model
+    # is never read by another process
+    core.create_local_data_dir()
+    transitions_path = get_chapter_transitions_path()
+    temp_transitions_path = '{}.{}.tmp'.format(transitions_path, os.getpid())
+    with open(temp_transitions_path, 'w') as transitions_file:
+        json.dump(transitions, transitions_file, separators=(',', ':'))
+    os.rename(temp_transitions_path, transitions_path)
+    return transitions
+
+
+# Retrieves the IDs of the chapters immediately before and after the given
+# chapter (in Bible order, so the last chapter of one book is adjacent to the
+# first chapter of the next)
+def get_adjacent_chapter_ids(book_id, chapter, bible, book_metadata):
+
+    book_ids = [book['id'] for book in bible['books']]
+    book_index = book_ids.index(book_id)
+    chapter_ids = []
+    if chapter > 1:
+        chapter_ids.append('{}.{}'.format(book_id, chapter - 1))
+    elif book_index > 0:
+        prev_book_id = book_ids[book_index - 1]
+        chapter_ids.append('{}.{}'.format(
+            prev_book_id, book_metadata[prev_book_id]['chapters']))
+    if chapter < book_metadata[book_id]['chapters']:
+        chapter_ids.append('{}.{}'.format(book_id, chapter + 1))
+    elif book_index < len(book_ids) - 1:
+        chapter_ids.append('{}.1'.format(book_ids[book_index + 1]))
+    return chapter_ids
+
+
+# Retrieves the ID of the chapter most often copied after the given chapter,
+# or None if no chapter has been copied after it often enough
+def get_likely_next_chapter_id(transitions, chapter_id):
+
+    next_counts = transitions['next'].get(chapter_id, {})
+    if not next_counts:
+        return None
+    next_chapter_id = max(next_counts, key=next_counts.get)
+    if next_counts[next_chapter_id] >= MIN_TRANSITION_COUNT:
+        return next_chapter_id
+    else:
+        return None
+
+
+# Retrieves the number of bytes which have been prefetched today
+def get_num_prefetched_bytes():
+
+    try:
+        with open(get_prefetch_budget_path(), 'r') as budget_file:
+            budget = json.load(budget_file)
+    except (IOError, ValueError):
+        return 0
+    if budget['date'] == time.strftime('%Y-%m-%d'):
+        return budget['num_bytes']
+    else:
+        return 0
+
+
+# Adds the given number of bytes to the number of bytes prefetched today; the
+# budget file is locked while it is updated, since several prefetch processes
+# may finish downloading at once
+def add_num_prefetched_bytes(num_bytes):
+
+    core.create_local_data_dir()
+    with open(get_prefetch_budget_path(), 'a+') as budget_file:
+        fcntl.flock(budget_file, fcntl.LOCK_EX)
+        num_bytes += get_num_prefetched_bytes()
+        budget_file.seek(0)
+        budget_file.truncate()
+        json.dump({
+            'date': time.strftime('%Y-%m-%d'),
+            'num_bytes': num_bytes
+        }, budget_file)
+
+
+# Returns True if no more bytes may be prefetched today
+def is_prefetch_budget_exhausted():
+
+    return get_num_prefetched_bytes() >= PREFETCH_DAILY_BYTE_BUDGET
+
+
+# Returns True if the chapter with the given ID (e.g. jhn.3) of the given
+# version never needs to be fetched, since it is in the version's imported pack
+# or is already cached
+def is_chapter_available(version_id, chapter_id):
+
+    book_id, chapter = chapter_id.split('.')
+    if version_pack.get_chapter_parts(
+            version_id, book_id, int(chapter)) is not None:
+        return True
+    chapter_uid = '{}/{}'.format(version_id, chapter_id)
+    return cache.has_cache_entry(
+        '{}.json'.format(chapter_uid), '{}.html'.format(chapter_uid))
+
+
+# Retrieves the UIDs of the chapters which should be prefetched after the given
+# reference is copied, excluding any chapters which are already available
+# (see is_chapter_available)
+def get_prefetch_chapter_uids(ref, user_prefs, transitions):
+
+    chapter_ids = get_adjacent_chapter_ids(
+        ref['book_id'], ref['chapter'],
+        core.get_bible(user_prefs['language']), core.get_book_metadata())
+    likely_next_chapter_id = get_likely_next_chapter_id(
+        transitions, '{}.{}'.format(ref['book_id'], ref['chapter']))
+    if likely_next_chapter_id and likely_next_chapter_id not in chapter_ids:
+        chapter_ids.append(likely_next_chapter_id)
+
+    return ['{}/{}'.format(ref['version_id'], chapter_id)
+            for chapter_id in chapter_ids
+            if not is_chapter_available(ref['version_id'], chapter_id)]
+
+
+# Starts a detached background process which records the copying of the
+# reference with the given UID and prefetches the chapters likely to be copied
+# next; all of that work (including deciding whether anything needs to be
+# prefetched) happens within the process, so the current copy never waits for
+# any of it
+def start_prefetch(ref_uid):
+
+    core.start_background_process('yvs.prefetch', [ref_uid])
+
+
+# Claims one of the prefetch process slots, returning the slot's locked file
+# (which releases the slot when closed), or None if every slot is taken
+def acquire_prefetch_slot():
+
+    core.create_local_data_dir()
+    for slot_num in range(MAX_PREFETCH_PROCESSES):
+        slot_file = open(get_prefetch_slot_path(slot_num), 'a')
+        try:
+            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return slot_file
+        except IOError:
+            slot_file.close()
+    return None
+
+
+# Fetches, caches, and parses the chapter with the given UID, so that copying
+# any reference within it never waits on the network
+def prefetch_chapter(chapter_uid):
+
+    # These modules are only needed by the prefetch process itself
+    import yvs.copy_ref as copy_ref
+    import yvs.web as web
+    entry_key = '{}.html'.format(chapter_uid)
+    if not cache.has_cache_entry(entry_key):
+        url_body, content_encoding = web.get_url_body(
+            core.get_ref_url(chapter_uid))
+        add_num_prefetched_bytes(len(url_body))
+        web.add_url_body_cache_entry(entry_key, url_body, content_encoding)
+    copy_ref.get_chapter_parts(
+        core.get_ref(chapter_uid, core.get_user_prefs()))
+
+
+# Prefetches the chapters with the given UIDs, stopping once today's budget
+# has been used up (the chapter which exceeds the budget is still cached, so
+# the budget may be exceeded by at most one chapter per process)
+def prefetch_chapters(chapter_uids):
+
+    slot_file = acquire_prefetch_slot()
+    if not slot_file:
+        return
+    try:
+        for chapter_uid in chapter_uids:
+            if is_prefetch_budget_exhausted():
+                break
+            prefetch_chapter(chapter_uid)
+    finally:
+        slot_file.close()
+
+
+# Records the copying of the reference with the given UID and prefetches the
+# chapters which are likely to be copied next; nothing is prefetched if those
+# chapters are already available or today's budget has been used up; run
+# within a detached background process
+def main(ref_uid):
+
+    user_prefs = core.get_user_prefs()
+    ref = core.get_ref(ref_uid, user_prefs)
+    transitions = record_chapter_transition(
+        '{}.{}'.format(ref['book_id'], ref['chapter']))
+    if is_prefetch_budget_exhausted():
+        return
+    chapter_uids = get_prefetch_chapter_uids(ref, user_prefs, transitions)
+    if chapter_uids:
+        prefetch_chapters(chapter_uids)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1].decode('utf-8'))
@@ -4,15 +4,20 @@
 from __future__ import print_function, unicode_literals
 
 import sys
-import urllib
 
 import yvs.core as core
 import yvs.cache as cache
-import yvs.web as web
 from yvs.yv_parser import YVParser
 
 REF_URL_PREFIX = '/bible/'
 
+# The number of seconds after which cached search results expire; expired
+# search results are still shown, but are refreshed in the background
+SEARCH_HTML_TTL = 24 * 60 * 60
+# The number of seconds after which a background refresh of expired search
+# results is presumed to have failed (so that another refresh may be attempted)
+SEARCH_HTML_REFRESH_TIMEOUT = 60
+
 
 # Parses unique reference identifier from the given reference URL
 def get_uid_from_url(url):
@@ -96,19 +101,38 @@ def handle_data(self, data):
                 self.current_result['subtitle'] += data
 
 
+# Retrieves the URL of the search results page for the given query
+def get_search_url(query_str, user_prefs):
+
+    import urllib
+    return 'https://www.bible.com/search/bible?q={}&version_id={}'.format(
+        urllib.quote_plus(query_str.encode('utf-8')),
+        user_prefs['version'])
+
+
 # Retrieves HTML for reference with the given ID
 def get_search_html(query_str, user_prefs):
 
-    url = 'https://www.bible.com/search/bible?q={}&version_id={}'.format(
-        urllib.quote_plus(query_str.encode('utf-8')), user_prefs['version'])
-
     entry_key = '{}/{}.html'.format(user_prefs['version'], query_str)
-    search_html = cache.get_cache_entry_content(entry_key)
-    if not search_html:
-        search_html = web.get_url_content(url)
-        cache.add_cache_entry(entry_key, search_html)
-
-    return search_html
+    search_entry = cache.get_cache_entry(entry_key)
+    if not search_entry:
+        # The networking modules are only imported when content actually
+        # needs to be fetched
+        import yvs.web as web
+        return web.get_cached_url_content(
+            get_search_url(query_str, user_prefs), entry_key,
+            ttl=SEARCH_HTML_TTL)
+
+    # Expired search results are shown immediately and refreshed in the
+    # background (by only one process, if several find them expired)
+    if search_entry['is_expired'] and cache.claim_expired_cache_entry(
+            entry_key, SEARCH_HTML_REFRESH_TIMEOUT):
+        import yvs.web as web
+        web.refresh_cached_url_content(
+            get_search_url(query_str, user_prefs), entry_key,
+            ttl=SEARCH_HTML_TTL)
+
+    return search_entry['content']
 
 
 # Parses actual reference content from reference HTML
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import os
+import os.path
+import socket
+import SocketServer
+import sys
+from io import BytesIO
+
+import yvs.client as client
+
+# The number of seconds the server may sit idle before shutting itself down
+SERVER_IDLE_TIMEOUT = 30 * 60
+
+
+# Handles a single script filter invocation forwarded by the client
+class EntryPointHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        request = self.rfile.read().decode('utf-8').split('\0')
+        module_name, args = request[0], request[1:]
+        if module_name in client.ENTRY_POINT_MODULES:
+            self.wfile.write(get_entry_point_output(module_name, args))
+
+
+# A long-lived Unix domain socket server which runs script filters on behalf of
+# yvs.client; the server shuts itself down after being idle for too long
+class ResidentServer(SocketServer.UnixStreamServer):
+
+    timeout = SERVER_IDLE_TIMEOUT
+
+    def __init__(self, server_address):
+        SocketServer.UnixStreamServer.__init__(
+            self, server_address, EntryPointHandler)
+        self.is_idle = False
+
+    # Called by handle_request() when no request arrives before the timeout
+    def handle_timeout(self):
+        self.is_idle = True
+
+
+# Runs the given script filter, capturing and returning whatever it outputs
+def get_entry_point_output(module_name, args):
+
+    original_stdout = sys.stdout
+    out = BytesIO()
+    try:
+        sys.stdout = out
+        client.run_entry_point(module_name, args)
+    finally:
+        sys.stdout = original_stdout
+    return out.getvalue()
+
+
+# Returns True if another server is already listening on the server socket
+def is_server_running():
+
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client_socket.connect(client.SERVER_SOCKET_PATH)
+        return True
+    except socket.error:
+        return False
+    finally:
+        client_socket.close()
+
+
+# Creates the resident server, bound to the server socket
+def create_server():
+
+    try:
+        os.mkdir(client.SERVER_DIR_PATH, 0o700)
+    except OSError:
+        pass
+    if not client.is_server_dir_trusted():
+        raise OSError('Server directory is owned by another user: {}'.format(
+            client.SERVER_DIR_PATH))
+
+    # Remove the socket left behind by any server which did not exit cleanly
+    try:
+        os.remove(client.SERVER_SOCKET_PATH)
+    except OSError:
+        pass
+
+    return ResidentServer(client.SERVER_SOCKET_PATH)
+
+
+def main():
+
+    if is_server_running():
+        return
+
+    server = create_server()
+    try:
+        while not server.is_idle:
+            server.handle_request()
+    finally:
+        server.server_close()
+        os.remove(client.SERVER_SOCKET_PATH)
+
+
+if __name__ == '__main__':
+    main()
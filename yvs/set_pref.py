@@ -7,7 +7,6 @@
 import os
 
 import yvs.core as core
-import yvs.cache as cache
 
 
 # Set the YouVersion Suggest preference with the given key
@@ -16,11 +15,12 @@ def set_pref(pref_id, value_id):
     user_prefs = core.get_user_prefs()
     user_prefs[pref_id] = value_id
 
-    # If new language is set, ensure that preferred version is updated also
+    # If new language is set, ensure that preferred version is updated also;
+    # the cache is left intact, since every cache entry is keyed by the ID of
+    # the version it belongs to (and is therefore valid in any language)
     if pref_id == 'language':
         bible = core.get_bible(language_id=value_id)
         user_prefs['version'] = bible['default_version']
-        cache.clear_cache()
 
     core.set_user_prefs(user_prefs)
 
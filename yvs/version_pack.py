@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from __future__ import print_function, unicode_literals
+
+import json
+import mmap
+import os
+import os.path
+import re
+import struct
+import sys
+
+import yvs.core as core
+import yvs.cache as cache
+
+# The bytes with which every version pack begins
+VERSION_PACK_MAGIC = b'YVSPACK\0'
+# The version of the version pack format; packs written with any other format
+# version are ignored
+VERSION_PACK_FORMAT_VERSION = 1
+# The header of a version pack: the magic bytes, the format version, the ID of
+# the Bible version contained in the pack, and the number of chapters in the
+# offset table which follows
+VERSION_PACK_HEADER = struct.Struct(b'<8sHII')
+# Each entry of the offset table: the offset (from the start of the pack) and
+# length of a chapter's parts; chapters missing from the pack have a length of
+# zero
+VERSION_PACK_TABLE_ENTRY = struct.Struct(b'<II')
+
+# Pattern matching the file name of a saved chapter page (e.g. psa.23.html)
+SAVED_CHAPTER_PATT = re.compile(r'^(\d?[a-z]+)\.(\d+)\.html?$')
+
+
+# Retrieves the path to the directory where imported version packs are kept
+def get_version_packs_dir_path():
+
+    return os.path.join(core.LOCAL_DATA_DIR_PATH, 'packs')
+
+
+# Retrieves the path to the imported version pack for the given version
+def get_version_pack_path(version_id):
+
+    return os.path.join(
+        get_version_packs_dir_path(), '{}.yvspack'.format(version_id))
+
+
+# Retrieves the position of every chapter of the Bible within the offset table
+# of a version pack, keyed by book ID; chapters are ordered by book ID and then
+# by chapter number, as determined by the book metadata
+def get_chapter_table_indices(book_metadata):
+
+    chapter_table_indices = {}
+    num_chapters = 0
+    for book_id in sorted(book_metadata):
+        chapter_table_indices[book_id] = num_chapters
+        num_chapters += book_metadata[book_id]['chapters']
+    return chapter_table_indices, num_chapters
+
+
+# Retrieves the position of the given chapter within the offset table of a
+# version pack, or None if the chapter does not exist
+def get_chapter_table_index(book_id, chapter):
+
+    book_metadata = core.get_book_metadata()
+    if book_id not in book_metadata:
+        return None
+    if not 1 <= chapter <= book_metadata[book_id]['chapters']:
+        return None
+    chapter_table_indices = get_chapter_table_indices(book_metadata)[0]
+    return chapter_table_indices[book_id] + chapter - 1
+
+
+# Reads the header of the given version pack (which may be a string or a
+# memory map), returning the ID of its version and the number of chapters in
+# its offset table; raises a ValueError if the pack is not a valid pack
+def read_version_pack_header(pack):
+
+    if len(pack) < VERSION_PACK_HEADER.size:
+        raise ValueError('Version pack is truncated')
+    magic, format_version, version_id, num_chapters = (
+        VERSION_PACK_HEADER.unpack_from(pack))
+    if magic != VERSION_PACK_MAGIC:
+        raise ValueError('File is not a version pack')
+    if format_version != VERSION_PACK_FORMAT_VERSION:
+        raise ValueError('Unsupported version pack format: {}'.format(
+            format_version))
+    if (len(pack) < VERSION_PACK_HEADER.size +
+            num_chapters * VERSION_PACK_TABLE_ENTRY.size):
+        raise ValueError('Version pack is truncated')
+    return version_id, num_chapters
+
+
+# Reads the parts of the given chapter from the given version pack, returning
+# None if the chapter is not in the pack
+def read_version_pack_chapter_parts(pack, chapter_table_index):
+
+    version_id, num_chapters = read_version_pack_header(pack)
+    if chapter_table_index >= num_chapters:
+        return None
+    chapter_offset, chapter_length = VERSION_PACK_TABLE_ENTRY.unpack_from(
+        pack, VERSION_PACK_HEADER.size +
+        chapter_table_index * VERSION_PACK_TABLE_ENTRY.size)
+    if not chapter_length:
+        return None
+    return json.loads(
+        pack[chapter_offset:chapter_offset + chapter_length].decode('utf-8'))
+
+
+# Retrieves the parts of the given chapter (as produced by ChapterParser) from
+# the imported pack for the given version; the pack is memory-mapped so that
+# only the pages holding the offset table entry and the chapter itself are
+# ever read from disk; returns None if there is no pack for the version or
+# the chapter is not in it
+def get_chapter_parts(version_id, book_id, chapter):
+
+    chapter_table_index = get_chapter_table_index(book_id, chapter)
+    if chapter_table_index is None:
+        return None
+    try:
+        pack_file = open(get_version_pack_path(version_id), 'rb')
+    except IOError:
+        return None
+    try:
+        pack = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (mmap.error, ValueError):
+        # Empty files cannot be mapped
+        pack_file.close()
+        return None
+    try:
+        return read_version_pack_chapter_parts(pack, chapter_table_index)
+    except ValueError:
+        return None
+    finally:
+        pack.close()
+        pack_file.close()
+
+
+# Builds a version pack for the given version from the given parts of each
+# chapter, keyed by (book ID, chapter) tuple
+def build_version_pack(version_id, chapter_parts_by_chapter):
+
+    chapter_table_indices, num_chapters = get_chapter_table_indices(
+        core.get_book_metadata())
+    table_entries = [(0, 0)] * num_chapters
+    chapter_offset = (VERSION_PACK_HEADER.size +
+                      num_chapters * VERSION_PACK_TABLE_ENTRY.size)
+    chapter_bodies = []
+    for (book_id, chapter), chapter_parts in sorted(
+            chapter_parts_by_chapter.items()):
+        chapter_body = json.dumps(
+            chapter_parts, ensure_ascii=False,
+            separators=(',', ':')).encode('utf-8')
+        table_entries[chapter_table_indices[book_id] + chapter - 1] = (
+            chapter_offset, len(chapter_body))
+        chapter_bodies.append(chapter_body)
+        chapter_offset += len(chapter_body)
+
+    return b''.join(
+        [VERSION_PACK_HEADER.pack(
+            VERSION_PACK_MAGIC, VERSION_PACK_FORMAT_VERSION,
+            version_id, num_chapters)] +
+        [VERSION_PACK_TABLE_ENTRY.pack(*table_entry)
+         for table_entry in table_entries] +
+        chapter_bodies)
+
+
+# Retrieves the parts of the given chapter from the cache (preferring the
+# chapter's parsed parts to its page), or None if the chapter is not cached;
+# reading the cache this way never fetches anything, nor counts as using it
+def read_cached_chapter_parts(chapter_uid, cached_entry_keys):
+
+    # copy_ref imports this module, so it can only be imported once needed
+    import yvs.copy_ref as copy_ref
+    chapter_json_key = '{}.json'.format(chapter_uid)
+    if chapter_json_key in cached_entry_keys:
+        chapter_json = cache.peek_cache_entry_content(chapter_json_key)
+        if chapter_json:
+            return json.loads(chapter_json)
+    chapter_html_key = '{}.html'.format(chapter_uid)
+    if chapter_html_key in cached_entry_keys:
+        chapter_html = cache.peek_cache_entry_content(chapter_html_key)
+        if chapter_html:
+            parser = copy_ref.ChapterParser()
+            parser.feed(chapter_html)
+            return parser.chapter_parts
+    return None
+
+
+# Retrieves the parts of every chapter of the given version which has been
+# cached (or is in the version's imported pack), keyed by (book ID, chapter);
+# chapters whose cache entries have meanwhile been evicted are skipped
+def get_cached_chapter_parts(version_id):
+
+    import yvs.copy_ref as copy_ref
+    cached_entry_keys = {entry['key'] for entry in
+                         cache.get_cache_stats()['entries']}
+    chapter_parts_by_chapter = {}
+    book_metadata = core.get_book_metadata()
+    for book_id in book_metadata:
+        for chapter in range(1, book_metadata[book_id]['chapters'] + 1):
+            chapter_parts = get_chapter_parts(version_id, book_id, chapter)
+            if chapter_parts is None:
+                chapter_parts = read_cached_chapter_parts(
+                    copy_ref.get_ref_chapter_uid({
+                        'version_id': version_id, 'book_id': book_id,
+                        'chapter': chapter}),
+                    cached_entry_keys)
+            if chapter_parts is not None:
+                chapter_parts_by_chapter[book_id, chapter] = chapter_parts
+    return chapter_parts_by_chapter
+
+
+# Retrieves the parts of every chapter page saved within the given directory
+# (where each page is named after its chapter, e.g. psa.23.html), keyed by
+# (book ID, chapter)
+def get_saved_chapter_parts(html_dir_path):
+
+    import glob
+    import yvs.copy_ref as copy_ref
+    chapter_parts_by_chapter = {}
+    book_metadata = core.get_book_metadata()
+    for html_path in glob.glob(os.path.join(html_dir_path, '*')):
+        chapter_match = SAVED_CHAPTER_PATT.search(
+            os.path.basename(html_path).lower())
+        if not chapter_match:
+            continue
+        book_id, chapter = chapter_match.group(1), int(chapter_match.group(2))
+        if chapter > book_metadata.get(book_id, {}).get('chapters', 0):
+            continue
+        with open(html_path, 'rb') as html_file:
+            parser = copy_ref.ChapterParser()
+            parser.feed(html_file.read().decode('utf-8'))
+        chapter_parts_by_chapter[book_id, chapter] = parser.chapter_parts
+    return chapter_parts_by_chapter
+
+
+# Writes the given pack to the given path; the pack is written to a temporary
+# file first so that a half-written pack is never read
+def write_version_pack(pack, pack_path):
+
+    temp_pack_path = '{}.{}.tmp'.format(pack_path, os.getpid())
+    with open(temp_pack_path, 'wb') as pack_file:
+        pack_file.write(pack)
+    os.rename(temp_pack_path, pack_path)
+
+
+# Exports a pack for the given version to the given path, built from the saved
+# chapter pages in the given directory or (if no directory is given) from the
+# cache; returns the number of chapters in the pack
+def export_version_pack(version_id, pack_path, html_dir_path=None):
+
+    if html_dir_path:
+        chapter_parts_by_chapter = get_saved_chapter_parts(html_dir_path)
+    else:
+        chapter_parts_by_chapter = get_cached_chapter_parts(version_id)
+    write_version_pack(
+        build_version_pack(version_id, chapter_parts_by_chapter), pack_path)
+    return len(chapter_parts_by_chapter)
+
+
+# Imports the version pack at the given path, replacing any pack previously
+# imported for the same version; returns the ID of the pack's version
+def import_version_pack(pack_path):
+
+    with open(pack_path, 'rb') as pack_file:
+        pack = pack_file.read()
+    version_id, num_chapters = read_version_pack_header(pack)
+    if num_chapters != get_chapter_table_indices(core.get_book_metadata())[1]:
+        raise ValueError('Version pack was built from different book metadata')
+
+    try:
+        os.makedirs(get_version_packs_dir_path())
+    except OSError:
+        pass
+    write_version_pack(pack, get_version_pack_path(version_id))
+    return version_id
+
+
+def parse_cli_args(args):
+
+    # copy_ref imports this module, so avoid importing argparse (which is slow
+    # to import) unless the command line interface is actually used
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Export or import packs of Bible content which can be'
+                    ' copied without a network connection')
+    subparsers = parser.add_subparsers(dest='command')
+    export_parser = subparsers.add_parser(
+        'export', help='build a pack for a version from cached chapters')
+    export_parser.add_argument(
+        'version_id', metavar='VERSION', type=int,
+        help='the numeric ID of the version (e.g. 111 for NIV)')
+    export_parser.add_argument(
+        'pack_path', metavar='PACK', help='the path of the pack to write')
+    export_parser.add_argument(
+        '--html-dir', metavar='DIR', dest='html_dir_path',
+        help='build the pack from the chapter pages saved in this directory'
+             ' (named like psa.23.html) instead of the cache')
+    import_parser = subparsers.add_parser(
+        'import', help='import a pack so its version can be copied offline')
+    import_parser.add_argument(
+        'pack_path', metavar='PACK', help='the path of the pack to import')
+    return parser.parse_args(args)
+
+
+def main(args):
+
+    cli_args = parse_cli_args(args)
+    if cli_args.command == 'export':
+        num_chapters = export_version_pack(
+            cli_args.version_id, cli_args.pack_path, cli_args.html_dir_path)
+        print('Exported {} chapters to {}'.format(
+            num_chapters, cli_args.pack_path).encode('utf-8'))
+    else:
+        version_id = import_version_pack(cli_args.pack_path)
+        print('Imported pack for version {}'.format(
+            version_id).encode('utf-8'))
+
+
+if __name__ == '__main__':
+    main([arg.decode('utf-8') for arg in sys.argv[1:]])
@@ -1,30 +1,359 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-import urllib2
-from gzip import GzipFile
-from StringIO import StringIO
+import base64
+import codecs
+import httplib
+import socket
+import sys
+import time
+import urlparse
+import zlib
+
+import yvs.cache as cache
+import yvs.core as core
 
 # The user agent used for HTTP requests sent to the YouVersion website
 USER_AGENT = 'YouVersion Suggest'
 # The number of seconds to wait before timing out an HTTP request connection
 REQUEST_CONNECTION_TIMEOUT = 5
+# The number of bytes of a response body read from the network at a time
+URL_CHUNK_SIZE = 16 * 1024
+# The maximum number of redirects followed when fetching a URL
+MAX_REDIRECTS = 5
+# The HTTP statuses which redirect to the URL given by the Location header
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
 
+# The maximum number of idle connections kept open to each host
+MAX_POOLED_CONNECTIONS_PER_HOST = 2
+# The number of seconds an idle connection is kept open for reuse; servers
+# close idle connections themselves after a while, so reusing a connection
+# which has been idle for longer is unlikely to succeed
+POOLED_CONNECTION_IDLE_TIMEOUT = 30
 
-# Retrieves HTML contents of the given URL as a Unicode string
-def get_url_content(url):
+# Idle connections kept open for reuse by this process, keyed by (scheme,
+# host) tuple; each value is a list of (connection, time released) tuples
+# ordered from least to most recently released
+pooled_connections = {}
+
+# The proxy URLs configured for this process, keyed by scheme (see
+# get_proxies), which are only looked up once a request is actually sent
+proxies = None
+
+
+# Retrieves the proxy URLs configured via the environment (e.g. http_proxy) or
+# the system's network settings, keyed by scheme
+def get_proxies():
+
+    global proxies
+    if proxies is None:
+        # urllib is only needed to look up the proxy configuration
+        import urllib
+        proxies = urllib.getproxies()
+    return proxies
+
+
+# Retrieves the address (host and port) of the proxy through which requests to
+# the given host should be sent, alongside the headers to send to the proxy
+# (i.e. any credentials given in the proxy URL); the address is None if
+# requests should be sent to the host directly
+def get_proxy(scheme, host):
+
+    import urllib
+    proxy_url = get_proxies().get(scheme)
+    if not proxy_url or urllib.proxy_bypass(host):
+        return None, {}
+    if '://' not in proxy_url:
+        proxy_url = 'http://{}'.format(proxy_url)
+    proxy_url_parts = urlparse.urlsplit(proxy_url)
+    proxy_headers = {}
+    if proxy_url_parts.username:
+        proxy_headers['Proxy-Authorization'] = 'Basic {}'.format(
+            base64.b64encode('{}:{}'.format(
+                urllib.unquote(proxy_url_parts.username),
+                urllib.unquote(proxy_url_parts.password or ''))))
+    return proxy_url_parts.netloc.rpartition('@')[2], proxy_headers
+
+
+# Opens a new connection to the given host, via the configured proxy (if any);
+# HTTPS connections are tunneled through the proxy so that the proxy never
+# sees their contents
+def create_connection(scheme, host):
+
+    proxy_address, proxy_headers = get_proxy(scheme, host)
+    if scheme == 'https':
+        connection_class = httplib.HTTPSConnection
+    else:
+        connection_class = httplib.HTTPConnection
+    if not proxy_address:
+        return connection_class(host, timeout=REQUEST_CONNECTION_TIMEOUT)
+    connection = connection_class(
+        proxy_address, timeout=REQUEST_CONNECTION_TIMEOUT)
+    if scheme == 'https':
+        connection.set_tunnel(host, headers=proxy_headers)
+    return connection
+
+
+# Retrieves a connection to the given host, reusing the most recently released
+# idle connection if possible; also returns True if the connection was reused
+def get_pooled_connection(scheme, host):
+
+    idle_connections = pooled_connections.setdefault((scheme, host), [])
+    # Close connections which have been idle for too long (which are always the
+    # least recently released)
+    while (idle_connections and time.time() - idle_connections[0][1] >=
+            POOLED_CONNECTION_IDLE_TIMEOUT):
+        idle_connections.pop(0)[0].close()
+    if idle_connections:
+        return idle_connections.pop()[0], True
+    return create_connection(scheme, host), False
+
+
+# Returns the given idle connection to the pool so that it can be reused,
+# closing the least recently released connection if the pool is full
+def release_pooled_connection(scheme, host, connection):
 
-    request = urllib2.Request(url, headers={
+    idle_connections = pooled_connections.setdefault((scheme, host), [])
+    idle_connections.append((connection, time.time()))
+    if len(idle_connections) > MAX_POOLED_CONNECTIONS_PER_HOST:
+        idle_connections.pop(0)[0].close()
+
+
+# Closes every idle connection in the pool
+def close_pooled_connections():
+
+    for idle_connections in pooled_connections.values():
+        for connection, release_time in idle_connections:
+            connection.close()
+    pooled_connections.clear()
+
+
+# Sends a GET request for the given path to the given host over a pooled
+# connection, returning the connection alongside the response (whose body has
+# yet to be read)
+def get_url_response(scheme, host, path):
+
+    headers = {
         'User-Agent': USER_AGENT,
         'Accept-Encoding': 'gzip, deflate'
-    })
-    response = urllib2.urlopen(request, timeout=REQUEST_CONNECTION_TIMEOUT)
-    url_content = response.read()
+    }
+    request_path = path
+    if scheme == 'http':
+        proxy_address, proxy_headers = get_proxy(scheme, host)
+        if proxy_address:
+            # Requests sent via a proxy (rather than through a tunnel) must
+            # name the entire URL
+            request_path = '{}://{}{}'.format(scheme, host, path)
+            headers.update(proxy_headers)
+    connection, is_reused = get_pooled_connection(scheme, host)
+    try:
+        connection.request('GET', request_path, headers=headers)
+        return connection, connection.getresponse()
+    except (httplib.HTTPException, socket.error):
+        connection.close()
+        # The server may have closed a reused connection while it was idle,
+        # in which case the request is retried on another connection
+        if is_reused:
+            return get_url_response(scheme, host, path)
+        raise
+
+
+# Reads the body of the given response in chunks, yielding each chunk as it
+# arrives; the connection is returned to the pool once the body has been read
+# in full, or closed if the caller stops reading before then (since the rest
+# of the body would otherwise be read as the response to the next request)
+def get_response_chunks(scheme, host, connection, response):
+
+    is_body_read = False
+    try:
+        url_body_chunk = response.read(URL_CHUNK_SIZE)
+        while url_body_chunk:
+            yield url_body_chunk
+            url_body_chunk = response.read(URL_CHUNK_SIZE)
+        is_body_read = True
+    finally:
+        if is_body_read and not response.will_close:
+            release_pooled_connection(scheme, host, connection)
+        else:
+            connection.close()
+
+
+# Retrieves the content encoding of the given response's body ('gzip',
+# 'deflate', or 'identity' for any other encoding)
+def get_response_content_encoding(response):
+
+    content_encoding = response.getheader('Content-Encoding', '').lower()
+    if content_encoding in ('gzip', 'x-gzip'):
+        return 'gzip'
+    elif content_encoding == 'deflate':
+        return 'deflate'
+    else:
+        return 'identity'
+
+
+# Requests the given URL (following any redirects), returning the content
+# encoding of its body alongside an iterator over the raw (still compressed)
+# chunks of the body, which are read from the network as they are consumed;
+# connections are kept alive and reused by later requests to the same host
+def get_url_body_chunks(url):
+
+    url = url.encode('utf-8')
+    for redirect_num in xrange(MAX_REDIRECTS + 1):
+        url_parts = urlparse.urlsplit(url)
+        path = url_parts.path or '/'
+        if url_parts.query:
+            path += '?' + url_parts.query
+        connection, response = get_url_response(
+            url_parts.scheme, url_parts.netloc, path)
+        url_body_chunks = get_response_chunks(
+            url_parts.scheme, url_parts.netloc, connection, response)
+        if response.status == httplib.OK:
+            return get_response_content_encoding(response), url_body_chunks
+        # The bodies of other responses are discarded (but must still be read
+        # so that the connection can be reused)
+        for url_body_chunk in url_body_chunks:
+            pass
+        if response.status in REDIRECT_STATUSES:
+            url = urlparse.urljoin(url, response.getheader('Location'))
+        else:
+            raise httplib.HTTPException('HTTP Error {}: {}'.format(
+                response.status, response.reason))
+    raise httplib.HTTPException('Too many redirects: {}'.format(url))
+
+
+# Retrieves the raw body of the given URL alongside its content encoding
+# ('gzip', 'deflate', or 'identity')
+def get_url_body(url):
+
+    content_encoding, url_body_chunks = get_url_body_chunks(url)
+    return b''.join(url_body_chunks), content_encoding
+
+
+# Creates the decompressor for a deflated body which begins with the given
+# chunk; the deflate content encoding calls for zlib-wrapped data, but some
+# servers send raw deflate data instead, which is detected by the absence of a
+# valid zlib header
+def get_deflate_decompressor(url_body_chunk):
+
+    if (len(url_body_chunk) >= 2 and
+            ord(url_body_chunk[0]) & 0x0f == 8 and
+            (ord(url_body_chunk[0]) * 256 + ord(url_body_chunk[1])) % 31 == 0):
+        return zlib.decompressobj(zlib.MAX_WBITS)
+    else:
+        return zlib.decompressobj(-zlib.MAX_WBITS)
+
+
+# Decompresses the given chunks of a raw URL body (with the given content
+# encoding) incrementally, yielding decompressed chunks as soon as they are
+# available; only one chunk of the compressed body is held at a time, and no
+# decompressed chunk is larger than a chunk read from the network (HTML
+# compresses so well that a single compressed chunk can otherwise inflate to
+# megabytes)
+def decompress_url_body_chunks(url_body_chunks, content_encoding):
+
+    decompressor = None
+    for url_body_chunk in url_body_chunks:
+        if content_encoding == 'identity':
+            yield url_body_chunk
+            continue
+        if not decompressor:
+            if content_encoding == 'gzip':
+                decompressor = zlib.decompressobj(cache.GZIP_WBITS)
+            else:
+                decompressor = get_deflate_decompressor(url_body_chunk)
+        while url_body_chunk:
+            decompressed_chunk = decompressor.decompress(
+                url_body_chunk, URL_CHUNK_SIZE)
+            if decompressed_chunk:
+                yield decompressed_chunk
+            url_body_chunk = decompressor.unconsumed_tail
+    if decompressor:
+        decompressed_chunk = decompressor.flush()
+        if decompressed_chunk:
+            yield decompressed_chunk
+
+
+# Decodes the given chunks of UTF-8 text incrementally, yielding Unicode
+# chunks; characters split across chunks are decoded once complete
+def decode_url_content_chunks(url_content_chunks):
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for url_content_chunk in url_content_chunks:
+        decoded_chunk = decoder.decode(url_content_chunk)
+        if decoded_chunk:
+            yield decoded_chunk
+    decoded_chunk = decoder.decode(b'', final=True)
+    if decoded_chunk:
+        yield decoded_chunk
+
+
+# Retrieves the HTML contents of the given URL as an iterator over Unicode
+# chunks, which are downloaded, decompressed, and decoded as they are consumed
+# (so that callers can start parsing before the download has finished)
+def get_url_content_chunks(url):
+
+    content_encoding, url_body_chunks = get_url_body_chunks(url)
+    return decode_url_content_chunks(
+        decompress_url_body_chunks(url_body_chunks, content_encoding))
+
+
+# Decodes the given raw URL body (as returned by get_url_body) to a Unicode
+# string, decompressing the body if necessary
+def decode_url_body(url_body, content_encoding):
+
+    return b''.join(decompress_url_body_chunks(
+        [url_body], content_encoding)).decode('utf-8')
+
+
+# Retrieves HTML contents of the given URL as a Unicode string; the body is
+# decompressed as it is downloaded, but decoded all at once (since joining
+# many small Unicode chunks would need far more memory than the final string)
+def get_url_content(url):
+
+    content_encoding, url_body_chunks = get_url_body_chunks(url)
+    return b''.join(decompress_url_body_chunks(
+        url_body_chunks, content_encoding)).decode('utf-8')
+
+
+# Adds the given raw URL body (as returned by get_url_body) to the cache under
+# the given key (expiring after the given TTL, if any), returning the decoded
+# body; gzipped bodies are cached as-is so that they never need to be
+# recompressed, whereas all other bodies are cached as text
+def add_url_body_cache_entry(entry_key, url_body, content_encoding, ttl=None):
+
+    url_content = decode_url_body(url_body, content_encoding)
+    if content_encoding == 'gzip':
+        cache.add_cache_entry(entry_key, url_body, content_encoding, ttl=ttl)
+    else:
+        cache.add_cache_entry(entry_key, url_content, ttl=ttl)
+    return url_content
+
+
+# Retrieves HTML contents of the given URL as a Unicode string, and adds the
+# contents to the cache under the given key (expiring after the given TTL, if
+# any)
+def get_cached_url_content(url, entry_key, ttl=None):
+
+    url_body, content_encoding = get_url_body(url)
+    return add_url_body_cache_entry(
+        entry_key, url_body, content_encoding, ttl=ttl)
+
+
+# Refreshes the cached contents of the given URL within a detached background
+# process, so that the caller never waits on the network
+def refresh_cached_url_content(url, entry_key, ttl=None):
+
+    args = [url, entry_key]
+    if ttl is not None:
+        args.append(str(ttl))
+    core.start_background_process('yvs.web', args)
+
+
+def main(url, entry_key, ttl=None):
+
+    get_cached_url_content(url, entry_key, ttl)
 
-    # Decompress response body if gzipped
-    if response.info().get('Content-Encoding') == 'gzip':
-        str_buf = StringIO(url_content)
-        with GzipFile(fileobj=str_buf, mode='rb') as gzip_file:
-            url_content = gzip_file.read()
 
-    return url_content.decode('utf-8')
+if __name__ == '__main__':
+    main(*[arg.decode('utf-8') for arg in sys.argv[1:3]] +
+         [float(arg) for arg in sys.argv[3:]])